@@ -1,31 +1,109 @@
-from flask import Flask, render_template, send_from_directory, request, redirect, session, jsonify, url_for
+from flask import Flask, render_template, send_from_directory, request, redirect, session, jsonify, url_for, Response, g
 import requests
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 import json
+import io
 import secrets
-from database import get_db_manager
+import logging
+from werkzeug.security import safe_join
+from database import (get_db_manager, get_async_db_manager, encode_message_cursor, decode_message_cursor,
+                      decode_user_cursor, MAX_MESSAGE_PAGE_SIZE, USER_PAGE_SIZE, MAX_USER_PAGE_SIZE,
+                      LEADERBOARD_SIZE, MATCH_PAGE_SIZE)
+from storage import EmailConflict
+from pubsub import user_channel, group_channel, PRESENCE_CHANNEL
+from concurrency import AsyncFlask
+from session_store import init_sessions
+from assets import init_assets
+from images import init_images
+from pages import PAGES, init_pages
+from metrics import METRICS_PATH, init_metrics
+from log_config import init_logging
+from linkedin import LinkedInClient
+from attendee_import import FORMATS as IMPORT_FORMATS, detect_format, import_attendees, read_rows
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__, static_folder="static", template_folder="templates")
+logger = logging.getLogger(__name__)
+
+app = AsyncFlask(__name__, static_folder="static", template_folder="templates")
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
+init_logging(app)
+init_metrics(app)
+init_sessions(app, static_paths=[*PAGES, METRICS_PATH])
+image_derivatives = init_images(app)
+init_assets(app, images=image_derivatives)
+pages = init_pages(app)
+
+# Load the leaderboard and matching index in the background now, and refresh them off the request path
+get_db_manager().start_refreshers()
 
 # LinkedIn OAuth configuration
 LINKEDIN_CLIENT_ID = os.environ.get('LINKEDIN_CLIENT_ID', '862mvp7e208g5z')
 LINKEDIN_CLIENT_SECRET = os.environ.get('LINKEDIN_CLIENT_SECRET', 'WPL_AP1.DLvWnuIO53i8K8Gk.r22wZQ==')
 LINKEDIN_REDIRECT_URI = os.environ.get('LINKEDIN_REDIRECT_URI', 'http://localhost:5000/auth/linkedin/callback')
 
-# Serve files from existing Next.js public/ folder for convenience (images, placeholders)
+# Shared pooled client for the OAuth flow; the URLs can point at a fake server for offline runs
+linkedin_client = LinkedInClient(
+    LINKEDIN_CLIENT_ID,
+    LINKEDIN_CLIENT_SECRET,
+    LINKEDIN_REDIRECT_URI,
+    oauth_url=os.environ.get('LINKEDIN_OAUTH_URL', 'https://www.linkedin.com/oauth/v2'),
+    api_url=os.environ.get('LINKEDIN_API_URL', 'https://api.linkedin.com'),
+    connect_timeout=float(os.environ.get('LINKEDIN_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.environ.get('LINKEDIN_READ_TIMEOUT', 10))
+)
+
+# Server-Sent Events: a stream is closed after SSE_MAX_STREAM_SECONDS and the
+# browser reconnects, so no connection holds a worker thread indefinitely
+SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))
+SSE_HEARTBEAT_SECONDS = 15
+
+def session_profile(db_user, login_method):
+    """Profile returned to the browser, built from a users row (never includes the password)"""
+    public_user = {key: value for key, value in db_user.items() if key != 'password'}
+    return {
+        'name': f"{db_user.get('first_name') or ''} {db_user.get('surname') or ''}".strip(),
+        'email': db_user.get('email'),
+        'linkedin_id': db_user.get('linkedin_id'),
+        'profile_picture_url': db_user.get('profile_picture_url'),
+        'points': db_user.get('points', 2690),
+        'rank': get_db_manager().get_user_rank(db_user['id']) or db_user.get('rank'),
+        'login_method': login_method,
+        'db_user': public_user
+    }
+
+def sign_in(db_user, login_method):
+    """Start a session under a new session id; only the user id and login method are stored"""
+    session.clear()
+    session['user_id'] = db_user['id']
+    session['login_method'] = login_method
+    # A session id handed out before login (e.g. planted by an attacker) never becomes signed in
+    app.session_interface.regenerate(session)
+
+def current_user():
+    """Profile of the signed-in user, loaded once per request from the cached users row"""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        db_user = get_db_manager().get_user_by_id(user_id) if user_id else None
+        g.current_user = session_profile(db_user, session.get('login_method')) if db_user else None
+    return g.current_user
+
+# Serve files from existing Next.js public/ folder for convenience (images, placeholders).
+# Raster images are resized/re-encoded on request (?w=..., Accept: image/avif|webp).
 @app.route('/public/<path:filename>')
 def public_files(filename):
-    return send_from_directory('public', filename)
+    source = safe_join('public', filename)
+    return (source and image_derivatives.send(source)) or send_from_directory('public', filename)
 
 # Maintain Next.js-style image path: /images/... maps to public/images
 @app.route('/images/<path:filename>')
 def public_images(filename):
-    return send_from_directory('public/images', filename)
+    source = safe_join('public/images', filename)
+    return (source and image_derivatives.send(source)) or send_from_directory('public/images', filename)
 
 # Fallback route for missing images
 @app.route('/public/placeholder-logo.png')
@@ -35,46 +113,44 @@ def placeholder_logo():
 
 @app.route('/')
 def home():
-    return render_template('login.html')
+    return pages.send('login.html')
 
 
 @app.route('/dashboard')
 def dashboard():
-    return render_template('dashboard.html')
+    return pages.send('dashboard.html')
 
 
 @app.route('/groups')
 def groups():
-    return render_template('groups.html')
+    return pages.send('groups.html')
 
 
 @app.route('/leaderboard')
 def leaderboard():
-    return render_template('leaderboard.html')
+    return pages.send('leaderboard.html')
 
 
 @app.route('/profile')
 def profile():
-    return render_template('profile.html')
+    return pages.send('profile.html')
 
 
 @app.route('/quiz')
 def quiz():
-    return render_template('quiz.html')
+    return pages.send('quiz.html')
 
 
 @app.route('/chat')
 def chat():
-    return render_template('chat.html')
+    return pages.send('chat.html')
 
 
 # LinkedIn OAuth routes
 @app.route('/auth/linkedin')
 def linkedin_login():
     """Initiate LinkedIn OAuth flow"""
-    print(f"DEBUG: LINKEDIN_CLIENT_ID = {LINKEDIN_CLIENT_ID}")
-    print(f"DEBUG: LINKEDIN_CLIENT_SECRET = {LINKEDIN_CLIENT_SECRET}")
-    print(f"DEBUG: LINKEDIN_REDIRECT_URI = {LINKEDIN_REDIRECT_URI}")
+    logger.debug("LinkedIn login: client_id=%s redirect_uri=%s", LINKEDIN_CLIENT_ID, LINKEDIN_REDIRECT_URI)
     
     if not LINKEDIN_CLIENT_ID:
         return jsonify({'error': 'LinkedIn OAuth not configured'}), 500
@@ -83,17 +159,7 @@ def linkedin_login():
     state = secrets.token_urlsafe(32)
     session['oauth_state'] = state
     
-    # LinkedIn OAuth URL
-    linkedin_auth_url = (
-        f"https://www.linkedin.com/oauth/v2/authorization?"
-        f"response_type=code&"
-        f"client_id={LINKEDIN_CLIENT_ID}&"
-        f"redirect_uri={LINKEDIN_REDIRECT_URI}&"
-        f"state={state}&"
-        f"scope=r_liteprofile%20r_emailaddress"
-    )
-    
-    return redirect(linkedin_auth_url)
+    return redirect(linkedin_client.authorization_url(state))
 
 
 @app.route('/auth/linkedin/callback')
@@ -115,37 +181,14 @@ def linkedin_callback():
     
     try:
         # Exchange code for access token
-        token_url = 'https://www.linkedin.com/oauth/v2/accessToken'
-        token_data = {
-            'grant_type': 'authorization_code',
-            'code': code,
-            'redirect_uri': LINKEDIN_REDIRECT_URI,
-            'client_id': LINKEDIN_CLIENT_ID,
-            'client_secret': LINKEDIN_CLIENT_SECRET
-        }
+        access_token = linkedin_client.exchange_code(code)
         
-        token_response = requests.post(token_url, data=token_data)
-        token_response.raise_for_status()
-        token_info = token_response.json()
-        access_token = token_info['access_token']
-        
-        # Get user profile information
-        profile_url = 'https://api.linkedin.com/v2/people/~:(id,firstName,lastName,profilePicture(displayImage~:playableStreams))'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        profile_response = requests.get(profile_url, headers=headers)
-        profile_response.raise_for_status()
-        profile_data = profile_response.json()
-        
-        # Get email address
-        email_url = 'https://api.linkedin.com/v2/emailAddress?q=members&projection=(elements*(handle~))'
-        email_response = requests.get(email_url, headers=headers)
-        email_response.raise_for_status()
-        email_data = email_response.json()
+        # Get profile and email address (fetched concurrently)
+        profile_data, email_data = linkedin_client.fetch_member(access_token)
         
         # Extract user information
         first_name = profile_data.get('firstName', {}).get('localized', {}).get('en_US', '')
         last_name = profile_data.get('lastName', {}).get('localized', {}).get('en_US', '')
-        full_name = f"{first_name} {last_name}".strip()
         
         email = ''
         if email_data.get('elements') and len(email_data['elements']) > 0:
@@ -158,53 +201,29 @@ def linkedin_callback():
             if elements and len(elements) > 0:
                 profile_picture_url = elements[0].get('identifiers', [{}])[0].get('identifier', '')
         
-        # Check if user exists in database
-        db_manager = get_db_manager()
-        existing_user = db_manager.get_user_by_linkedin_id(profile_data.get('id'))
+        if not profile_data.get('id'):
+            return jsonify({'error': 'LinkedIn profile has no id'}), 500
         
-        if existing_user:
-            # Update existing user
-            user_data = {
-                'name': full_name,
-                'email': email,
-                'linkedin_id': profile_data.get('id'),
-                'profile_picture_url': profile_picture_url,
-                'points': existing_user.get('points', 2690),
-                'rank': existing_user.get('rank', 4),
-                'login_method': 'linkedin',
-                'db_user': existing_user
-            }
-        else:
-            # Create new user in database
-            new_user_data = {
-                'email': email,
-                'firstName': first_name,
-                'surname': last_name,
-                'profile_picture_url': profile_picture_url,
-                'points': 2690,
-                'rank': 4,
-                'login_method': 'linkedin',
-                'linkedin_id': profile_data.get('id')
-            }
-            
-            db_user = db_manager.create_user(new_user_data)
-            
-            user_data = {
-                'name': full_name,
-                'email': email,
-                'linkedin_id': profile_data.get('id'),
-                'profile_picture_url': profile_picture_url,
-                'points': 2690,
-                'rank': 4,
-                'login_method': 'linkedin',
-                'db_user': db_user
-            }
-        
-        session['user'] = user_data
+        # Create the user on first login, refresh name and picture on later ones (one round trip)
+        db_user = get_db_manager().upsert_linkedin_user({
+            'email': email,
+            'firstName': first_name,
+            'surname': last_name,
+            'profile_picture_url': profile_picture_url,
+            'points': 2690,
+            'rank': 4,
+            'linkedin_id': profile_data.get('id')
+        })
+        if not db_user:
+            return jsonify({'error': 'Failed to create user'}), 500
+        
+        sign_in(db_user, 'linkedin')
         
         # Redirect to dashboard
         return redirect('/dashboard')
         
+    except EmailConflict as e:
+        return jsonify({'error': str(e)}), 409
     except requests.exceptions.RequestException as e:
         return jsonify({'error': f'LinkedIn API error: {str(e)}'}), 500
     except Exception as e:
@@ -214,8 +233,7 @@ def linkedin_callback():
 @app.route('/auth/logout')
 def logout():
     """Logout user"""
-    session.pop('user', None)
-    session.pop('oauth_state', None)
+    session.clear()
     return redirect('/')
 
 
@@ -234,20 +252,12 @@ def login():
         user = db_manager.authenticate_user(data['email'], data['password'])
         
         if user:
-            # Store in session
-            session['user'] = {
-                'name': f"{user.get('first_name', '')} {user.get('surname', '')}".strip(),
-                'email': user.get('email'),
-                'points': user.get('points', 2690),
-                'rank': user.get('rank', 4),
-                'login_method': 'email',
-                'db_user': user
-            }
+            sign_in(user, 'email')
             
             return jsonify({
                 'success': True,
                 'message': 'Login successful',
-                'user': session['user']
+                'user': session_profile(user, 'email')
             })
         else:
             return jsonify({'error': 'Invalid email or password'}), 401
@@ -290,20 +300,12 @@ def signup():
         db_user = db_manager.create_user(user_data)
         
         if db_user:
-            # Store in session
-            session['user'] = {
-                'name': f"{data['firstName']} {data['surname']}",
-                'email': data['email'],
-                'points': 2690,
-                'rank': 4,
-                'login_method': 'email',
-                'db_user': db_user
-            }
+            sign_in(db_user, 'email')
             
             return jsonify({
                 'success': True,
                 'message': 'User created successfully',
-                'user': session['user']
+                'user': session_profile(db_user, 'email')
             })
         else:
             return jsonify({'error': 'Failed to create user'}), 500
@@ -314,45 +316,151 @@ def signup():
 @app.route('/api/user')
 def get_user():
     """Get current user data"""
-    user = session.get('user')
+    user = current_user()
     if user:
         return jsonify(user)
     else:
         return jsonify({'error': 'Not authenticated'}), 401
 
+@app.route('/api/leaderboard')
+async def get_leaderboard():
+    """Top users by points, plus the current user's rank and neighbours (?around=k)"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        try:
+            limit = int(request.args.get('limit', LEADERBOARD_SIZE))
+            around = int(request.args.get('around', 0))
+        except ValueError:
+            return jsonify({'error': 'limit and around must be integers'}), 400
+        
+        db_manager = get_async_db_manager()
+        leaderboard = await db_manager.get_leaderboard(user['db_user']['id'], limit=limit, around=around)
+        
+        if leaderboard is not None:
+            return jsonify(leaderboard)
+        else:
+            return jsonify({'error': 'Failed to get leaderboard'}), 500
+            
+    except Exception as e:
+        return jsonify({'error': f'Failed to get leaderboard: {str(e)}'}), 500
+
+@app.route('/api/quiz/<quiz_id>')
+async def get_quiz(quiz_id):
+    """Questions of a quiz (without the scoring key)"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    db_manager = get_async_db_manager()
+    quiz = await db_manager.get_quiz(quiz_id)
+    if quiz is None:
+        return jsonify({'error': 'Quiz not found'}), 404
+    return jsonify(quiz)
+
+@app.route('/api/quiz/<quiz_id>', methods=['POST'])
+async def submit_quiz(quiz_id):
+    """Score a quiz submission ({answers: [option index or null per question]}) and award its points"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        data = request.get_json() or {}
+        db_manager = get_async_db_manager()
+        try:
+            result = await db_manager.submit_quiz(user['db_user']['id'], quiz_id, data.get('answers'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if result is not None:
+            return jsonify(result)
+        else:
+            return jsonify({'error': 'Failed to submit quiz'}), 500
+            
+    except Exception as e:
+        return jsonify({'error': f'Failed to submit quiz: {str(e)}'}), 500
+
+@app.route('/api/quiz/<quiz_id>/stats')
+async def get_quiz_stats(quiz_id):
+    """How often each option of each question was chosen"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        db_manager = get_async_db_manager()
+        stats = await db_manager.get_quiz_stats(quiz_id)
+        
+        if stats is not None:
+            return jsonify(stats)
+        else:
+            return jsonify({'error': 'Quiz not found'}), 404
+            
+    except Exception as e:
+        return jsonify({'error': f'Failed to get quiz stats: {str(e)}'}), 500
+
 # Chat API endpoints
 @app.route('/api/chat/users')
-def get_chat_users():
-    """Get all users for chat/discovery"""
-    user = session.get('user')
+async def get_chat_users():
+    """Get a page of users for chat/discovery, optionally filtered by name/email prefix
+
+    ``sort=match`` (without ``q``) returns the people most similar to the
+    current user instead, best match first, with a ``match_score``.
+    """
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        db_manager = get_db_manager()
-        users = db_manager.get_all_users(exclude_user_id=user['db_user']['id'])
-        return jsonify(users)
+        search = request.args.get('q', '').strip()
+        online_first = request.args.get('online_first', '').lower() in ('1', 'true', 'yes')
+        
+        db_manager = get_async_db_manager()
+        if request.args.get('sort') == 'match' and not search:
+            try:
+                limit = int(request.args.get('limit', MATCH_PAGE_SIZE))
+            except ValueError:
+                return jsonify({'error': 'limit must be an integer'}), 400
+            return jsonify(await db_manager.get_matches(user['db_user']['id'], limit=limit))
+        
+        try:
+            limit = min(int(request.args.get('limit', USER_PAGE_SIZE)), MAX_USER_PAGE_SIZE)
+            cursor = request.args.get('cursor')
+            cursor = decode_user_cursor(cursor, online_first) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        users, next_cursor = await db_manager.get_all_users(exclude_user_id=user['db_user']['id'], search=search,
+                                                            limit=limit, cursor=cursor, online_first=online_first)
+        
+        response = jsonify(users)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
     except Exception as e:
         return jsonify({'error': f'Failed to get users: {str(e)}'}), 500
 
 @app.route('/api/chat/groups', methods=['GET'])
-def get_user_groups():
+async def get_user_groups():
     """Get user's groups"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        db_manager = get_db_manager()
-        groups = db_manager.get_user_groups(user['db_user']['id'])
+        db_manager = get_async_db_manager()
+        groups = await db_manager.get_user_groups(user['db_user']['id'])
         return jsonify(groups)
     except Exception as e:
         return jsonify({'error': f'Failed to get groups: {str(e)}'}), 500
 
 @app.route('/api/chat/groups', methods=['POST'])
-def create_group():
+async def create_group():
     """Create a new group"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
@@ -362,6 +470,10 @@ def create_group():
         if not data.get('name'):
             return jsonify({'error': 'Group name is required'}), 400
         
+        member_ids = data.get('member_ids', [])
+        if not isinstance(member_ids, list) or not all(isinstance(member_id, str) for member_id in member_ids):
+            return jsonify({'error': 'member_ids must be a list of user ids'}), 400
+        
         group_data = {
             'name': data['name'],
             'description': data.get('description', ''),
@@ -369,12 +481,11 @@ def create_group():
             'is_private': data.get('is_private', False)
         }
         
-        db_manager = get_db_manager()
-        group = db_manager.create_group(group_data)
+        # Creates the group, the creator's admin membership and any initial members in one call
+        db_manager = get_async_db_manager()
+        group = await db_manager.create_group_with_owner(group_data, member_ids)
         
         if group:
-            # Add creator as admin
-            db_manager.add_group_member(group['id'], user['db_user']['id'], 'admin')
             return jsonify(group)
         else:
             return jsonify({'error': 'Failed to create group'}), 500
@@ -383,23 +494,23 @@ def create_group():
         return jsonify({'error': f'Failed to create group: {str(e)}'}), 500
 
 @app.route('/api/chat/groups/<group_id>/members')
-def get_group_members(group_id):
+async def get_group_members(group_id):
     """Get group members"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        db_manager = get_db_manager()
-        members = db_manager.get_group_members(group_id)
+        db_manager = get_async_db_manager()
+        members = await db_manager.get_group_members(group_id)
         return jsonify(members)
     except Exception as e:
         return jsonify({'error': f'Failed to get group members: {str(e)}'}), 500
 
 @app.route('/api/chat/groups/<group_id>/invite', methods=['POST'])
-def invite_to_group(group_id):
+async def invite_to_group(group_id):
     """Invite user to group"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
@@ -416,8 +527,8 @@ def invite_to_group(group_id):
             'invited_user_id': invited_user_id
         }
         
-        db_manager = get_db_manager()
-        invitation = db_manager.create_group_invitation(invitation_data)
+        db_manager = get_async_db_manager()
+        invitation = await db_manager.create_group_invitation(invitation_data)
         
         if invitation:
             return jsonify(invitation)
@@ -428,23 +539,23 @@ def invite_to_group(group_id):
         return jsonify({'error': f'Failed to invite user: {str(e)}'}), 500
 
 @app.route('/api/chat/invitations')
-def get_user_invitations():
+async def get_user_invitations():
     """Get user's pending invitations"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        db_manager = get_db_manager()
-        invitations = db_manager.get_user_invitations(user['db_user']['id'])
+        db_manager = get_async_db_manager()
+        invitations = await db_manager.get_user_invitations(user['db_user']['id'])
         return jsonify(invitations)
     except Exception as e:
         return jsonify({'error': f'Failed to get invitations: {str(e)}'}), 500
 
 @app.route('/api/chat/invitations/<invitation_id>/respond', methods=['POST'])
-def respond_to_invitation(invitation_id):
+async def respond_to_invitation(invitation_id):
     """Respond to group invitation"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
@@ -455,17 +566,16 @@ def respond_to_invitation(invitation_id):
         if status not in ['accepted', 'declined']:
             return jsonify({'error': 'Status must be accepted or declined'}), 400
         
-        db_manager = get_db_manager()
-        success = db_manager.respond_to_invitation(invitation_id, status)
+        db_manager = get_async_db_manager()
         
-        if success and status == 'accepted':
-            # Add user to group
-            # First get the invitation to find group_id
-            invitations = db_manager.get_user_invitations(user['db_user']['id'])
-            invitation = next((inv for inv in invitations if inv['id'] == invitation_id), None)
-            
-            if invitation:
-                db_manager.add_group_member(invitation['group_id'], user['db_user']['id'])
+        if status == 'accepted':
+            # Marks the invitation accepted and adds the membership atomically
+            group_id = await db_manager.accept_invitation(invitation_id, user['db_user']['id'])
+            if group_id:
+                return jsonify({'success': True, 'group_id': group_id})
+            return jsonify({'error': 'Invitation not found'}), 404
+        
+        success = await db_manager.respond_to_invitation(invitation_id, status)
         
         if success:
             return jsonify({'success': True})
@@ -476,9 +586,9 @@ def respond_to_invitation(invitation_id):
         return jsonify({'error': f'Failed to respond to invitation: {str(e)}'}), 500
 
 @app.route('/api/chat/messages', methods=['POST'])
-def send_message():
+async def send_message():
     """Send a message"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
@@ -502,8 +612,22 @@ def send_message():
         else:
             return jsonify({'error': 'Either group_id or recipient_id is required'}), 400
         
-        db_manager = get_db_manager()
-        message = db_manager.send_message(message_data)
+        # Client-generated ids let a resent message be recognised as the same one
+        if data.get('client_id'):
+            try:
+                message_data['id'] = str(uuid.UUID(str(data['client_id'])))
+            except ValueError:
+                return jsonify({'error': 'client_id must be a UUID'}), 400
+        
+        db_manager = get_async_db_manager()
+        
+        # With write-behind enabled the message is acknowledged once queued;
+        # it reaches the stream after its batch is stored
+        message = await db_manager.enqueue_message(message_data)
+        if message:
+            return jsonify(message), 202
+        
+        message = await db_manager.send_message(message_data)
         
         if message:
             return jsonify(message)
@@ -514,31 +638,105 @@ def send_message():
         return jsonify({'error': f'Failed to send message: {str(e)}'}), 500
 
 @app.route('/api/chat/messages')
-def get_messages():
+async def get_messages():
     """Get messages for a conversation"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
         group_id = request.args.get('group_id')
         recipient_id = request.args.get('recipient_id')
-        limit = int(request.args.get('limit', 50))
         
         if not group_id and not recipient_id:
             return jsonify({'error': 'Either group_id or recipient_id is required'}), 400
         
-        db_manager = get_db_manager()
-        messages = db_manager.get_messages(group_id=group_id, recipient_id=recipient_id, limit=limit)
-        return jsonify(messages)
+        try:
+            limit = min(int(request.args.get('limit', 50)), MAX_MESSAGE_PAGE_SIZE)
+            before = request.args.get('before')
+            after = request.args.get('after')
+            before = decode_message_cursor(before) if before else None
+            after = decode_message_cursor(after) if after else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if before and after:
+            return jsonify({'error': 'Use either before or after, not both'}), 400
+        
+        db_manager = get_async_db_manager()
+        if group_id:
+            messages = await db_manager.get_messages(group_id, limit=limit, before=before, after=after)
+        else:
+            # Both sides of the private conversation between the current user and recipient_id
+            messages = await db_manager.get_conversation(user['db_user']['id'], recipient_id, limit=limit,
+                                                         before=before, after=after)
+        
+        # Messages are newest first: the last one pages back, the first one polls forward
+        response = jsonify(messages)
+        if messages:
+            response.headers['X-Before-Cursor'] = encode_message_cursor(messages[-1])
+            response.headers['X-After-Cursor'] = encode_message_cursor(messages[0])
+        return response
         
     except Exception as e:
         return jsonify({'error': f'Failed to get messages: {str(e)}'}), 500
 
+@app.route('/api/chat/unread')
+async def get_unread():
+    """Unread badge counts for every chat of the current user"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        db_manager = get_async_db_manager()
+        counters = await db_manager.get_unread(user['db_user']['id'])
+        
+        unread = {'users': {}, 'groups': {}, 'total': 0}
+        for counter in counters:
+            unread['users' if counter['chat_type'] == 'user' else 'groups'][counter['chat_id']] = counter['unread_count']
+            unread['total'] += counter['unread_count']
+        return jsonify(unread)
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to get unread counts: {str(e)}'}), 500
+
+@app.route('/api/chat/read', methods=['POST'])
+async def mark_chat_read():
+    """Mark a private (recipient_id) or group (group_id) chat read up to a message cursor"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        data = request.get_json() or {}
+        if data.get('group_id'):
+            chat_type, chat_id = 'group', data['group_id']
+        elif data.get('recipient_id'):
+            chat_type, chat_id = 'user', data['recipient_id']
+        else:
+            return jsonify({'error': 'Either group_id or recipient_id is required'}), 400
+        
+        try:
+            cursor = decode_message_cursor(data['cursor']) if data.get('cursor') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        db_manager = get_async_db_manager()
+        unread = await db_manager.mark_read(user['db_user']['id'], chat_type, chat_id, cursor=cursor)
+        
+        if unread is not None:
+            return jsonify({'success': True, 'unread_count': unread})
+        else:
+            return jsonify({'error': 'Failed to mark chat read'}), 500
+            
+    except Exception as e:
+        return jsonify({'error': f'Failed to mark chat read: {str(e)}'}), 500
+
 @app.route('/api/chat/online-status', methods=['POST'])
-def update_online_status():
+async def update_online_status():
     """Update user's online status"""
-    user = session.get('user')
+    user = current_user()
     if not user:
         return jsonify({'error': 'Not authenticated'}), 401
     
@@ -546,8 +744,8 @@ def update_online_status():
         data = request.get_json()
         is_online = data.get('is_online', True)
         
-        db_manager = get_db_manager()
-        success = db_manager.update_user_online_status(user['db_user']['id'], is_online)
+        db_manager = get_async_db_manager()
+        success = await db_manager.update_user_online_status(user['db_user']['id'], is_online)
         
         if success:
             return jsonify({'success': True})
@@ -557,6 +755,89 @@ def update_online_status():
     except Exception as e:
         return jsonify({'error': f'Failed to update online status: {str(e)}'}), 500
 
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Lookup cache hit/miss counters (for sizing the cache)"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return jsonify(get_db_manager().cache_stats())
+
+@app.route('/api/queue/stats')
+def message_queue_stats():
+    """Message write-behind queue depth and batch sizes"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    return jsonify(get_db_manager().message_queue_stats())
+
+@app.route('/api/admin/attendees/import', methods=['POST'])
+def import_attendees_route():
+    """Pre-register attendees from a CSV or JSON Lines upload (requires IMPORT_TOKEN)"""
+    token = os.environ.get('IMPORT_TOKEN')
+    if not token:
+        return jsonify({'error': 'Attendee import is disabled (set IMPORT_TOKEN)'}), 403
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Not authorized'}), 401
+    
+    try:
+        # A multipart upload ('file' field) or the raw request body, read as a stream
+        upload = request.files.get('file')
+        fmt = request.args.get('format') or detect_format(
+            upload.filename if upload else None, upload.mimetype if upload else request.mimetype
+        )
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f'format must be one of {", ".join(IMPORT_FORMATS)}'}), 400
+        
+        binary = upload.stream if upload else request.stream
+        stream = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+        return jsonify(import_attendees(get_db_manager(), read_rows(stream, fmt)))
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to import attendees: {str(e)}'}), 500
+
+@app.route('/api/chat/stream')
+def chat_stream():
+    """Stream new messages, invitations, group joins and presence changes over Server-Sent Events"""
+    user = current_user()
+    if not user:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = user['db_user']['id']
+    db_manager = get_db_manager()
+    channels = [user_channel(user_id), PRESENCE_CHANNEL]
+    channels += [group_channel(membership['group_id']) for membership in db_manager.get_user_groups(user_id)]
+    
+    def generate():
+        subscription = db_manager.pubsub.subscribe(channels)
+        try:
+            yield 'retry: 2000\n\n'
+            # An open stream keeps its user online; presence expires once it closes
+            db_manager.presence.heartbeat(user_id)
+            last_heartbeat = time.monotonic()
+            deadline = last_heartbeat + SSE_MAX_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                if time.monotonic() - last_heartbeat >= SSE_HEARTBEAT_SECONDS:
+                    db_manager.presence.heartbeat(user_id)
+                    last_heartbeat = time.monotonic()
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                if event['event'] == 'group_joined':
+                    # Memberships made after connecting: relay that group from now on
+                    subscription.add([group_channel(event['data']['group_id'])])
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+        finally:
+            subscription.close()
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 
 if __name__ == '__main__':
     # Get port from environment variable (for Render) or default to 5000
@@ -0,0 +1,184 @@
+"""
+Fingerprinted static assets
+
+Build step (run after install, see render.yaml):
+
+    python assets.py
+
+copies every file under public/ to ASSET_BUILD_DIR (default build/assets)
+with a content hash in its name, writes gzip (and brotli, if the ``brotli``
+package is installed) variants where they are meaningfully smaller, and
+records a manifest mapping the original URLs (/images/..., /public/...) to
+the hashed ones.
+
+Templates call ``asset_url('/images/ramble-logo.png')`` (or ``asset(...)`` in
+in-browser JSX) to get the hashed URL. The app serves hashed files from
+/assets/ with ``Cache-Control: immutable`` and a content-hash ETag, so
+browsers never re-validate them. Without a build, URLs are left unchanged.
+"""
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import mimetypes
+from typing import Dict, Optional
+from urllib.parse import quote
+from flask import request, send_from_directory, abort
+import logging
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DIR = 'public'
+BUILD_DIR = os.environ.get('ASSET_BUILD_DIR', os.path.join('build', 'assets'))
+MANIFEST_NAME = 'manifest.json'
+URL_PREFIX = '/assets/'
+
+# Hashed files never change, so they can be cached for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Keep a precompressed variant only if it saves at least this fraction
+MIN_COMPRESSION_SAVING = 0.1
+
+# Accept-Encoding token -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _compress_variants(path: str, data: bytes) -> list:
+    """Write .gz/.br next to ``path`` when they are worth it; returns the encodings written"""
+    variants = [('gzip', '.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+        variants.append(('br', '.br', lambda raw: brotli.compress(raw, quality=11)))
+    except ImportError:
+        pass
+
+    written = []
+    for encoding, suffix, compress in variants:
+        compressed = compress(data)
+        if len(compressed) <= len(data) * (1 - MIN_COMPRESSION_SAVING):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(encoding)
+    return written
+
+
+def build_assets(source_dir: str = SOURCE_DIR, build_dir: str = BUILD_DIR) -> Dict[str, Dict]:
+    """Fingerprint and precompress everything under ``source_dir``; returns the manifest"""
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+
+    manifest = {}
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, source_dir).replace(os.sep, '/')
+            digest = _content_hash(source)
+            stem, extension = os.path.splitext(relative)
+            hashed = f'{stem}.{digest}{extension}'
+
+            target = os.path.join(build_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            with open(source, 'rb') as f:
+                encodings = _compress_variants(target, f.read())
+
+            entry = {'file': hashed, 'etag': digest, 'encodings': encodings}
+            manifest[f'/public/{relative}'] = entry
+            if relative.startswith('images/'):
+                manifest[f'/{relative}'] = entry  # /images/... is an alias of /public/images/...
+            logger.info(f"{relative} -> {hashed} {encodings or ''}")
+
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetManifest:
+    """Lookup of built assets, loaded from the manifest on first use"""
+
+    def __init__(self, build_dir: str = BUILD_DIR, images=None):
+        self.build_dir = build_dir
+        self.images = images  # optional images.ImageDerivatives for resized/re-encoded variants
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._by_file: Dict[str, Dict] = {}
+
+    @property
+    def entries(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            path = os.path.join(self.build_dir, MANIFEST_NAME)
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                logger.warning(f"No asset manifest at {path}; run `python assets.py` to fingerprint assets")
+                self._entries = {}
+            self._by_file = {entry['file']: entry for entry in self._entries.values()}
+        return self._entries
+
+    def url(self, path: str) -> str:
+        """Hashed URL for an original asset URL, or the URL itself if it wasn't built"""
+        entry = self.entries.get(path)
+        return URL_PREFIX + quote(entry['file']) if entry else path
+
+    def urls(self) -> Dict[str, str]:
+        """Every original URL mapped to its hashed URL (for client-side lookups)"""
+        return {path: self.url(path) for path in self.entries}
+
+    def send(self, filename: str):
+        """Response for a hashed asset, precompressed if the client accepts it"""
+        self.entries  # load the manifest
+        entry = self._by_file.get(filename)
+        if entry is None:
+            abort(404)
+
+        if self.images is not None:
+            derivative = self.images.send(os.path.join(self.build_dir, filename), digest=entry['etag'], immutable=True)
+            if derivative is not None:
+                return derivative
+
+        encoding, suffix = next(
+            ((encoding, suffix) for encoding, suffix in ENCODINGS
+             if encoding in entry['encodings'] and request.accept_encodings[encoding] > 0),
+            (None, '')
+        )
+        response = send_from_directory(
+            self.build_dir, filename + suffix,
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            etag=f"{entry['etag']}-{encoding}" if encoding else entry['etag'],
+            max_age=IMMUTABLE_MAX_AGE
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        return response
+
+
+def init_assets(app, manifest: AssetManifest = None, images=None):
+    """Register the /assets/ route and the ``asset_url``/``asset_urls`` template helpers"""
+    manifest = manifest or AssetManifest(images=images)
+
+    @app.route(URL_PREFIX + '<path:filename>')
+    def hashed_asset(filename):
+        return manifest.send(filename)
+
+    app.jinja_env.globals.update(asset_url=manifest.url, asset_urls=manifest.urls)
+    return manifest
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    built = build_assets()
+    print(f"Built {len({entry['file'] for entry in built.values()})} assets into {BUILD_DIR}")
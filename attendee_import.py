@@ -0,0 +1,215 @@
+"""
+Bulk attendee import (pre-registration before an event)
+
+Reads attendees from CSV (with a header row) or JSON Lines, one attendee per
+row, as a stream: rows are validated and grouped into chunks of
+IMPORT_CHUNK_SIZE, and each chunk costs one lookup of the emails that are
+already registered plus one multi-row insert (DatabaseManager.import_users).
+Nothing is read into memory beyond the current chunk and the set of emails
+seen so far.
+
+Columns (CSV header or JSON keys; camelCase as in /api/signup or snake_case):
+
+    email (required), firstName (required), middleName, surname, birthday
+    (YYYY-MM-DD), gender, password, points, linkedin_id
+
+Rows that fail validation, repeat an earlier email in the file, or clash
+with an existing user are reported with their line number; the other rows
+are imported. Run from the command line with
+
+    python attendee_import.py attendees.csv [--format jsonl] [--chunk-size 500]
+
+or POST the file to /api/admin/attendees/import (see app.py).
+"""
+import os
+import io
+import re
+import csv
+import json
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+
+# Per-row errors listed in a report; the count covers all of them
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('csv', 'jsonl')
+
+# Accepted column names -> users column
+FIELD_ALIASES = {
+    'email': 'email',
+    'firstName': 'first_name', 'first_name': 'first_name',
+    'middleName': 'middle_name', 'middle_name': 'middle_name',
+    'surname': 'surname', 'lastName': 'surname', 'last_name': 'surname',
+    'birthday': 'birthday',
+    'gender': 'gender',
+    'password': 'password',
+    'points': 'points',
+    'linkedin_id': 'linkedin_id', 'linkedinId': 'linkedin_id',
+}
+
+# Every imported row carries the same columns, so a chunk is one multi-row insert
+USER_COLUMNS = ('email', 'first_name', 'middle_name', 'surname', 'birthday', 'gender', 'password', 'points',
+                'rank', 'login_method', 'linkedin_id')
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def detect_format(filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    """'csv' or 'jsonl' from a file name or content type (CSV if neither says)"""
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if content_type and any(kind in content_type for kind in ('ndjson', 'jsonl', 'jsonlines', 'json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream: io.TextIOBase, fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """(line number, row, parse error) for each attendee in a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if isinstance(row, dict):
+            yield line_number, row, None
+        else:
+            yield line_number, None, "Expected a JSON object"
+
+
+def to_user_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """users row for an attendee; raises ValueError describing the first problem"""
+    fields = {}
+    for key, value in row.items():
+        column = FIELD_ALIASES.get((key or '').strip())
+        if column and value is not None and str(value).strip():
+            fields[column] = str(value).strip() if column != 'points' else value
+
+    email = fields.get('email')
+    if not email:
+        raise ValueError("email is required")
+    if not EMAIL_PATTERN.match(email):
+        raise ValueError(f"Invalid email: {email}")
+    if not fields.get('first_name'):
+        raise ValueError("firstName is required")
+    if fields.get('birthday'):
+        try:
+            date.fromisoformat(fields['birthday'])
+        except ValueError:
+            raise ValueError(f"Invalid birthday (expected YYYY-MM-DD): {fields['birthday']}")
+    try:
+        points = int(fields.get('points', 0))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid points: {fields['points']}")
+
+    user = {column: fields.get(column) for column in USER_COLUMNS}
+    user.update(points=points, rank=1, login_method='linkedin' if fields.get('linkedin_id') else 'email')
+    return user
+
+
+class ImportReport:
+    """Running totals and per-row errors of one import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.existing = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def error(self, line: int, message: str, email: str = None):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'email': email, 'error': message})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'already_registered': self.existing,
+            'failed': self.error_count,
+            'errors': self.errors
+        }
+
+
+def _import_chunk(db_manager, chunk: List[Tuple[int, Dict[str, Any]]], report: ImportReport):
+    result = db_manager.import_users([user for _, user in chunk])
+    if result is None:
+        for line, user in chunk:
+            report.error(line, "Database error, row not imported", user['email'])
+        return
+    created = {user['email'] for user in result['created']}
+    for line, user in chunk:
+        if user['email'] in created:
+            report.created += 1
+        elif user['email'] in result['existing']:
+            report.existing += 1
+        else:
+            report.error(line, "Conflicts with an existing user", user['email'])
+
+
+def import_attendees(db_manager, rows: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+                     chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict[str, Any]:
+    """Validate, dedupe and insert attendees chunk by chunk; returns the report as a dict"""
+    report = ImportReport()
+    seen: Dict[str, int] = {}
+    chunk: List[Tuple[int, Dict[str, Any]]] = []
+
+    for line, row, parse_error in rows:
+        report.rows += 1
+        if parse_error:
+            report.error(line, parse_error)
+            continue
+        try:
+            user = to_user_row(row)
+        except ValueError as e:
+            report.error(line, str(e), (row.get('email') or None) if isinstance(row, dict) else None)
+            continue
+        if user['email'] in seen:
+            report.error(line, f"Duplicate of line {seen[user['email']]}", user['email'])
+            continue
+        seen[user['email']] = line
+        chunk.append((line, user))
+        if len(chunk) >= chunk_size:
+            _import_chunk(db_manager, chunk, report)
+            chunk = []
+
+    if chunk:
+        _import_chunk(db_manager, chunk, report)
+    logger.info("Attendee import: %d rows, %d created, %d already registered, %d failed",
+                report.rows, report.created, report.existing, report.error_count)
+    return report.to_dict()
+
+
+if __name__ == '__main__':
+    import argparse
+    from dotenv import load_dotenv
+    from log_config import configure_logging
+
+    parser = argparse.ArgumentParser(description='Pre-register attendees from a CSV or JSON Lines file')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS, help='default: from the file extension')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    load_dotenv()
+    configure_logging()
+    from database import get_db_manager
+
+    with open(args.path, encoding='utf-8-sig', newline='') as f:
+        summary = import_attendees(
+            get_db_manager(), read_rows(f, args.format or detect_format(args.path)), chunk_size=args.chunk_size
+        )
+    print(json.dumps(summary, indent=2))
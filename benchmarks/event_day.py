@@ -0,0 +1,310 @@
+"""
+Offline event-day load test for the chat API
+
+    python benchmarks/event_day.py --users 200 --concurrency 16
+    python benchmarks/event_day.py --save-baseline     # record this machine's numbers
+    python benchmarks/event_day.py                     # compare against them
+
+Drives the Flask app through its test client on a throwaway SQLite database
+(no network, no Supabase), with one session per attendee and a pool of
+concurrent workers. Phases follow an event day:
+
+    signup    POST /api/signup
+    login     POST /api/login, GET /api/user
+    browse    GET /api/chat/users (first page, search, suggested matches)
+    groups    POST /api/chat/groups, POST .../invite,
+              GET /api/chat/invitations, POST .../respond
+    chat      rounds of POST /api/chat/messages, GET /api/chat/messages
+              (polling with the after cursor), GET /api/chat/unread,
+              POST /api/chat/read, POST /api/chat/online-status
+
+and prints p50/p95/p99 latency and throughput per endpoint: the median over
+--repeat passes (new attendees each pass, same database), since a single
+pass on a busy machine varies a lot. The workload is seeded, so runs with
+the same options send the same requests.
+
+With --baseline (default benchmarks/baselines/event_day.json, if present) an
+endpoint regresses when its p95 grows, or its throughput drops, by more than
+--tolerance; the script then exits with status 1. Baselines are only
+comparable on the machine and options they were recorded with.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'event_day.json')
+
+# Latency differences below this are noise, whatever the ratio
+MIN_REGRESSION_MS = 1.0
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Per-endpoint latencies, errors and the wall time of the phases that ran them"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.busy_seconds = {}
+        self._lock = threading.Lock()
+        self._phase_endpoints = set()
+
+    def request(self, client, method, endpoint, url, body=None, expect=(200, 202)):
+        start = time.perf_counter()
+        response = client.open(url, method=method, json=body)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(elapsed)
+            self._phase_endpoints.add(endpoint)
+            if response.status_code not in expect:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return response
+
+    def phase(self, name, jobs, concurrency):
+        """Run ``jobs`` (callables) on ``concurrency`` workers and charge the wall time to their endpoints"""
+        self._phase_endpoints = set()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(job) for job in jobs]:
+                future.result()
+        elapsed = time.perf_counter() - start
+        for endpoint in self._phase_endpoints:
+            self.busy_seconds[endpoint] = self.busy_seconds.get(endpoint, 0.0) + elapsed
+        print(f'{name:<8} {len(jobs):>5} jobs in {elapsed:.2f}s', file=sys.stderr)
+
+    def report(self):
+        results = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            results[endpoint] = {
+                'count': len(samples),
+                'errors': self.errors.get(endpoint, 0),
+                'p50_ms': round(percentile(samples, 0.50), 2),
+                'p95_ms': round(percentile(samples, 0.95), 2),
+                'p99_ms': round(percentile(samples, 0.99), 2),
+                'rps': round(len(samples) / self.busy_seconds[endpoint], 1) if self.busy_seconds.get(endpoint) else 0.0
+            }
+        return results
+
+
+class Attendee:
+    """One signed-up user with their own session"""
+
+    def __init__(self, app, index, seed):
+        self.client = app.test_client()
+        self.index = index
+        # Per-attendee generator: the same choices whatever order the workers run in
+        self.rng = random.Random(seed * 100003 + index)
+        self.email = f'attendee{index}@example.com'
+        self.password = f'pw-{index}'
+        self.id = None
+        self.groups = []
+        self.cursors = {}
+
+
+def start_app(args):
+    """Import the app against a fresh SQLite database and session directory"""
+    workdir = tempfile.mkdtemp(prefix='ramble-bench-')
+    os.environ.update(
+        DATABASE_BACKEND='sqlite',
+        SQLITE_DATABASE_PATH=os.path.join(workdir, 'bench.db'),
+        SESSION_BACKEND='filesystem',
+        SESSION_FILE_DIR=os.path.join(workdir, 'sessions'),
+        APP_ENV='production',
+        LOG_LEVEL='WARNING',
+        MESSAGE_WRITE_BEHIND='1' if args.write_behind else '0'
+    )
+    os.chdir(ROOT)
+
+    from app import app
+    return app
+
+
+def run(app, args, first_index=0):
+    """One pass of the event day with attendees numbered from ``first_index``"""
+    from database import get_db_manager
+
+    recorder = Recorder()
+    attendees = [Attendee(app, first_index + i, args.seed) for i in range(args.users)]
+
+    def signup(attendee):
+        response = recorder.request(attendee.client, 'POST', 'POST /api/signup', '/api/signup', {
+            'firstName': f'Attendee{attendee.index}', 'surname': 'Bench', 'email': attendee.email,
+            'password': attendee.password, 'birthday': f'{1970 + attendee.index % 35}-0{1 + attendee.index % 9}-15',
+            'gender': attendee.rng.choice(['female', 'male', 'other'])
+        })
+        attendee.id = response.get_json()['user']['db_user']['id']
+
+    def login(attendee):
+        recorder.request(attendee.client, 'POST', 'POST /api/login', '/api/login',
+                         {'email': attendee.email, 'password': attendee.password})
+        recorder.request(attendee.client, 'GET', 'GET /api/user', '/api/user')
+
+    def browse(attendee):
+        recorder.request(attendee.client, 'GET', 'GET /api/chat/users', '/api/chat/users?online_first=1')
+        recorder.request(attendee.client, 'GET', 'GET /api/chat/users?q', f'/api/chat/users?q=Attendee{attendee.index % 10}')
+        recorder.request(attendee.client, 'GET', 'GET /api/chat/users?sort=match', '/api/chat/users?sort=match')
+
+    hosts = attendees[::args.group_every]
+
+    def create_group(host):
+        members = [member for member in host.rng.sample(attendees, min(args.group_size, len(attendees)))
+                   if member is not host]
+        added, invited = members[:args.group_size // 2], members[args.group_size // 2:]
+        response = recorder.request(host.client, 'POST', 'POST /api/chat/groups', '/api/chat/groups', {
+            'name': f'Table {host.index}',
+            'member_ids': [member.id for member in added]
+        })
+        group = response.get_json()
+        for member in [host, *added]:
+            member.groups.append(group['id'])
+        for member in invited:
+            recorder.request(host.client, 'POST', 'POST /api/chat/groups/<id>/invite',
+                             f"/api/chat/groups/{group['id']}/invite", {'user_id': member.id})
+
+    def answer_invitations(attendee):
+        invitations = recorder.request(attendee.client, 'GET', 'GET /api/chat/invitations',
+                                       '/api/chat/invitations').get_json()
+        for invitation in invitations:
+            response = recorder.request(attendee.client, 'POST', 'POST /api/chat/invitations/<id>/respond',
+                                        f"/api/chat/invitations/{invitation['id']}/respond", {'status': 'accepted'})
+            attendee.groups.append(response.get_json()['group_id'])
+
+    def chat_round(attendee):
+        recorder.request(attendee.client, 'POST', 'POST /api/chat/online-status', '/api/chat/online-status',
+                         {'is_online': True})
+        if attendee.groups:
+            target = ('group_id', attendee.rng.choice(attendee.groups))
+        else:
+            target = ('recipient_id', attendee.rng.choice(attendees).id)
+        recorder.request(attendee.client, 'POST', 'POST /api/chat/messages', '/api/chat/messages',
+                         {'content': f'hello from {attendee.index}', target[0]: target[1]})
+
+        after = attendee.cursors.get(target)
+        query = f'{target[0]}={target[1]}' + (f'&after={after}' if after else '')
+        response = recorder.request(attendee.client, 'GET', 'GET /api/chat/messages', f'/api/chat/messages?{query}')
+        cursor = response.headers.get('X-After-Cursor')
+        if cursor:
+            attendee.cursors[target] = cursor
+            recorder.request(attendee.client, 'POST', 'POST /api/chat/read', '/api/chat/read',
+                             {target[0]: target[1], 'cursor': cursor})
+        recorder.request(attendee.client, 'GET', 'GET /api/chat/unread', '/api/chat/unread')
+
+    recorder.phase('signup', [lambda a=a: signup(a) for a in attendees], args.concurrency)
+    recorder.phase('login', [lambda a=a: login(a) for a in attendees], args.concurrency)
+    recorder.phase('browse', [lambda a=a: browse(a) for a in attendees], args.concurrency)
+    recorder.phase('groups', [lambda h=h: create_group(h) for h in hosts], args.concurrency)
+    recorder.phase('invites', [lambda a=a: answer_invitations(a) for a in attendees], args.concurrency)
+    for _ in range(args.rounds):
+        recorder.phase('chat', [lambda a=a: chat_round(a) for a in attendees], args.concurrency)
+    get_db_manager().flush_messages()
+
+    return recorder.report()
+
+
+def median_report(reports):
+    """Per-endpoint median of each statistic over repeated runs (counts are summed)"""
+    merged = {}
+    for endpoint in sorted(set().union(*reports)):
+        rows = [report[endpoint] for report in reports if endpoint in report]
+        merged[endpoint] = {
+            key: sum(row[key] for row in rows) if key in ('count', 'errors')
+            else sorted(row[key] for row in rows)[len(rows) // 2]
+            for key in rows[0]
+        }
+    return merged
+
+
+def compare(results, baseline, tolerance):
+    """Endpoints whose p95 or throughput regressed beyond ``tolerance``"""
+    regressions = []
+    for endpoint, base in baseline['endpoints'].items():
+        current = results.get(endpoint)
+        if current is None:
+            continue
+        if (current['p95_ms'] > base['p95_ms'] * (1 + tolerance)
+                and current['p95_ms'] - base['p95_ms'] > MIN_REGRESSION_MS):
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if base['rps'] and current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {base['rps']}/s -> {current['rps']}/s")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    base = (baseline or {}).get('endpoints', {})
+    print(f"{'endpoint':<44} {'count':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}  baseline p95")
+    for endpoint, row in results.items():
+        previous = base.get(endpoint)
+        print(f"{endpoint:<44} {row['count']:>6} {row['errors']:>4} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+              f"{row['p99_ms']:>8.2f} {row['rps']:>8.1f}  {previous['p95_ms'] if previous else '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Event-day load test of the chat API on a local SQLite database')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=5, help='chat rounds (each attendee sends and polls once per round)')
+    parser.add_argument('--group-every', type=int, default=10, help='one attendee in N hosts a group')
+    parser.add_argument('--group-size', type=int, default=8)
+    parser.add_argument('--write-behind', action='store_true', help='enable MESSAGE_WRITE_BEHIND')
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--repeat', type=int, default=3, help='runs to take the median of (damps scheduling noise)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', action='store_true', help='write this run to --baseline')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in ('users', 'concurrency', 'rounds', 'group_every', 'group_size',
+                                                  'write_behind', 'seed', 'repeat')}
+    app = start_app(args)
+    results = median_report([run(app, args, first_index=i * args.users) for i in range(args.repeat)])
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f'Baseline was recorded with {baseline.get("config")}; not comparing', file=sys.stderr)
+            baseline = None
+
+    if args.json:
+        print(json.dumps({'config': config, 'endpoints': results}, indent=2))
+    else:
+        print_table(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'endpoints': results}, f, indent=2)
+            f.write('\n')
+        print(f'Saved baseline to {args.baseline}', file=sys.stderr)
+        return 0
+
+    errors = sum(row['errors'] for row in results.values())
+    if errors:
+        print(f'{errors} requests failed', file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    return 1 if regressions or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Local stand-in for LinkedIn's OAuth and profile APIs
+
+Serves the four endpoints the login flow uses, with an artificial delay per
+response so callback latency can be measured without network access:
+
+    python benchmarks/fake_linkedin.py --port 8765 --latency-ms 80
+
+then run the app with
+    LINKEDIN_OAUTH_URL=http://127.0.0.1:8765/oauth/v2
+    LINKEDIN_API_URL=http://127.0.0.1:8765
+
+Authorization codes look like ``code-<n>``; member ``n`` gets the LinkedIn id
+``fake-<n>`` and the email ``member<n>@example.com``.
+
+For tests, ``start_server(faults=...)`` makes an endpoint ('token',
+'profile' or 'email') answer with queued error statuses before it succeeds
+again, and ``hits(server)`` counts the requests each endpoint received.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+class FakeLinkedInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    latency = 0.0
+    codes = itertools.count(1)
+    faults: dict = {}  # endpoint -> statuses to answer with before succeeding
+    hits: Counter = Counter()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _fault(self, endpoint: str) -> bool:
+        """Count a request to ``endpoint``; answer it with the next queued error status, if any"""
+        with self.lock:
+            self.hits[endpoint] += 1
+            queued = self.faults.get(endpoint)
+            status = queued.pop(0) if queued else None
+        if status is None:
+            return False
+        self._send(status, {'error': 'injected fault', 'status': status})
+        return True
+
+    def _member(self) -> str:
+        return self.headers.get('Authorization', '').rsplit('token-', 1)[-1]
+
+    def _send(self, status: int, body=None, headers=None):
+        time.sleep(self.latency)
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/oauth/v2/authorization':
+            query = parse_qs(url.query)
+            code = f'code-{next(self.codes)}'
+            location = f"{query['redirect_uri'][0]}?{urlencode({'code': code, 'state': query['state'][0]})}"
+            self._send(302, headers={'Location': location})
+        elif url.path.startswith('/v2/people/'):
+            if self._fault('profile'):
+                return
+            member = self._member()
+            self._send(200, {
+                'id': f'fake-{member}',
+                'firstName': {'localized': {'en_US': 'Member'}},
+                'lastName': {'localized': {'en_US': member}},
+                'profilePicture': {'displayImage~': {'elements': [
+                    {'identifiers': [{'identifier': f'https://example.com/pictures/{member}.jpg'}]}
+                ]}}
+            })
+        elif url.path == '/v2/emailAddress':
+            if self._fault('email'):
+                return
+            self._send(200, {'elements': [{'handle~': {'emailAddress': f'member{self._member()}@example.com'}}]})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        if urlparse(self.path).path == '/oauth/v2/accessToken':
+            if self._fault('token'):
+                return
+            member = form.get('code', ['code-0'])[0].rsplit('-', 1)[-1]
+            self._send(200, {'access_token': f'token-{member}', 'expires_in': 5184000})
+        else:
+            self._send(404, {'error': 'not found'})
+
+
+def start_server(port: int = 0, latency_ms: float = 0, faults: dict = None) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread; port 0 picks a free port"""
+    handler = type('Handler', (FakeLinkedInHandler,), {
+        'latency': latency_ms / 1000,
+        'faults': {endpoint: list(statuses) for endpoint, statuses in (faults or {}).items()},
+        'hits': Counter(),
+        'lock': threading.Lock()
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def hits(server: ThreadingHTTPServer) -> Counter:
+    """Requests received so far per endpoint ('token', 'profile', 'email')"""
+    return server.RequestHandlerClass.hits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    args = parser.parse_args()
+    server = start_server(args.port, args.latency_ms)
+    print(f'Fake LinkedIn listening on http://127.0.0.1:{server.server_address[1]} ({args.latency_ms:g} ms per response)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
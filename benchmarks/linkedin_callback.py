@@ -0,0 +1,68 @@
+"""
+Benchmark the LinkedIn login callback against the fake OAuth server
+
+    python benchmarks/linkedin_callback.py --logins 50 --latency-ms 80
+
+Runs the full /auth/linkedin -> /auth/linkedin/callback flow through Flask's
+test client on a throwaway SQLite database and prints callback latency. With
+the pooled client the callback costs about two upstream latencies (token
+exchange, then profile and email in parallel) instead of three.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_linkedin import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LinkedIn callback latency against a local fake server')
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    args = parser.parse_args()
+
+    server = start_server(latency_ms=args.latency_ms)
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    workdir = tempfile.mkdtemp(prefix='ramble-bench-')
+    os.environ.update(
+        DATABASE_BACKEND='sqlite',
+        SQLITE_DATABASE_PATH=os.path.join(workdir, 'bench.db'),
+        SESSION_FILE_DIR=os.path.join(workdir, 'sessions'),
+        LINKEDIN_OAUTH_URL=f'{base}/oauth/v2',
+        LINKEDIN_API_URL=base,
+        LINKEDIN_REDIRECT_URI='http://localhost/auth/linkedin/callback'
+    )
+    os.chdir(ROOT)
+
+    import logging
+    logging.disable(logging.INFO)
+    from app import app, linkedin_client
+
+    timings = []
+    for _ in range(args.logins):
+        client = app.test_client()
+        authorize = client.get('/auth/linkedin').headers['Location']
+        callback = linkedin_client.http.get(authorize, allow_redirects=False).headers['Location']
+        url = urlparse(callback)
+        start = time.perf_counter()
+        response = client.get(f'{url.path}?{url.query}')
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 302 and response.headers['Location'] == '/dashboard', response.get_data(as_text=True)
+
+    timings.sort()
+    print(f'{args.logins} logins, {args.latency_ms:g} ms upstream latency')
+    print(f'callback ms: mean {statistics.mean(timings):.1f}  p50 {timings[len(timings) // 2]:.1f}  '
+          f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f}  max {timings[-1]:.1f}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Read-through cache for hot DatabaseManager lookups
+
+DatabaseManager caches user and group lookups here and invalidates the
+affected keys on writes. Select the cache with the CACHE_BACKEND environment
+variable:
+    memory (default) - bounded in-process LRU with TTL (per worker)
+    redis            - shared Redis cache via REDIS_URL, so invalidations
+                       reach every worker
+    none             - disable caching
+"""
+import os
+import copy
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def user_id_key(user_id: str) -> str:
+    return f'user:id:{user_id}'
+
+
+def user_email_key(email: str) -> str:
+    return f'user:email:{email}'
+
+
+def user_linkedin_key(linkedin_id: str) -> str:
+    return f'user:linkedin:{linkedin_id}'
+
+
+def user_groups_key(user_id: str) -> str:
+    return f'user_groups:{user_id}'
+
+
+def group_members_key(group_id: str) -> str:
+    return f'group_members:{group_id}'
+
+
+class Cache:
+    """Interface implemented by every cache; ``get`` returns None on a miss"""
+
+    name = 'base'
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations
+        }
+
+
+class NullCache(Cache):
+    """Cache that never stores anything"""
+
+    name = 'none'
+
+    def get(self, key):
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+
+class LRUCache(Cache):
+    """Thread-safe bounded LRU with a per-entry TTL
+
+    Values are copied on the way in and out so callers can't mutate cached rows.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        entry = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'evictions': self.evictions
+        })
+        return stats
+
+
+class RedisCache(Cache):
+    """Cache shared by all workers (requires the ``redis`` package)
+
+    Redis errors are logged and treated as misses so the database stays the
+    source of truth.
+    """
+
+    name = 'redis'
+
+    def __init__(self, redis_url: str, ttl_seconds: float = 60, prefix: str = 'ramble:cache:'):
+        super().__init__()
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.error(f"Error reading cache key {key}: {e}")
+            raw = None
+        if raw is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return json.loads(raw)
+
+    def set(self, key, value):
+        try:
+            self.client.setex(self.prefix + key, int(self.ttl_seconds), json.dumps(value, default=str))
+        except Exception as e:
+            logger.error(f"Error writing cache key {key}: {e}")
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            deleted = self.client.delete(*(self.prefix + key for key in keys))
+            self._count('invalidations', deleted)
+        except Exception as e:
+            logger.error(f"Error invalidating cache keys {keys}: {e}")
+
+
+def create_cache(backend_name: str = None) -> Cache:
+    """Build the cache selected by CACHE_BACKEND, falling back to in-memory"""
+    backend_name = (backend_name or os.environ.get('CACHE_BACKEND', 'memory')).lower()
+    ttl_seconds = float(os.environ.get('CACHE_TTL_SECONDS', 60))
+
+    if backend_name == 'none':
+        return NullCache()
+
+    if backend_name == 'redis':
+        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        try:
+            cache = RedisCache(redis_url, ttl_seconds=ttl_seconds)
+            logger.info("Redis cache initialized successfully")
+            return cache
+        except Exception as e:
+            logger.error(f"Failed to initialize Redis cache, using in-memory cache: {e}")
+    elif backend_name != 'memory':
+        logger.error(f"Unknown CACHE_BACKEND '{backend_name}', using in-memory cache")
+
+    return LRUCache(
+        max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        ttl_seconds=ttl_seconds
+    )
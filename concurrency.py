@@ -0,0 +1,46 @@
+"""
+Support for running the async chat views under different gunicorn workers
+
+Thread workers (GUNICORN_WORKER_CLASS=gthread, or the Flask dev server) run
+each async view on a per-request event loop via asgiref, and
+AsyncDatabaseManager offloads backend calls to a thread pool.
+
+Under gevent workers (start.sh's default) every request is a greenlet
+and blocking socket I/O already yields to other requests, so one process keeps
+hundreds of Supabase/LinkedIn calls in flight. asyncio cannot run a loop per
+greenlet, so in that mode database calls run inline and view coroutines are
+driven to completion directly in the request's greenlet.
+"""
+from flask import Flask
+
+
+def gevent_active() -> bool:
+    """Whether this process runs under gevent's monkey-patched sockets"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def run_inline(coroutine):
+    """Run a coroutine that never suspends (all its awaits complete inline)"""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("Coroutine suspended while running inline under gevent")
+
+
+class AsyncFlask(Flask):
+    """Flask app whose async views also run under gevent workers"""
+
+    def async_to_sync(self, func):
+        if not gevent_active():
+            return super().async_to_sync(func)
+
+        def run(*args, **kwargs):
+            return run_inline(func(*args, **kwargs))
+
+        return run
@@ -1,45 +1,255 @@
 """
 Database utilities for Supabase integration
+
+The storage engine behind DatabaseManager is pluggable (see storage.py):
+set DATABASE_BACKEND=sqlite for a local single-node / offline benchmark mode.
 """
 import os
-from supabase import create_client, Client
-from typing import Optional, Dict, Any
+import uuid
+import time
+import asyncio
+import json
+import base64
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Tuple
 import logging
+from storage import StorageBackend, OPERATION_TABLES, EmailConflict, create_backend, conversation_key, NOW, utc_now
+from pubsub import PubSub, get_pubsub, user_channel, group_channel, PRESENCE_CHANNEL
+from concurrency import gevent_active
+from cache import Cache, create_cache, user_id_key, user_email_key, user_linkedin_key, user_groups_key, group_members_key
+from presence import PresenceService, create_presence_store, epoch_to_iso
+from write_queue import WriteBehindQueue, QueueFull, create_message_queue
+from leaderboard import LeaderboardService, create_leaderboard_store
+from quiz import QuizEngine, create_quiz_engine
+from matching import MAX_MATCHES, FeatureSpace, MatchingService
+from metrics import DB_EXECUTOR_WAIT_SECONDS, MESSAGES_DROPPED, InstrumentedBackend, instrument_methods
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Handlers and levels are set by log_config.configure_logging()
 logger = logging.getLogger(__name__)
 
+# Upper bound on a single page of chat history, whatever the caller asks for
+MAX_MESSAGE_PAGE_SIZE = 100
+
+# Users per bulk UPDATE when flushing presence (keeps PostgREST URLs short)
+PRESENCE_FLUSH_CHUNK = 100
+
+# Default and upper bound for a page of the user directory
+USER_PAGE_SIZE = 50
+MAX_USER_PAGE_SIZE = 100
+
+# Default and upper bounds for leaderboard pages and the "my rank +/- k" window
+LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+MAX_LEADERBOARD_AROUND = 25
+
+# Users columns shown on the leaderboard
+LEADERBOARD_USER_FIELDS = ('id', 'first_name', 'surname', 'profile_picture_url')
+
+# Default number of people suggested by the matching engine (at most matching.MAX_MATCHES)
+MATCH_PAGE_SIZE = 10
+
+# Users columns of a directory row (see StorageBackend.list_users)
+DIRECTORY_USER_FIELDS = ('id', 'first_name', 'surname', 'email', 'profile_picture_url', 'is_online',
+                         'last_seen', 'login_method', 'linkedin_id')
+
+
+def encode_cursor(*values) -> str:
+    """Build an opaque keyset cursor from a row's sort key"""
+    raw = json.dumps(list(values), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    """Parse a cursor from encode_cursor with ``size`` values; raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or len(values) != size or values[-1] in (None, ''):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return tuple(values)
+
+
+def encode_message_cursor(message: Dict[str, Any]) -> str:
+    """Cursor for a message's (created_at, id)"""
+    return encode_cursor(message['created_at'], message['id'])
+
+
+def decode_message_cursor(cursor: str) -> Tuple[str, str]:
+    return decode_cursor(cursor, 2)
+
+
+def encode_user_cursor(user: Dict[str, Any], online_first: bool = False) -> str:
+    """Cursor for a directory row's sort key"""
+    if online_first:
+        return encode_cursor(bool(user.get('is_online')), user.get('first_name') or '', user['id'])
+    return encode_cursor(user.get('first_name') or '', user['id'])
+
+
+def decode_user_cursor(cursor: str, online_first: bool = False) -> tuple:
+    return decode_cursor(cursor, 3 if online_first else 2)
+
+
+@instrument_methods
 class DatabaseManager:
-    def __init__(self):
-        """Initialize Supabase client"""
-        self.supabase_url = os.environ.get('SUPABASE_URL')
-        self.supabase_key = os.environ.get('SUPABASE_KEY')
-        
-        if not self.supabase_url or not self.supabase_key:
-            logger.warning("Supabase credentials not found. Database operations will be disabled.")
-            self.supabase: Optional[Client] = None
-        else:
-            try:
-                # Try different initialization methods
+    def __init__(self, backend: Optional[StorageBackend] = None, pubsub: Optional[PubSub] = None,
+                 cache: Optional[Cache] = None, presence: Optional[PresenceService] = None,
+                 message_queue: Optional[WriteBehindQueue] = None, leaderboard: Optional[LeaderboardService] = None,
+                 quiz: Optional[QuizEngine] = None, matching: Optional[MatchingService] = None):
+        """Initialize the configured storage backend, event broker, lookup cache, presence tracker,
+        (optional) message write-behind queue, leaderboard, quiz engine and matching engine"""
+        backend = backend if backend is not None else create_backend()
+        self.backend: Optional[StorageBackend] = (
+            InstrumentedBackend(backend, OPERATION_TABLES) if backend is not None else None
+        )
+        self.pubsub: PubSub = pubsub if pubsub is not None else get_pubsub()
+        self.cache: Cache = cache if cache is not None else create_cache()
+        self.presence: PresenceService = presence if presence is not None else PresenceService(
+            create_presence_store(),
+            ttl_seconds=float(os.environ.get('PRESENCE_TTL_SECONDS', 45)),
+            flush_seconds=float(os.environ.get('PRESENCE_FLUSH_SECONDS', 30)),
+            on_change=self._on_presence_change,
+            flush=self._flush_presence
+        )
+        self.message_queue: Optional[WriteBehindQueue] = (
+            message_queue if message_queue is not None else create_message_queue(self._write_messages,
+                                                                                 on_drop=self._on_message_dropped)
+        )
+        self.leaderboard: LeaderboardService = leaderboard if leaderboard is not None else LeaderboardService(
+            create_leaderboard_store(),
+            load=self._load_scores,
+            refresh_seconds=float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 300))
+        )
+        self.quiz: QuizEngine = quiz if quiz is not None else create_quiz_engine(self._record_quiz_results)
+        self.matching: MatchingService = matching if matching is not None else MatchingService(
+            FeatureSpace(self.quiz.quizzes),
+            load=self._load_matching_data,
+            refresh_seconds=float(os.environ.get('MATCHING_REFRESH_SECONDS', 600)),
+            max_lists=int(os.environ.get('MATCHING_CACHE_SIZE', 10000))
+        )
+
+    def _on_presence_change(self, user_id: str, is_online: bool, timestamp: float):
+        """Broadcast an online/offline transition"""
+        self._publish(PRESENCE_CHANNEL, 'presence', {
+            'user_id': user_id,
+            'is_online': is_online,
+            'last_seen': epoch_to_iso(timestamp)
+        })
+
+    def _flush_presence(self, seen_ids: list, gone_ids: list):
+        """Persist presence changes with one bulk UPDATE per chunk of users"""
+        if not self.is_connected():
+            return
+        for user_ids, is_online in ((seen_ids, True), (gone_ids, False)):
+            for start in range(0, len(user_ids), PRESENCE_FLUSH_CHUNK):
+                chunk = user_ids[start:start + PRESENCE_FLUSH_CHUNK]
                 try:
-                    self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
-                except TypeError:
-                    # Fallback for different client versions
-                    self.supabase: Client = create_client(
-                        supabase_url=self.supabase_url,
-                        supabase_key=self.supabase_key
-                    )
-                logger.info("Supabase client initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize Supabase client: {e}")
-                logger.error(f"URL: {self.supabase_url}")
-                logger.error(f"Key: {self.supabase_key[:20]}...")
-                self.supabase = None
+                    self.backend.bulk_update_users(chunk, {'is_online': is_online, 'last_seen': NOW})
+                except Exception as e:
+                    logger.error(f"Error flushing presence for {len(chunk)} users: {e}")
+
+    def _load_scores(self) -> Dict[str, int]:
+        """Every user's points, for (re)loading the leaderboard"""
+        if not self.is_connected():
+            return {}
+        return {row['id']: row.get('points') or 0 for row in self.backend.list_scores()}
+
+    def _track_points(self, user: Optional[Dict[str, Any]]):
+        """Mirror a written users row's points into the leaderboard"""
+        if not user or 'points' not in user:
+            return
+        try:
+            self.leaderboard.set_points(user['id'], user['points'] or 0)
+        except Exception as e:
+            logger.error(f"Error updating leaderboard: {e}")
+
+    def _load_matching_data(self) -> Tuple[list, list]:
+        """Every user's profile fields and quiz results, for (re)loading the matching index"""
+        if not self.is_connected():
+            return [], []
+        return self.backend.list_profiles(), self.backend.list_quiz_results()
+
+    def _track_profile(self, user: Optional[Dict[str, Any]]):
+        """Re-derive a written users row's matching vector"""
+        if not user or not user.get('id'):
+            return
+        try:
+            self.matching.update_profile(user)
+        except Exception as e:
+            logger.error(f"Error updating matching index: {e}")
+
+    def _cached(self, key: str, loader):
+        """Read-through lookup; None results are not cached"""
+        value = self.cache.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.cache.set(key, value)
+        return value
+
+    def _invalidate_user(self, *users: Optional[Dict[str, Any]]):
+        """Drop cached lookups for user rows (pass the old and new row when email or linkedin_id changed)"""
+        keys = set()
+        for user in filter(None, users):
+            if user.get('id'):
+                keys.add(user_id_key(user['id']))
+            if user.get('email'):
+                keys.add(user_email_key(user['email']))
+            if user.get('linkedin_id'):
+                keys.add(user_linkedin_key(user['linkedin_id']))
+        if keys:
+            self.cache.delete(*keys)
+
+    def start_refreshers(self):
+        """Load the leaderboard and matching index now and reload them on background threads
+
+        Called once at startup so no request waits for a reload.
+        """
+        if not self.is_connected():
+            return
+        self.leaderboard.start_refresher()
+        self.matching.start_refresher()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the lookup cache"""
+        return self.cache.stats()
+
+    def _publish(self, channel: str, event: str, data: Dict[str, Any]):
+        """Publish a real-time event; a broker failure never fails the write"""
+        try:
+            self.pubsub.publish(channel, event, data)
+        except Exception as e:
+            logger.error(f"Error publishing {event} event: {e}")
+
+    def _publish_joined(self, group_id: str, user_ids: list):
+        """Tell each user's open streams to start relaying a group they just joined"""
+        for user_id in user_ids:
+            self._publish(user_channel(user_id), 'group_joined', {'group_id': group_id, 'user_id': user_id})
+
+    def _with_sender(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """The message with its sender embedded as ``users``, the shape list_messages returns"""
+        sender = self.get_user_by_id(message['sender_id']) or {}
+        return {**message, 'users': {
+            'id': message['sender_id'],
+            'first_name': sender.get('first_name'),
+            'surname': sender.get('surname'),
+            'profile_picture_url': sender.get('profile_picture_url')
+        }}
+
+    def _publish_message(self, message: Dict[str, Any]):
+        """Deliver a stored message to its group, or to both sides of a private chat"""
+        if message.get('group_id'):
+            self._publish(group_channel(message['group_id']), 'message', message)
+        elif message.get('recipient_id'):
+            self._publish(user_channel(message['recipient_id']), 'message', message)
+            self._publish(user_channel(message['sender_id']), 'message', message)
 
     def is_connected(self) -> bool:
         """Check if database connection is available"""
-        return self.supabase is not None
+        return self.backend is not None
 
     def create_user(self, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a new user in the database"""
@@ -66,11 +276,14 @@ class DatabaseManager:
             # Remove None values
             db_user_data = {k: v for k, v in db_user_data.items() if v is not None}
             
-            result = self.supabase.table('users').insert(db_user_data).execute()
+            user = self.backend.insert_user(db_user_data)
             
-            if result.data:
-                logger.info(f"User created successfully: {user_data.get('email')}")
-                return result.data[0]
+            if user:
+                logger.info("User created: %s", user['id'], extra={'event': 'user_created'})
+                self._invalidate_user(user)
+                self._track_points(user)
+                self._track_profile(user)
+                return user
             else:
                 logger.error("Failed to create user: No data returned")
                 return None
@@ -79,6 +292,19 @@ class DatabaseManager:
             logger.error(f"Error creating user: {e}")
             return None
 
+    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get user by ID (loads the signed-in user on every request, so it is cached)"""
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot get user.")
+            return None
+        
+        try:
+            return self._cached(user_id_key(user_id), lambda: self.backend.find_user(id=user_id))
+                
+        except Exception as e:
+            logger.error(f"Error getting user by ID: {e}")
+            return None
+
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get user by email address"""
         if not self.is_connected():
@@ -86,12 +312,7 @@ class DatabaseManager:
             return None
         
         try:
-            result = self.supabase.table('users').select('*').eq('email', email).execute()
-            
-            if result.data and len(result.data) > 0:
-                return result.data[0]
-            else:
-                return None
+            return self._cached(user_email_key(email), lambda: self.backend.find_user(email=email))
                 
         except Exception as e:
             logger.error(f"Error getting user by email: {e}")
@@ -104,15 +325,56 @@ class DatabaseManager:
             return None
         
         try:
-            result = self.supabase.table('users').select('*').eq('linkedin_id', linkedin_id).execute()
+            return self._cached(user_linkedin_key(linkedin_id), lambda: self.backend.find_user(linkedin_id=linkedin_id))
+                
+        except Exception as e:
+            logger.error(f"Error getting user by LinkedIn ID: {e}")
+            return None
+
+    def upsert_linkedin_user(self, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Create or refresh a LinkedIn user in one round trip and return the row
+
+        ``user_data`` takes the create_user keys (firstName, surname, email,
+        profile_picture_url, points, rank) plus linkedin_id. A returning user
+        gets their name and picture refreshed; points, rank and email are only
+        used for a new user. A user who registered with the same email (signup
+        or attendee import) gets the linkedin_id attached instead of a second
+        account. Safe against two logins of the same member racing.
+
+        Raises EmailConflict for a new member without an email, or whose email
+        belongs to a user linked to another LinkedIn account; that user is
+        left untouched.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot upsert user.")
+            return None
+        
+        try:
+            user = self.backend.upsert_linkedin_user({
+                'linkedin_id': user_data['linkedin_id'],
+                'email': user_data.get('email'),
+                'first_name': user_data.get('firstName'),
+                'surname': user_data.get('surname'),
+                'profile_picture_url': user_data.get('profile_picture_url'),
+                'points': user_data.get('points', 0),
+                'rank': user_data.get('rank', 1)
+            })
             
-            if result.data and len(result.data) > 0:
-                return result.data[0]
+            if user:
+                logger.info("LinkedIn user signed in: %s", user['id'], extra={'event': 'linkedin_user_upserted'})
+                self._invalidate_user(user)
+                self._track_points(user)
+                self._track_profile(user)
+                return user
             else:
+                logger.error("Failed to upsert LinkedIn user: No data returned")
                 return None
                 
+        except EmailConflict as e:
+            logger.warning(f"LinkedIn login of {user_data['linkedin_id']} refused: {e}")
+            raise
         except Exception as e:
-            logger.error(f"Error getting user by LinkedIn ID: {e}")
+            logger.error(f"Error upserting LinkedIn user: {e}")
             return None
 
     def authenticate_user(self, email: str, password: str) -> Optional[Dict[str, Any]]:
@@ -122,13 +384,13 @@ class DatabaseManager:
             return None
         
         try:
-            result = self.supabase.table('users').select('*').eq('email', email).eq('password', password).execute()
+            user = self.backend.find_user(email=email, password=password)
             
-            if result.data and len(result.data) > 0:
-                logger.info(f"User authenticated successfully: {email}")
-                return result.data[0]
+            if user:
+                logger.info("User authenticated: %s", user['id'], extra={'event': 'user_authenticated'})
+                return user
             else:
-                logger.warning(f"Authentication failed for email: {email}")
+                logger.warning("Authentication failed for email: %s", email)
                 return None
                 
         except Exception as e:
@@ -142,11 +404,17 @@ class DatabaseManager:
             return None
         
         try:
-            result = self.supabase.table('users').update(update_data).eq('id', user_id).execute()
+            # The lookups cached under the old email/linkedin_id must go too
+            previous = self.backend.find_user(id=user_id) if update_data.keys() & {'email', 'linkedin_id'} else None
+            user = self.backend.update_user(user_id, update_data)
             
-            if result.data:
-                logger.info(f"User updated successfully: {user_id}")
-                return result.data[0]
+            if user:
+                logger.info("User updated: %s", user_id, extra={'event': 'user_updated'})
+                self._invalidate_user(previous, user)
+                self._track_points(user)
+                if 'birthday' in update_data:
+                    self._track_profile(user)
+                return user
             else:
                 logger.error("Failed to update user: No data returned")
                 return None
@@ -155,24 +423,202 @@ class DatabaseManager:
             logger.error(f"Error updating user: {e}")
             return None
 
+    def import_users(self, users: list) -> Optional[Dict[str, Any]]:
+        """Create many users (users rows with the same columns) in one batch
+
+        Emails that are already registered are looked up in one query and
+        skipped. Returns ``{'existing': set of emails, 'created': rows}``; rows
+        that were neither created nor existing lost a race or clashed on
+        linkedin_id. None if the batch failed.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot import users.")
+            return None
+        
+        try:
+            existing = self.backend.find_emails([user['email'] for user in users])
+            new_users = [user for user in users if user['email'] not in existing]
+            created = self.backend.insert_users(new_users) if new_users else []
+            logger.info("Imported %d users (%d already registered)", len(created), len(existing),
+                        extra={'event': 'users_imported'})
+            
+            if created:
+                try:
+                    self.leaderboard.set_many_points({user['id']: user.get('points') or 0 for user in created})
+                except Exception as e:
+                    logger.error(f"Error updating leaderboard: {e}")
+                try:
+                    self.matching.update_profiles(created)
+                except Exception as e:
+                    logger.error(f"Error updating matching index: {e}")
+            return {'existing': existing, 'created': created}
+            
+        except Exception as e:
+            logger.error(f"Error importing users: {e}")
+            return None
+
+    def _users_by_id(self, user_ids: list) -> Dict[str, Dict[str, Any]]:
+        """Users rows by id, read through the cache with one backend query for all misses"""
+        users = {}
+        for user_id in user_ids:
+            user = self.cache.get(user_id_key(user_id))
+            if user is not None:
+                users[user_id] = user
+        missing = [user_id for user_id in user_ids if user_id not in users]
+        if missing:
+            for user in self.backend.find_users(missing):
+                self.cache.set(user_id_key(user['id']), user)
+                users[user['id']] = user
+        return users
+
+    def get_user_rank(self, user_id: str) -> Optional[int]:
+        """Leaderboard rank of a user (1 = most points), or None if unknown"""
+        try:
+            return self.leaderboard.rank(user_id)
+        except Exception as e:
+            logger.error(f"Error getting user rank: {e}")
+            return None
+
+    def get_leaderboard(self, user_id: str = None, limit: int = LEADERBOARD_SIZE,
+                        around: int = 0) -> Optional[Dict[str, Any]]:
+        """Top ``limit`` users and, for ``user_id``, their rank and ``around`` neighbours on each side
+
+        Ranking comes from the leaderboard mirror of users.points, so no query
+        sorts the users table; only the profiles of the returned users are read.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot get leaderboard.")
+            return None
+
+        try:
+            limit = max(1, min(limit, MAX_LEADERBOARD_SIZE))
+            around = max(0, min(around, MAX_LEADERBOARD_AROUND))
+            top = self.leaderboard.top(limit)
+            nearby = self.leaderboard.around(user_id, around) if user_id else []
+            me = next((row for row in nearby if row['user_id'] == user_id), None)
+
+            users = self._users_by_id(list({row['user_id'] for row in top + nearby}))
+            for row in top + nearby:
+                user = users.get(row['user_id']) or {}
+                row.update({field: user.get(field) for field in LEADERBOARD_USER_FIELDS if field != 'id'})
+
+            return {
+                'total': self.leaderboard.count(),
+                'top': top,
+                'me': me,
+                'around': nearby if around else []
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting leaderboard: {e}")
+            return None
+
+    # Quizzes
+    def _record_quiz_results(self, quiz_id: str, results: list) -> list:
+        """Write one scored batch of quiz submissions (called from the quiz writer thread)"""
+        if not self.is_connected():
+            raise RuntimeError("Database not connected")
+        users = self.backend.record_quiz_results(quiz_id, results)
+        for user in users:
+            self._invalidate_user(user)
+            self._track_points(user)
+        recorded = {user['id'] for user in users}
+        try:
+            self.matching.record_results(quiz_id, [result for result in results if result['user_id'] in recorded])
+        except Exception as e:
+            logger.error(f"Error updating matching index: {e}")
+        return users
+
+    def get_quiz(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        """Questions of a quiz without its scoring key, or None if there is no such quiz"""
+        quiz = self.quiz.get(quiz_id)
+        return quiz.public() if quiz else None
+
+    def submit_quiz(self, user_id: str, quiz_id: str, answers: list) -> Optional[Dict[str, Any]]:
+        """Score a user's answers and award the points on their first completion
+
+        The submission is scored and written together with the others that
+        arrive within the same few milliseconds. Raises ValueError for an
+        unknown quiz or malformed answers; returns None if it couldn't be
+        recorded.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot submit quiz.")
+            return None
+
+        try:
+            return self.quiz.submit(user_id, quiz_id, answers)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error submitting quiz: {e}")
+            return None
+
+    def get_quiz_stats(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        """Answer distribution per question of a quiz, from its running answer counts"""
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot get quiz stats.")
+            return None
+
+        quiz = self.quiz.get(quiz_id)
+        if quiz is None:
+            return None
+        try:
+            return quiz.distribution(self.backend.list_quiz_answer_counts(quiz_id))
+        except Exception as e:
+            logger.error(f"Error getting quiz stats: {e}")
+            return None
+
     # Chat-related methods
-    def get_all_users(self, exclude_user_id: str = None) -> list:
-        """Get all users for user discovery"""
+    def get_matches(self, user_id: str, limit: int = MATCH_PAGE_SIZE) -> list:
+        """Users most similar to ``user_id`` by quiz answers and profile, best first
+
+        Rows have the directory columns plus ``match_score`` (cosine similarity,
+        0-1). Users with nothing in common are left out, so the list can be
+        short or empty.
+        """
         if not self.is_connected():
-            logger.warning("Database not connected. Cannot get users.")
+            logger.warning("Database not connected. Cannot get matches.")
+            return []
+
+        try:
+            limit = max(1, min(limit, MAX_MATCHES))
+            matches = self.matching.matches(user_id, limit)
+            users = self._users_by_id([other for other, _ in matches])
+            rows = [
+                {**{field: users[other].get(field) for field in DIRECTORY_USER_FIELDS}, 'match_score': round(score, 4)}
+                for other, score in matches if other in users
+            ]
+            return self.presence.merge(rows)
+
+        except Exception as e:
+            logger.error(f"Error getting matches: {e}")
             return []
+
+    def get_all_users(self, exclude_user_id: str = None, search: str = None, limit: int = USER_PAGE_SIZE,
+                      cursor: Optional[tuple] = None, online_first: bool = False) -> Tuple[list, Optional[str]]:
+        """Get a page of users for user discovery, and the cursor of the next page (None on the last)
+
+        ``search`` is a name/email prefix, ``cursor`` the decoded
+        encode_user_cursor of the previous page's last row, and
+        ``online_first`` lists online users before offline ones.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot get users.")
+            return [], None
         
         try:
-            query = self.supabase.table('users').select('id, first_name, surname, email, profile_picture_url, is_online, last_seen, login_method, linkedin_id')
-            if exclude_user_id:
-                query = query.neq('id', exclude_user_id)
-            
-            result = query.execute()
-            return result.data if result.data else []
+            limit = max(1, min(limit, MAX_USER_PAGE_SIZE))
+            users = self.backend.list_users(exclude_user_id=exclude_user_id, search=search or None, limit=limit,
+                                            after=cursor, online_first=online_first)
+            # The page was sorted on the stored is_online, so the cursor is built before the
+            # live presence flags are overlaid; otherwise paging repeats or skips rows
+            next_cursor = encode_user_cursor(users[-1], online_first) if len(users) == limit else None
+            return self.presence.merge(users), next_cursor
                 
         except Exception as e:
             logger.error(f"Error getting users: {e}")
-            return []
+            return [], None
 
     def create_group(self, group_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a new group"""
@@ -181,11 +627,44 @@ class DatabaseManager:
             return None
         
         try:
-            result = self.supabase.table('groups').insert(group_data).execute()
+            group = self.backend.insert_group(group_data)
             
-            if result.data:
-                logger.info(f"Group created successfully: {group_data.get('name')}")
-                return result.data[0]
+            if group:
+                logger.info("Group created: %s", group['id'], extra={'event': 'group_created'})
+                if group.get('created_by'):
+                    self.cache.delete(user_groups_key(group['created_by']))
+                return group
+            else:
+                logger.error("Failed to create group: No data returned")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error creating group: {e}")
+            return None
+
+    def create_group_with_owner(self, group_data: Dict[str, Any], member_ids: list = None) -> Optional[Dict[str, Any]]:
+        """Create a group with its creator (``created_by``) as admin and optional initial members
+
+        The group and all memberships are written in one transaction, so a
+        failure never leaves a group without its admin.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot create group.")
+            return None
+        
+        try:
+            member_ids = [user_id for user_id in dict.fromkeys(member_ids or []) if user_id != group_data['created_by']]
+            group = self.backend.insert_group_with_owner(group_data, member_ids)
+            
+            if group:
+                logger.info("Group created with %d members: %s", len(member_ids) + 1, group['id'],
+                            extra={'event': 'group_created'})
+                self.cache.delete(
+                    group_members_key(group['id']),
+                    *(user_groups_key(user_id) for user_id in [group_data['created_by'], *member_ids])
+                )
+                self._publish_joined(group['id'], [group_data['created_by'], *member_ids])
+                return group
             else:
                 logger.error("Failed to create group: No data returned")
                 return None
@@ -207,10 +686,12 @@ class DatabaseManager:
                 'role': role
             }
             
-            result = self.supabase.table('group_members').insert(member_data).execute()
+            member = self.backend.insert_group_member(member_data)
             
-            if result.data:
-                logger.info(f"User {user_id} added to group {group_id}")
+            if member:
+                logger.info("User %s added to group %s", user_id, group_id, extra={'event': 'group_member_added'})
+                self.cache.delete(group_members_key(group_id), user_groups_key(user_id))
+                self._publish_joined(group_id, [user_id])
                 return True
             else:
                 logger.error("Failed to add group member: No data returned")
@@ -227,12 +708,7 @@ class DatabaseManager:
             return []
         
         try:
-            result = self.supabase.table('group_members').select('''
-                group_id,
-                groups!inner(id, name, description, created_by, is_private, created_at)
-            ''').eq('user_id', user_id).execute()
-            
-            return result.data if result.data else []
+            return self._cached(user_groups_key(user_id), lambda: self.backend.list_user_groups(user_id))
                 
         except Exception as e:
             logger.error(f"Error getting user groups: {e}")
@@ -245,14 +721,8 @@ class DatabaseManager:
             return []
         
         try:
-            result = self.supabase.table('group_members').select('''
-                user_id,
-                role,
-                joined_at,
-                users!inner(id, first_name, surname, email, profile_picture_url, is_online, last_seen)
-            ''').eq('group_id', group_id).execute()
-            
-            return result.data if result.data else []
+            members = self._cached(group_members_key(group_id), lambda: self.backend.list_group_members(group_id))
+            return self.presence.merge(members, nested='users')
                 
         except Exception as e:
             logger.error(f"Error getting group members: {e}")
@@ -265,11 +735,13 @@ class DatabaseManager:
             return None
         
         try:
-            result = self.supabase.table('messages').insert(message_data).execute()
+            message = self.backend.insert_message(message_data)
             
-            if result.data:
-                logger.info(f"Message sent successfully")
-                return result.data[0]
+            if message:
+                logger.info("Message sent: %s", message.get('id'), extra={'event': 'message_sent'})
+                message = self._with_sender(message)
+                self._publish_message(message)
+                return message
             else:
                 logger.error("Failed to send message: No data returned")
                 return None
@@ -278,35 +750,149 @@ class DatabaseManager:
             logger.error(f"Error sending message: {e}")
             return None
 
-    def get_messages(self, group_id: str = None, recipient_id: str = None, limit: int = 50) -> list:
-        """Get messages for a group or private conversation"""
+    def enqueue_message(self, message_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Queue a message for a batched insert and return it with its final id, timestamp and sender
+
+        Returns None when write-behind is disabled or the queue is full; the
+        caller should then fall back to send_message. ``message_data['id']``
+        may carry a client-generated UUID, which makes resends idempotent.
+        """
+        if self.message_queue is None or not self.is_connected():
+            return None
+        message_data = self._with_sender(message_data)
+
+        def prepare(row):
+            # Assigned under the queue lock so created_at follows insert order
+            row.setdefault('id', str(uuid.uuid4()))
+            row['created_at'] = utc_now()
+            return row
+
+        try:
+            return self.message_queue.enqueue(message_data, prepare=prepare)
+        except QueueFull:
+            logger.warning("Message queue is full, inserting synchronously")
+            return None
+
+    def _write_messages(self, messages: list):
+        """Flush a batch from the message queue, then announce the messages"""
+        columns = set().union(*messages) - {'users'}
+        rows = [{column: message.get(column) for column in columns} for message in messages]
+        self.backend.insert_messages(rows)
+        logger.info("Inserted batch of %d messages", len(rows), extra={'event': 'messages_inserted'})
+        for message in messages:
+            self._publish_message(message)
+
+    def _on_message_dropped(self, message: Dict[str, Any], error: Exception):
+        """A queued (already acknowledged) message could not be stored"""
+        MESSAGES_DROPPED.inc()
+        logger.error("Dropped queued message %s from %s: %s", message.get('id'), message.get('sender_id'), error,
+                     extra={'event': 'message_dropped'})
+
+    def flush_messages(self):
+        """Write any queued messages now"""
+        if self.message_queue is not None:
+            self.message_queue.drain()
+
+    def message_queue_stats(self) -> Dict[str, Any]:
+        """Depth and batch-size metrics of the message write-behind queue"""
+        if self.message_queue is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.message_queue.stats()}
+
+    def get_messages(self, group_id: str, limit: int = 50,
+                     before: Optional[Tuple[str, str]] = None, after: Optional[Tuple[str, str]] = None) -> list:
+        """Get a group's messages, newest first
+
+        ``before`` pages back through history and ``after`` fetches only newer
+        messages; both are (created_at, id) keyset cursors.
+        """
         if not self.is_connected():
             logger.warning("Database not connected. Cannot get messages.")
             return []
         
         try:
-            query = self.supabase.table('messages').select('''
-                id,
-                content,
-                message_type,
-                is_read,
-                created_at,
-                sender_id,
-                users!inner(id, first_name, surname, profile_picture_url)
-            ''').order('created_at', desc=True).limit(limit)
-            
-            if group_id:
-                query = query.eq('group_id', group_id)
-            elif recipient_id:
-                query = query.eq('recipient_id', recipient_id)
-            
-            result = query.execute()
-            return result.data if result.data else []
+            limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+            return self.backend.list_messages(group_id=group_id, limit=limit, before=before, after=after)
                 
         except Exception as e:
             logger.error(f"Error getting messages: {e}")
             return []
 
+    def get_conversation(self, user_a: str, user_b: str, limit: int = 50,
+                         before: Optional[Tuple[str, str]] = None, after: Optional[Tuple[str, str]] = None) -> list:
+        """Get the private messages between two users (both directions), newest first
+
+        The thread is looked up by its canonical conversation key, so it is a
+        single index range scan. ``before``/``after`` work as in get_messages.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot get conversation.")
+            return []
+
+        try:
+            limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+            return self.backend.list_messages(conversation=conversation_key(user_a, user_b), limit=limit,
+                                              before=before, after=after)
+
+        except Exception as e:
+            logger.error(f"Error getting conversation: {e}")
+            return []
+
+    def get_unread(self, user_id: str) -> list:
+        """Unread counters and last-read cursors of every chat with unread messages for a user
+
+        Counters are kept up to date as messages are written, so this reads
+        one row per chat and never counts messages.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot get unread counts.")
+            return []
+
+        try:
+            return self.backend.list_unread(user_id)
+        except Exception as e:
+            logger.error(f"Error getting unread counts: {e}")
+            return []
+
+    def mark_read(self, user_id: str, chat_type: str, chat_id: str,
+                  cursor: Optional[Tuple[str, str]] = None) -> Optional[int]:
+        """Mark a private or group chat read up to ``cursor`` (default: its newest message)
+
+        Returns the number of messages still unread in the chat, or None on
+        failure. The user's other sessions and, for private chats, the other
+        user (as a read receipt) get a ``read`` event.
+        """
+        if not self.is_connected():
+            logger.warning("Database not connected. Cannot mark chat read.")
+            return None
+
+        try:
+            if cursor is None:
+                if chat_type == 'user':
+                    newest = self.backend.list_messages(conversation=conversation_key(user_id, chat_id), limit=1)
+                else:
+                    newest = self.backend.list_messages(group_id=chat_id, limit=1)
+                if not newest:
+                    return 0
+                cursor = (newest[0]['created_at'], newest[0]['id'])
+
+            unread = self.backend.mark_read(user_id, chat_type, chat_id, *cursor)
+            receipt = {
+                'user_id': user_id,
+                'chat_type': chat_type,
+                'chat_id': chat_id,
+                'last_read_at': cursor[0],
+                'last_read_message_id': cursor[1]
+            }
+            self._publish(user_channel(user_id), 'read', {**receipt, 'unread_count': unread})
+            if chat_type == 'user':
+                self._publish(user_channel(chat_id), 'read', receipt)
+            return unread
+
+        except Exception as e:
+            logger.error(f"Error marking chat read: {e}")
+            return None
+
     def create_group_invitation(self, invitation_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a group invitation"""
         if not self.is_connected():
@@ -314,11 +900,12 @@ class DatabaseManager:
             return None
         
         try:
-            result = self.supabase.table('group_invitations').insert(invitation_data).execute()
+            invitation = self.backend.insert_invitation(invitation_data)
             
-            if result.data:
-                logger.info(f"Group invitation created successfully")
-                return result.data[0]
+            if invitation:
+                logger.info("Group invitation created: %s", invitation.get('id'), extra={'event': 'invitation_created'})
+                self._publish(user_channel(invitation['invited_user_id']), 'invitation', invitation)
+                return invitation
             else:
                 logger.error("Failed to create invitation: No data returned")
                 return None
@@ -334,17 +921,7 @@ class DatabaseManager:
             return []
         
         try:
-            result = self.supabase.table('group_invitations').select('''
-                id,
-                group_id,
-                invited_by,
-                status,
-                created_at,
-                groups!inner(id, name, description),
-                users!inner(id, first_name, surname)
-            ''').eq('invited_user_id', user_id).eq('status', 'pending').execute()
-            
-            return result.data if result.data else []
+            return self.backend.list_pending_invitations(user_id)
                 
         except Exception as e:
             logger.error(f"Error getting invitations: {e}")
@@ -359,13 +936,13 @@ class DatabaseManager:
         try:
             update_data = {
                 'status': status,
-                'responded_at': 'now()'
+                'responded_at': NOW
             }
             
-            result = self.supabase.table('group_invitations').update(update_data).eq('id', invitation_id).execute()
+            invitation = self.backend.update_invitation(invitation_id, update_data)
             
-            if result.data:
-                logger.info(f"Invitation {invitation_id} {status}")
+            if invitation:
+                logger.info("Invitation %s %s", invitation_id, status, extra={'event': 'invitation_answered'})
                 return True
             else:
                 logger.error("Failed to respond to invitation: No data returned")
@@ -375,26 +952,46 @@ class DatabaseManager:
             logger.error(f"Error responding to invitation: {e}")
             return False
 
-    def update_user_online_status(self, user_id: str, is_online: bool) -> bool:
-        """Update user's online status"""
+    def accept_invitation(self, invitation_id: str, user_id: str) -> Optional[str]:
+        """Accept a group invitation and join the group in one round trip
+
+        Returns the group id, or None if the invitation isn't the user's to
+        accept. Safe to repeat (e.g. a double click): the second call returns
+        the same group id without adding a second membership.
+        """
         if not self.is_connected():
-            logger.warning("Database not connected. Cannot update online status.")
-            return False
+            logger.warning("Database not connected. Cannot accept invitation.")
+            return None
         
         try:
-            update_data = {
-                'is_online': is_online,
-                'last_seen': 'now()'
-            }
-            
-            result = self.supabase.table('users').update(update_data).eq('id', user_id).execute()
+            group_id = self.backend.accept_invitation(invitation_id, user_id)
             
-            if result.data:
-                logger.info(f"User {user_id} online status updated to {is_online}")
-                return True
+            if group_id:
+                logger.info("Invitation %s accepted, user %s joined group %s", invitation_id, user_id, group_id,
+                            extra={'event': 'invitation_accepted'})
+                self.cache.delete(group_members_key(group_id), user_groups_key(user_id))
+                self._publish_joined(group_id, [user_id])
+                return group_id
             else:
-                logger.error("Failed to update online status: No data returned")
-                return False
+                logger.warning(f"Invitation {invitation_id} cannot be accepted by user {user_id}")
+                return None
+                
+        except Exception as e:
+            logger.error(f"Error accepting invitation: {e}")
+            return None
+
+    def update_user_online_status(self, user_id: str, is_online: bool) -> bool:
+        """Record a presence heartbeat (or sign-off) for a user
+
+        Presence lives in the presence store; the users table is updated in
+        periodic batches by the presence flusher rather than on every call.
+        """
+        try:
+            if is_online:
+                self.presence.heartbeat(user_id)
+            else:
+                self.presence.set_offline(user_id)
+            return True
                 
         except Exception as e:
             logger.error(f"Error updating online status: {e}")
@@ -407,93 +1004,53 @@ class DatabaseManager:
             return False
         
         try:
-            # This would typically be done through Supabase dashboard or migrations
-            # For now, we'll just log that tables should be created manually
-            logger.info("Please create the following tables in your Supabase dashboard:")
-            logger.info("""
-            -- Users table
-            CREATE TABLE users (
-                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                first_name VARCHAR(100),
-                middle_name VARCHAR(100),
-                surname VARCHAR(100),
-                birthday DATE,
-                gender VARCHAR(50),
-                password VARCHAR(255),
-                points INTEGER DEFAULT 0,
-                rank INTEGER DEFAULT 1,
-                login_method VARCHAR(50) DEFAULT 'email',
-                linkedin_id VARCHAR(255) UNIQUE,
-                profile_picture_url TEXT,
-                is_online BOOLEAN DEFAULT FALSE,
-                last_seen TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-            );
-
-            -- Groups table
-            CREATE TABLE groups (
-                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                description TEXT,
-                created_by UUID REFERENCES users(id) ON DELETE CASCADE,
-                is_private BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-            );
-
-            -- Group members table
-            CREATE TABLE group_members (
-                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
-                group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
-                user_id UUID REFERENCES users(id) ON DELETE CASCADE,
-                role VARCHAR(50) DEFAULT 'member', -- 'admin', 'member'
-                joined_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                UNIQUE(group_id, user_id)
-            );
-
-            -- Messages table
-            CREATE TABLE messages (
-                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
-                sender_id UUID REFERENCES users(id) ON DELETE CASCADE,
-                group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
-                recipient_id UUID REFERENCES users(id) ON DELETE CASCADE, -- For private messages
-                content TEXT NOT NULL,
-                message_type VARCHAR(50) DEFAULT 'text', -- 'text', 'image', 'file'
-                is_read BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-            );
-
-            -- Group invitations table
-            CREATE TABLE group_invitations (
-                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
-                group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
-                invited_by UUID REFERENCES users(id) ON DELETE CASCADE,
-                invited_user_id UUID REFERENCES users(id) ON DELETE CASCADE,
-                status VARCHAR(50) DEFAULT 'pending', -- 'pending', 'accepted', 'declined'
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                responded_at TIMESTAMP WITH TIME ZONE
-            );
-
-            -- Create indexes for better performance
-            CREATE INDEX idx_messages_group_id ON messages(group_id);
-            CREATE INDEX idx_messages_sender_id ON messages(sender_id);
-            CREATE INDEX idx_messages_recipient_id ON messages(recipient_id);
-            CREATE INDEX idx_messages_created_at ON messages(created_at);
-            CREATE INDEX idx_group_members_group_id ON group_members(group_id);
-            CREATE INDEX idx_group_members_user_id ON group_members(user_id);
-            CREATE INDEX idx_group_invitations_group_id ON group_invitations(group_id);
-            CREATE INDEX idx_group_invitations_invited_user_id ON group_invitations(invited_user_id);
-            """)
-            return True
+            return self.backend.create_tables()
             
         except Exception as e:
             logger.error(f"Error creating tables: {e}")
             return False
 
+class AsyncDatabaseManager:
+    """Awaitable variants of every DatabaseManager method
+
+    ``await async_db.get_user_groups(user_id)`` runs the call on a bounded
+    thread pool, so the event loop serving async views keeps handling other
+    requests while the backend round trip is in flight. Under gevent workers
+    the call runs inline instead; gevent already makes its I/O cooperative.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, max_workers: int = None):
+        self.db_manager = db_manager
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.environ.get('DB_ASYNC_THREADS', 64)),
+            thread_name_prefix='db'
+        )
+
+    def __getattr__(self, name):
+        attribute = getattr(self.db_manager, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        async def call(*args, **kwargs):
+            if gevent_active():
+                return attribute(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            submitted = time.perf_counter()
+
+            def run():
+                DB_EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+                return attribute(*args, **kwargs)
+
+            # Carry context variables (e.g. the request id for logs) onto the pool thread
+            return await loop.run_in_executor(self.executor, contextvars.copy_context().run, run)
+
+        return call
+
+
 # Global database manager instance - will be initialized after environment is loaded
 db_manager = None
+async_db_manager = None
 
 def get_db_manager():
     """Get database manager instance, initializing if needed"""
@@ -501,3 +1058,10 @@ def get_db_manager():
     if db_manager is None:
         db_manager = DatabaseManager()
     return db_manager
+
+def get_async_db_manager():
+    """Get the async wrapper around the database manager, initializing if needed"""
+    global async_db_manager
+    if async_db_manager is None:
+        async_db_manager = AsyncDatabaseManager(get_db_manager())
+    return async_db_manager
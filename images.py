@@ -0,0 +1,205 @@
+"""
+Responsive image derivatives (WebP/AVIF at a few widths)
+
+Raster images under /images/, /public/ and the fingerprinted /assets/ URLs
+accept a ``?w=<pixels>`` parameter. The width is snapped up to one of
+DERIVATIVE_WIDTHS (never above the original). The format is negotiated from
+the Accept header: AVIF, then WebP, then the original format. Derivatives
+are generated with Pillow on first request and cached on disk under
+IMAGE_CACHE_DIR (default build/images). Pre-generate them during the build
+with:
+
+    python images.py
+
+Templates call ``image_url(url, width)`` and JSX calls ``image(url, cssWidth)``
+(which accounts for devicePixelRatio) to build these URLs.
+"""
+import os
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+from flask import request, send_file
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join('build', 'images'))
+
+# Widths derivatives are made at: avatars (24/48 px at 2x), logos, then phone to desktop screens
+DERIVATIVE_WIDTHS = (48, 96, 192, 256, 480, 768, 1080, 1600, 2560)
+
+# Pillow format, file extension and encoder options, in order of preference
+FORMATS = (
+    ('image/avif', 'AVIF', '.avif', {'quality': 50, 'speed': 6}),
+    ('image/webp', 'WEBP', '.webp', {'quality': 75, 'method': 4}),
+)
+ORIGINAL_FORMATS = {
+    '.png': ('image/png', 'PNG', {'optimize': True}),
+    '.jpg': ('image/jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    '.jpeg': ('image/jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Un-fingerprinted URLs are revalidated after a day; fingerprinted ones never change
+MAX_AGE = 24 * 3600
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class ImageDerivatives:
+    """Generates, caches and serves resized/re-encoded copies of raster images"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, widths: Tuple[int, ...] = DERIVATIVE_WIDTHS):
+        self.cache_dir = cache_dir
+        self.widths = widths
+        self._digests: Dict[Tuple[str, float, int], str] = {}
+        self._sizes: Dict[str, Tuple[int, int]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self.formats = [fmt for fmt in FORMATS if self._supported(fmt[1])]
+
+    @staticmethod
+    def _supported(pillow_format: str) -> bool:
+        try:
+            from PIL import features
+        except ImportError:
+            return False
+        return bool(features.check(pillow_format.lower()))
+
+    def _digest(self, path: str) -> str:
+        """Content hash of a source image, cached until the file changes"""
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        if key not in self._digests:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            self._digests[key] = digest.hexdigest()[:16]
+        return self._digests[key]
+
+    def _size(self, path: str, digest: str) -> Tuple[int, int]:
+        if digest not in self._sizes:
+            from PIL import Image
+            with Image.open(path) as image:
+                self._sizes[digest] = image.size
+        return self._sizes[digest]
+
+    def snap_width(self, requested: Optional[int], original_width: int) -> Optional[int]:
+        """Smallest derivative width covering ``requested``; None means full size"""
+        if not requested:
+            return None
+        width = next((width for width in self.widths if width >= requested), None)
+        return width if width is not None and width < original_width else None
+
+    def negotiate(self) -> Optional[tuple]:
+        """Best modern format the client explicitly accepts, or None for the original format"""
+        accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+        return next((fmt for fmt in self.formats if fmt[0] in accepted), None)
+
+    def derivative(self, source: str, digest: str, width: Optional[int], fmt: tuple) -> str:
+        """Path of the cached derivative, generating it on first use"""
+        mimetype, pillow_format, extension, options = fmt
+        target = os.path.join(self.cache_dir, digest[:2], f'{digest}-{width or "full"}{extension}')
+        if os.path.exists(target):
+            return target
+
+        with self._locks_lock:
+            lock = self._locks.setdefault(target, threading.Lock())
+        with lock:
+            if not os.path.exists(target):
+                from PIL import Image
+
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with Image.open(source) as image:
+                    if width:
+                        height = round(image.height * width / image.width)
+                        image = image.resize((width, height), Image.LANCZOS)
+                    if pillow_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                        image = image.convert('RGB')
+                    elif image.mode == 'P':
+                        image = image.convert('RGBA')
+                    temporary = f'{target}.{threading.get_ident()}.tmp'
+                    image.save(temporary, pillow_format, **options)
+                os.replace(temporary, target)
+                logger.info(f"Generated {target} from {source}")
+        return target
+
+    def send(self, source: str, digest: str = None, immutable: bool = False):
+        """Response with the negotiated derivative of ``source``, or None to serve the original
+
+        Only raster images with a ``w`` parameter or a client accepting a
+        modern format get a derivative.
+        """
+        extension = os.path.splitext(source)[1].lower()
+        if extension not in ORIGINAL_FORMATS or not os.path.isfile(source):
+            return None
+        try:
+            requested = int(request.args.get('w', 0))
+        except ValueError:
+            requested = 0
+        fmt = self.negotiate()
+        if not requested and fmt is None:
+            return None
+
+        try:
+            digest = digest or self._digest(source)
+            width = self.snap_width(requested, self._size(source, digest)[0])
+            if fmt is None:
+                if width is None:
+                    return None
+                mimetype, pillow_format, options = ORIGINAL_FORMATS[extension]
+                fmt = (mimetype, pillow_format, extension, options)
+            path = self.derivative(source, digest, width, fmt)
+        except Exception as e:
+            logger.error(f"Error generating derivative of {source}: {e}")
+            return None
+
+        response = send_file(
+            path, mimetype=fmt[0],
+            etag=f'{digest}-{width or "full"}-{fmt[1].lower()}',
+            max_age=IMMUTABLE_MAX_AGE if immutable else MAX_AGE
+        )
+        response.cache_control.public = True
+        if immutable:
+            response.cache_control.immutable = True
+        response.vary.add('Accept')
+        return response
+
+    def pregenerate(self, source_dir: str = 'public'):
+        """Make every width/format derivative of every raster image under ``source_dir``"""
+        count = 0
+        for root, _, files in os.walk(source_dir):
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                extension = os.path.splitext(name)[1].lower()
+                if extension not in ORIGINAL_FORMATS:
+                    continue
+                digest = self._digest(source)
+                original_width = self._size(source, digest)[0]
+                widths = [width for width in self.widths if width < original_width] + [None]
+                mimetype, pillow_format, options = ORIGINAL_FORMATS[extension]
+                formats = self.formats + [(mimetype, pillow_format, extension, options)]
+                for fmt in formats:
+                    for width in widths:
+                        if width is None and fmt[1] == pillow_format:
+                            continue  # the original itself
+                        self.derivative(source, digest, width, fmt)
+                        count += 1
+        return count
+
+
+def init_images(app, derivatives: ImageDerivatives = None) -> ImageDerivatives:
+    """Register the ``image_url`` template helper; returns the derivative service"""
+    derivatives = derivatives or ImageDerivatives()
+
+    def image_url(path: str, width: int) -> str:
+        url = app.jinja_env.globals['asset_url'](path) if 'asset_url' in app.jinja_env.globals else path
+        return f"{url}{'&' if '?' in url else '?'}w={width}"
+
+    app.jinja_env.globals.update(image_url=image_url)
+    return derivatives
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    generated = ImageDerivatives().pregenerate()
+    print(f"Generated {generated} image derivatives into {CACHE_DIR}")
@@ -0,0 +1,328 @@
+"""
+Leaderboard ranking derived from users.points
+
+Points are mirrored into an ordered store so top-N and "my rank +/- k"
+lookups are a binary search or a sorted-set command instead of
+``ORDER BY points`` over every user. The mirror is loaded from the database
+by a background thread at startup, kept current by DatabaseManager whenever
+a user's points change, and reloaded by that thread every
+LEADERBOARD_REFRESH_SECONDS to pick up changes made outside the app (or by
+other workers, for the memory store). Requests never reload it. Points set
+while a reload is reading the database are applied on top of what it read,
+so a reload never rolls them back.
+
+Select the store with the LEADERBOARD_BACKEND environment variable:
+    memory (default) - in-process sorted list; one copy per worker
+    redis            - shared sorted set via REDIS_URL, so every worker agrees
+
+Ranks are competition ranks: users with equal points share a rank ("1, 2, 2, 4").
+"""
+import os
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderboardStore:
+    """Interface implemented by every leaderboard store
+
+    Positions are 0-based offsets in leaderboard order (points descending);
+    ranks are 1-based competition ranks.
+    """
+
+    name = 'base'
+
+    def replace(self, scores: Dict[str, int]):
+        """Swap in a complete set of user id -> points"""
+        raise NotImplementedError
+
+    def set(self, user_id: str, points: int):
+        raise NotImplementedError
+
+    def set_many(self, scores: Dict[str, int]):
+        """Set several users' points (e.g. after a bulk import)"""
+        for user_id, points in scores.items():
+            self.set(user_id, points)
+
+    def remove(self, user_id: str):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def position(self, user_id: str) -> Optional[Tuple[int, int, int]]:
+        """(position, rank, points) of a user, or None if they are not ranked"""
+        raise NotImplementedError
+
+    def entries(self, start: int, stop: int) -> List[Tuple[str, int, int]]:
+        """(user_id, points, rank) for positions ``start`` to ``stop`` (exclusive)"""
+        raise NotImplementedError
+
+
+class InMemoryLeaderboardStore(LeaderboardStore):
+    """Sorted list of (-points, user_id) with a points index
+
+    Lookups are a bisect (O(log n)); an update moves one list slot, which is
+    a memmove of at most n pointers (tens of microseconds at 100k users).
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._points: Dict[str, int] = {}
+        self._order: List[Tuple[int, str]] = []
+
+    def replace(self, scores):
+        order = sorted((-points, user_id) for user_id, points in scores.items())
+        with self._lock:
+            self._points = dict(scores)
+            self._order = order
+
+    def set(self, user_id, points):
+        with self._lock:
+            previous = self._points.get(user_id)
+            if previous == points:
+                return
+            if previous is not None:
+                del self._order[bisect.bisect_left(self._order, (-previous, user_id))]
+            bisect.insort(self._order, (-points, user_id))
+            self._points[user_id] = points
+
+    def remove(self, user_id):
+        with self._lock:
+            previous = self._points.pop(user_id, None)
+            if previous is not None:
+                del self._order[bisect.bisect_left(self._order, (-previous, user_id))]
+
+    def count(self):
+        return len(self._order)
+
+    def _rank(self, points: int) -> int:
+        # (-points,) sorts before every (-points, user_id), so this counts users with more points
+        return bisect.bisect_left(self._order, (-points,)) + 1
+
+    def position(self, user_id):
+        with self._lock:
+            points = self._points.get(user_id)
+            if points is None:
+                return None
+            return bisect.bisect_left(self._order, (-points, user_id)), self._rank(points), points
+
+    def entries(self, start, stop):
+        with self._lock:
+            return [(user_id, -negated, self._rank(-negated)) for negated, user_id in self._order[start:stop]]
+
+
+class RedisLeaderboardStore(LeaderboardStore):
+    """Leaderboard shared by all workers (requires the ``redis`` package)"""
+
+    name = 'redis'
+
+    def __init__(self, redis_url: str, key: str = 'ramble:leaderboard'):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.key = key
+
+    def replace(self, scores):
+        staging = f'{self.key}:loading'
+        items = list(scores.items())
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(staging)
+        for start in range(0, len(items), 1000):
+            pipe.zadd(staging, dict(items[start:start + 1000]))
+        pipe.execute()
+        if items:
+            self.client.rename(staging, self.key)
+        else:
+            self.client.delete(self.key)
+
+    def set(self, user_id, points):
+        self.client.zadd(self.key, {user_id: points})
+
+    def set_many(self, scores):
+        items = list(scores.items())
+        pipe = self.client.pipeline(transaction=False)
+        for start in range(0, len(items), 1000):
+            pipe.zadd(self.key, dict(items[start:start + 1000]))
+        pipe.execute()
+
+    def remove(self, user_id):
+        self.client.zrem(self.key, user_id)
+
+    def count(self):
+        return self.client.zcard(self.key)
+
+    def _ranks(self, points_values) -> Dict[int, int]:
+        points_values = sorted(set(points_values))
+        pipe = self.client.pipeline(transaction=False)
+        for points in points_values:
+            pipe.zcount(self.key, f'({points}', '+inf')
+        return {points: higher + 1 for points, higher in zip(points_values, pipe.execute())}
+
+    def position(self, user_id):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrevrank(self.key, user_id)
+        pipe.zscore(self.key, user_id)
+        position, score = pipe.execute()
+        if position is None or score is None:
+            return None
+        points = int(score)
+        return position, self._ranks([points])[points], points
+
+    def entries(self, start, stop):
+        if stop <= start:
+            return []
+        rows = [(user_id, int(score)) for user_id, score in
+                self.client.zrevrange(self.key, start, stop - 1, withscores=True)]
+        ranks = self._ranks(points for _, points in rows)
+        return [(user_id, points, ranks[points]) for user_id, points in rows]
+
+
+class LeaderboardService:
+    """Top-N and neighbourhood queries over a leaderboard store
+
+    ``load()`` returns every user id -> points from the database. After
+    ``start_refresher()`` it runs on a background thread at startup and every
+    ``refresh_seconds``; without it, the first call loads and nothing reloads.
+    """
+
+    def __init__(self, store: LeaderboardStore, load: Callable[[], Dict[str, int]],
+                 refresh_seconds: float = 300):
+        self.store = store
+        self.load = load
+        self.refresh_seconds = refresh_seconds
+        self._loaded_at: Optional[float] = None
+        self._load_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._refresher_lock = threading.Lock()
+        # Serializes writes with the final swap of a reload; while a reload is
+        # reading the database, writes are also recorded here (None = removed)
+        self._write_lock = threading.Lock()
+        self._written_during_load: Optional[Dict[str, Optional[int]]] = None
+
+    def _reload(self):
+        started = time.perf_counter()
+        with self._write_lock:
+            self._written_during_load = {}
+        try:
+            scores = dict(self.load())
+            with self._write_lock:
+                # The load may have read these users before their latest points were written
+                for user_id, points in self._written_during_load.items():
+                    if points is None:
+                        scores.pop(user_id, None)
+                    else:
+                        scores[user_id] = points
+                self.store.replace(scores)
+        finally:
+            with self._write_lock:
+                self._written_during_load = None
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded leaderboard of {len(scores)} users in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def _ensure_loaded(self):
+        # Loaded by the refresher at startup; callers before that wait for (or do) the first load
+        if self._loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self._reload()
+
+    def start_refresher(self):
+        """Load now and reload every ``refresh_seconds``, on a background thread"""
+        if self._refresher is not None:
+            return
+        with self._refresher_lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._run_refresher, name='leaderboard-refresher', daemon=True)
+                self._refresher.start()
+
+    def _run_refresher(self):
+        self._refresh_safely(initial=True)
+        while self.refresh_seconds:
+            time.sleep(self.refresh_seconds)
+            self._refresh_safely()
+
+    def _refresh_safely(self, initial: bool = False):
+        try:
+            with self._load_lock:
+                if not initial or self._loaded_at is None:
+                    self._reload()
+        except Exception as e:
+            logger.error(f"Error refreshing leaderboard: {e}")
+
+    def set_points(self, user_id: str, points: Optional[int]):
+        """Record a user's new points total (None removes them from the leaderboard)"""
+        self._ensure_loaded()
+        points = None if points is None else int(points)
+        with self._write_lock:
+            if self._written_during_load is not None:
+                self._written_during_load[user_id] = points
+            if points is None:
+                self.store.remove(user_id)
+            else:
+                self.store.set(user_id, points)
+
+    def set_many_points(self, scores: Dict[str, int]):
+        """Record several users' points totals at once"""
+        self._ensure_loaded()
+        scores = {user_id: int(points) for user_id, points in scores.items()}
+        with self._write_lock:
+            if self._written_during_load is not None:
+                self._written_during_load.update(scores)
+            self.store.set_many(scores)
+
+    def remove(self, user_id: str):
+        self.set_points(user_id, None)
+
+    def count(self) -> int:
+        self._ensure_loaded()
+        return self.store.count()
+
+    def rank(self, user_id: str) -> Optional[int]:
+        self._ensure_loaded()
+        found = self.store.position(user_id)
+        return found[1] if found else None
+
+    def _rows(self, start: int, stop: int) -> List[Dict]:
+        return [
+            {'user_id': user_id, 'points': points, 'rank': rank, 'position': start + offset}
+            for offset, (user_id, points, rank) in enumerate(self.store.entries(start, stop))
+        ]
+
+    def top(self, limit: int) -> List[Dict]:
+        """The ``limit`` highest-ranked users"""
+        self._ensure_loaded()
+        return self._rows(0, limit)
+
+    def around(self, user_id: str, k: int) -> List[Dict]:
+        """The user plus up to ``k`` users ranked directly above and below them"""
+        self._ensure_loaded()
+        found = self.store.position(user_id)
+        if found is None:
+            return []
+        start = max(0, found[0] - k)
+        return self._rows(start, found[0] + k + 1)
+
+
+def create_leaderboard_store(backend_name: str = None) -> LeaderboardStore:
+    """Build the store selected by LEADERBOARD_BACKEND, falling back to in-memory"""
+    backend_name = (backend_name or os.environ.get('LEADERBOARD_BACKEND', 'memory')).lower()
+
+    if backend_name == 'redis':
+        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        try:
+            store = RedisLeaderboardStore(redis_url)
+            logger.info("Redis leaderboard store initialized successfully")
+            return store
+        except Exception as e:
+            logger.error(f"Failed to initialize Redis leaderboard store, using in-memory store: {e}")
+    elif backend_name != 'memory':
+        logger.error(f"Unknown LEADERBOARD_BACKEND '{backend_name}', using in-memory store")
+
+    return InMemoryLeaderboardStore()
@@ -0,0 +1,99 @@
+"""
+HTTP client for the LinkedIn OAuth flow
+
+All LinkedIn calls share one pooled requests.Session, so repeated logins reuse
+keep-alive connections instead of paying a TCP+TLS handshake per call. Every
+call has connect/read timeouts, and transient failures are retried with
+backoff. After the token exchange, the profile and email lookups run
+concurrently.
+
+LINKEDIN_OAUTH_URL and LINKEDIN_API_URL can point at a local fake server
+(see benchmarks/fake_linkedin.py) to exercise or benchmark the callback offline.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+from urllib.parse import quote, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PATH = '/v2/people/~:(id,firstName,lastName,profilePicture(displayImage~:playableStreams))'
+EMAIL_PATH = '/v2/emailAddress?q=members&projection=(elements*(handle~))'
+
+
+class LinkedInClient:
+    """Pooled, timeout-bounded client for LinkedIn's OAuth and profile APIs"""
+
+    def __init__(self, client_id: str, client_secret: str, redirect_uri: str,
+                 oauth_url: str = 'https://www.linkedin.com/oauth/v2', api_url: str = 'https://api.linkedin.com',
+                 connect_timeout: float = 3.05, read_timeout: float = 10, retries: int = 2, pool_size: int = 32):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.oauth_url = oauth_url.rstrip('/')
+        self.api_url = api_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        # GETs are retried on connection errors and 429/5xx responses. The token
+        # POST is only retried when the connection failed before the request was
+        # sent, because an authorization code can be redeemed once.
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.http = requests.Session()
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='linkedin')
+
+    def authorization_url(self, state: str) -> str:
+        """URL that starts the OAuth flow"""
+        query = urlencode({
+            'response_type': 'code',
+            'client_id': self.client_id,
+            'redirect_uri': self.redirect_uri,
+            'state': state,
+            'scope': 'r_liteprofile r_emailaddress'
+        }, quote_via=quote)
+        return f'{self.oauth_url}/authorization?{query}'
+
+    def exchange_code(self, code: str) -> str:
+        """Trade an authorization code for an access token"""
+        response = self.http.post(f'{self.oauth_url}/accessToken', data={
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': self.redirect_uri,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['access_token']
+
+    def _get(self, path: str, access_token: str) -> Dict[str, Any]:
+        response = self.http.get(f'{self.api_url}{path}', headers={'Authorization': f'Bearer {access_token}'},
+                                 timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_profile(self, access_token: str) -> Dict[str, Any]:
+        return self._get(PROFILE_PATH, access_token)
+
+    def fetch_email(self, access_token: str) -> Dict[str, Any]:
+        return self._get(EMAIL_PATH, access_token)
+
+    def fetch_member(self, access_token: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Fetch the profile and email responses concurrently"""
+        email = self.executor.submit(self.fetch_email, access_token)
+        profile = self.fetch_profile(access_token)
+        return profile, email.result()
+
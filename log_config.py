@@ -0,0 +1,216 @@
+"""
+Logging setup: structured, sampled and written off the request thread
+
+``configure_logging()`` replaces per-module ``basicConfig`` calls. Records
+are handed to a bounded in-memory queue and formatted and written by a
+background listener thread, so a log call inside a request costs a filter
+check and a queue put. When the queue is full, records are dropped (and
+counted in ``ramble_log_records_dropped_total``) rather than blocking.
+
+Success logs on hot paths pass ``extra={'event': name}``. Below WARNING,
+those are sampled per event (LOG_SAMPLE_RATES, e.g.
+``message_sent=0.01,user_updated=0.1``); sampled records carry their
+``sample_rate`` so counts can be scaled back up. Warnings and errors are
+never sampled. Log calls should pass arguments (``logger.info("x %s", y)``)
+so the message is only built for records that survive sampling.
+
+Defaults follow APP_ENV:
+
+    development  DEBUG, plain text, no sampling
+    production   INFO, one JSON object per line, DEFAULT_SAMPLE_RATES
+
+and can be overridden with LOG_LEVEL, LOG_FORMAT (json/text) and
+LOG_SAMPLE_RATES. ``init_logging(app)`` tags every record logged while
+handling a request with its id (the X-Request-ID header, or a new one) and
+echoes the id back on the response.
+"""
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from flask import request
+from metrics import REGISTRY, Counter
+
+# Id of the request being handled in this context, if any
+request_id_var: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+
+# Per-event sampling of success logs in production
+DEFAULT_SAMPLE_RATES = {
+    'message_sent': 0.01,
+    'messages_inserted': 0.01,
+    'user_authenticated': 0.1,
+    'user_updated': 0.1,
+    'linkedin_user_upserted': 0.1,
+}
+
+ENVIRONMENTS = {
+    'development': {'level': 'DEBUG', 'format': 'text', 'sample_rates': {}},
+    'production': {'level': 'INFO', 'format': 'json', 'sample_rates': DEFAULT_SAMPLE_RATES},
+}
+
+# Attributes of every LogRecord; anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    'ramble_log_records_dropped_total', 'Log records dropped because the log queue was full'))
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """``event=rate`` pairs separated by commas; malformed pairs are ignored"""
+    rates = {}
+    for pair in (value or '').split(','):
+        event, _, rate = pair.partition('=')
+        try:
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the current request id to each record, on the thread that logged it"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the sub-WARNING records of each sampled event"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(event, 1.0)
+        if rate >= 1.0:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with the request id and any ``extra`` fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one-line format, with the request id when there is one"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s%(request)s: %(message)s')
+
+    def format(self, record):
+        request_id = getattr(record, 'request_id', None)
+        record.request = f' [{request_id}]' if request_id else ''
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queues records without formatting them, dropping them when the queue is full"""
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def configure_logging(environment: str = None, level: str = None, fmt: str = None,
+                      sample_rates: Dict[str, float] = None, stream=None, max_queue: int = None):
+    """Route the root logger through the background queue; safe to call more than once"""
+    global _listener
+    environment = (environment or os.environ.get('APP_ENV', 'development')).lower()
+    defaults = ENVIRONMENTS.get(environment, ENVIRONMENTS['production'])
+    level = (level or os.environ.get('LOG_LEVEL') or defaults['level']).upper()
+    fmt = (fmt or os.environ.get('LOG_FORMAT') or defaults['format']).lower()
+    if sample_rates is None:
+        sample_rates = {**defaults['sample_rates'], **parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))}
+
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == 'json' else TextFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=max_queue or int(os.environ.get('LOG_QUEUE_MAX', 10000))))
+    handler.addFilter(SamplingFilter(sample_rates))
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return handler
+
+
+def flush_logging():
+    """Write out queued records (at exit, or before reading a log in tests)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def init_logging(app):
+    """Configure logging and tag each request's records with a request id"""
+    configure_logging()
+
+    @app.before_request
+    def assign_request_id():
+        request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+        request.request_id_token = request_id_var.set(request_id)
+
+    @app.after_request
+    def echo_request_id(response):
+        request_id = request_id_var.get()
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
+
+    @app.teardown_request
+    def clear_request_id(error=None):
+        token = getattr(request, 'request_id_token', None)
+        if token is not None:
+            request_id_var.reset(token)
@@ -0,0 +1,380 @@
+"""
+People matching for discovery ("who should I talk to?")
+
+Every user gets a feature vector built from their quiz answers and outcomes
+(see quiz.py) and their profile (age band from the birthday). Each feature
+group is L2-normalized and scaled by the square root of its share of the
+score, so a dot product is the share-weighted sum of per-group cosine
+similarities: users who agree on everything score 1.0, while sharing only
+an age band scores AGE_SHARE. Vectors are rows of one NumPy matrix, so a
+user's similarity to everybody is a single matrix-vector product and the top
+k come from ``argpartition`` rather than a full sort.
+
+Each user's top MAX_MATCHES neighbours are cached (for up to
+MATCHING_CACHE_SIZE users, least recently used first out) and kept current
+incrementally: when vectors change, one matrix product scores the changed
+users against every cached list's owner, and only lists a changed user
+enters, leaves or moves within are touched. A list is recomputed only when
+a member drops out of a full list and its replacement is unknown.
+
+The index is loaded from the database by a background thread at startup,
+updated by DatabaseManager when quiz results are recorded or profiles
+change, and reloaded by that thread every MATCHING_REFRESH_SECONDS to pick
+up other workers' writes. Requests never reload it.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Neighbours kept per user (and the largest k a caller can ask for)
+MAX_MATCHES = 50
+
+# Relative weight of answers and outcomes within the quiz features
+ANSWER_WEIGHT = 1.0
+OUTCOME_WEIGHT = 2.0
+
+# Share of the similarity score each feature group can contribute (they sum to 1)
+QUIZ_SHARE = 0.8
+AGE_SHARE = 0.2
+
+# Age band boundaries: under 25, 25-34, 35-44, 45-54, 55 and over
+AGE_BANDS = (25, 35, 45, 55)
+
+# Query rows per matrix product when computing many neighbour lists at once
+BATCH_ROWS = 256
+
+
+def age_band(birthday: Any, today: date = None) -> Optional[int]:
+    """Index of the AGE_BANDS band of an ISO birthday, or None if unknown"""
+    if not birthday:
+        return None
+    try:
+        born = birthday if isinstance(birthday, date) else date.fromisoformat(str(birthday)[:10])
+    except ValueError:
+        return None
+    today = today or date.today()
+    age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+    return bisect.bisect_right(AGE_BANDS, age)
+
+
+class FeatureSpace:
+    """Layout of the feature vector: per quiz, one slot per (question, option) and per outcome; then age bands"""
+
+    def __init__(self, quizzes: Dict[str, Any]):
+        self.quizzes: Dict[str, Tuple[int, int, Any]] = {}
+        start = 0
+        for quiz_id, quiz in sorted(quizzes.items()):
+            # Answer slots use the quiz's own (question, option) numbering: offset + option
+            self.quizzes[quiz_id] = (start, start + quiz.blank_slot, quiz)
+            start += quiz.blank_slot + len(quiz.outcomes)
+        self.age_start = start
+        self.dimensions = start + len(AGE_BANDS) + 1
+
+    def vector(self, profile: Optional[Dict[str, Any]], results: Iterable[Dict[str, Any]]) -> np.ndarray:
+        """Feature vector of a user: unit length if every group is known, all zeros if none is"""
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for result in results:
+            layout = self.quizzes.get(result['quiz_id'])
+            if layout is None:
+                continue
+            start, outcome_start, quiz = layout
+            answers = np.asarray(result['answers'], dtype=np.int64)
+            if len(answers) != len(quiz.offsets):
+                continue  # recorded against an older version of the question set
+            answered = answers >= 0
+            vector[start + (answers + quiz.offsets)[answered]] = ANSWER_WEIGHT
+            if result.get('outcome') in quiz.outcomes:
+                vector[outcome_start + quiz.outcomes.index(result['outcome'])] = OUTCOME_WEIGHT
+
+        quiz_norm = np.linalg.norm(vector[:self.age_start])
+        if quiz_norm:
+            vector[:self.age_start] *= np.sqrt(QUIZ_SHARE) / quiz_norm
+
+        band = age_band((profile or {}).get('birthday'))
+        if band is not None:
+            vector[self.age_start + band] = np.sqrt(AGE_SHARE)
+        return vector
+
+
+class MatchingIndex:
+    """Unit vectors in one matrix plus incrementally maintained top-k neighbour lists
+
+    Neighbour lists hold ``(score, user_id)`` pairs, best first, and only
+    users with a positive similarity (something in common).
+    """
+
+    def __init__(self, dimensions: int, neighbours: int = MAX_MATCHES, max_lists: int = 10000):
+        self.dimensions = dimensions
+        self.neighbours = neighbours
+        self.max_lists = max_lists
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((1024, dimensions), dtype=np.float32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lists: 'OrderedDict[str, List[Tuple[float, str]]]' = OrderedDict()
+        self._listed_in: Dict[str, set] = {}  # user id -> owners of the lists that contain them
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def replace(self, vectors: Dict[str, np.ndarray]):
+        """Swap in a complete set of user id -> vector and forget every neighbour list"""
+        ids = list(vectors)
+        matrix = np.zeros((max(1024, len(ids) * 2), self.dimensions), dtype=np.float32)
+        if ids:
+            matrix[:len(ids)] = np.stack([vectors[user_id] for user_id in ids])
+        with self._lock:
+            self._vectors = matrix
+            self._ids = ids
+            self._rows = {user_id: row for row, user_id in enumerate(ids)}
+            self._lists.clear()
+            self._listed_in.clear()
+
+    def set_many(self, vectors: Dict[str, np.ndarray]):
+        """Add or update users and bring the cached neighbour lists up to date"""
+        if not vectors:
+            return
+        with self._lock:
+            for user_id, vector in vectors.items():
+                self._drop_list(user_id)
+                row = self._rows.get(user_id)
+                if row is None:
+                    row = len(self._ids)
+                    if row == len(self._vectors):
+                        self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+                    self._ids.append(user_id)
+                    self._rows[user_id] = row
+                self._vectors[row] = vector
+
+            owners = list(self._lists)
+            if not owners:
+                return
+            changed = list(vectors)
+            changed_set = set(changed)
+            scores = self._vectors[[self._rows[owner] for owner in owners]] @ np.stack([vectors[user_id] for user_id in changed]).T
+            thresholds = np.array([
+                lst[-1][0] if len(lst) >= self.neighbours else 0.0 for lst in self._lists.values()
+            ], dtype=np.float32)
+
+            # Owners a changed user may enter, plus owners whose lists already hold one
+            affected = {owners[i] for i in np.flatnonzero((scores > thresholds[:, None]).any(axis=1))}
+            for user_id in changed:
+                affected |= self._listed_in.get(user_id, set())
+
+            index = {owner: i for i, owner in enumerate(owners)}
+            for owner in affected:
+                i = index[owner]
+                current = self._lists[owner]
+                full = len(current) >= self.neighbours
+                floor = current[-1][0] if current else 0.0
+                kept = [entry for entry in current if entry[1] not in changed_set]
+                new_scores = {user_id: float(scores[i, j]) for j, user_id in enumerate(changed)}
+                # A member that fell below the floor of a full list may have been overtaken by
+                # a user outside the list, which only a recomputation can find
+                if full and any(new_scores[user_id] < floor for _, user_id in current if user_id in changed_set):
+                    self._drop_list(owner)
+                    self.invalidations += 1
+                    continue
+                candidates = [(score, user_id) for user_id, score in new_scores.items() if score > 0]
+                self._store_list(owner, sorted(kept + candidates, reverse=True)[:self.neighbours])
+
+    def remove(self, user_id: str):
+        with self._lock:
+            self._drop_list(user_id)
+            for owner in list(self._listed_in.get(user_id, ())):
+                self._drop_list(owner)
+                self.invalidations += 1
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return
+            # Move the last row into the gap to keep the matrix dense
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._ids.pop()
+            self._vectors[last] = 0
+
+    def similar(self, user_id: str, k: int) -> List[Tuple[str, float]]:
+        """(user_id, similarity) of the ``k`` users most similar to ``user_id``, best first"""
+        return self.similar_many([user_id], k).get(user_id, [])
+
+    def similar_many(self, user_ids: List[str], k: int) -> Dict[str, List[Tuple[str, float]]]:
+        """Neighbour lists of several users, computing the uncached ones with batched matrix products"""
+        k = min(k, self.neighbours)
+        with self._lock:
+            found, missing = {}, []
+            for user_id in user_ids:
+                if user_id in self._lists:
+                    self._lists.move_to_end(user_id)
+                    found[user_id] = self._lists[user_id]
+                    self.hits += 1
+                elif user_id in self._rows:
+                    missing.append(user_id)
+                    self.misses += 1
+
+            count = len(self._ids)
+            candidates = min(self.neighbours, count - 1)
+            for start in range(0, len(missing), BATCH_ROWS):
+                batch = missing[start:start + BATCH_ROWS]
+                rows = np.array([self._rows[user_id] for user_id in batch])
+                scores = self._vectors[rows] @ self._vectors[:count].T
+                scores[np.arange(len(batch)), rows] = -1.0  # never match yourself
+                if candidates <= 0:
+                    top = np.empty((len(batch), 0), dtype=np.int64)
+                else:
+                    top = np.argpartition(-scores, candidates - 1, axis=1)[:, :candidates]
+                for i, user_id in enumerate(batch):
+                    neighbours = sorted(
+                        ((float(scores[i, column]), self._ids[column]) for column in top[i] if scores[i, column] > 0),
+                        reverse=True
+                    )
+                    self._store_list(user_id, neighbours)
+                    found[user_id] = neighbours
+
+            return {user_id: [(other, score) for score, other in neighbours[:k]] for user_id, neighbours in found.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'users': len(self._ids),
+            'dimensions': self.dimensions,
+            'cached_lists': len(self._lists),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+    def _store_list(self, owner: str, neighbours: List[Tuple[float, str]]):
+        self._drop_list(owner)
+        self._lists[owner] = neighbours
+        for _, user_id in neighbours:
+            self._listed_in.setdefault(user_id, set()).add(owner)
+        while len(self._lists) > self.max_lists:
+            self._drop_list(next(iter(self._lists)))
+
+    def _drop_list(self, owner: str):
+        neighbours = self._lists.pop(owner, None)
+        for _, user_id in neighbours or ():
+            owners = self._listed_in.get(user_id)
+            if owners is not None:
+                owners.discard(owner)
+                if not owners:
+                    del self._listed_in[user_id]
+
+
+class MatchingService:
+    """Feature extraction and top-k matches over a MatchingIndex
+
+    ``load()`` returns ``(profiles, quiz_results)`` rows from the database.
+    After ``start_refresher()`` it runs on a background thread at startup and
+    every ``refresh_seconds``; without it, the first call loads and nothing reloads.
+    """
+
+    def __init__(self, features: FeatureSpace, load: Callable[[], Tuple[list, list]],
+                 refresh_seconds: float = 600, max_lists: int = 10000):
+        self.features = features
+        self.load = load
+        self.refresh_seconds = refresh_seconds
+        self.index = MatchingIndex(features.dimensions, max_lists=max_lists)
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._results: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._load_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._refresher_lock = threading.Lock()
+
+    def _reload(self):
+        started = time.perf_counter()
+        profiles, results = self.load()
+        by_user: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for result in results:
+            by_user.setdefault(result['user_id'], {})[result['quiz_id']] = result
+        self._profiles = {profile['id']: profile for profile in profiles}
+        self._results = by_user
+        self.index.replace({
+            user_id: self.features.vector(profile, by_user.get(user_id, {}).values())
+            for user_id, profile in self._profiles.items()
+        })
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded matching index of {len(self._profiles)} users in "
+                    f"{(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def _ensure_loaded(self):
+        # Loaded by the refresher at startup; callers before that wait for (or do) the first load
+        if self._loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self._reload()
+
+    def start_refresher(self):
+        """Load now and reload every ``refresh_seconds``, on a background thread"""
+        if self._refresher is not None:
+            return
+        with self._refresher_lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._run_refresher, name='matching-refresher', daemon=True)
+                self._refresher.start()
+
+    def _run_refresher(self):
+        self._refresh_safely(initial=True)
+        while self.refresh_seconds:
+            time.sleep(self.refresh_seconds)
+            self._refresh_safely()
+
+    def _refresh_safely(self, initial: bool = False):
+        try:
+            with self._load_lock:
+                if not initial or self._loaded_at is None:
+                    self._reload()
+        except Exception as e:
+            logger.error(f"Error refreshing matching index: {e}")
+
+    def _vector(self, user_id: str) -> np.ndarray:
+        return self.features.vector(self._profiles.get(user_id), self._results.get(user_id, {}).values())
+
+    def update_profile(self, user: Dict[str, Any]):
+        """Re-derive a user's vector after their profile row changed"""
+        self.update_profiles([user])
+
+    def update_profiles(self, users: List[Dict[str, Any]]):
+        """Re-derive several users' vectors in one index update (e.g. after a bulk import)"""
+        self._ensure_loaded()
+        for user in users:
+            self._profiles[user['id']] = {'id': user['id'], 'birthday': user.get('birthday')}
+        self.index.set_many({user['id']: self._vector(user['id']) for user in users})
+
+    def record_results(self, quiz_id: str, results: List[Dict[str, Any]]):
+        """Fold a batch of newly recorded quiz results into their users' vectors"""
+        self._ensure_loaded()
+        for result in results:
+            self._results.setdefault(result['user_id'], {})[quiz_id] = {**result, 'quiz_id': quiz_id}
+            self._profiles.setdefault(result['user_id'], {'id': result['user_id']})
+        self.index.set_many({result['user_id']: self._vector(result['user_id']) for result in results})
+
+    def remove(self, user_id: str):
+        self._ensure_loaded()
+        self._profiles.pop(user_id, None)
+        self._results.pop(user_id, None)
+        self.index.remove(user_id)
+
+    def matches(self, user_id: str, k: int) -> List[Tuple[str, float]]:
+        """(user_id, similarity) of the ``k`` most similar users, best first"""
+        self._ensure_loaded()
+        return self.index.similar(user_id, k)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.index.stats()
@@ -0,0 +1,307 @@
+"""
+Request and database timing, exposed in the Prometheus text format
+
+``init_metrics(app)`` times every Flask request (by method and route
+template) and serves ``GET /metrics``. DatabaseManager times each of its
+public methods and, through ``InstrumentedBackend``, every storage call by
+operation and table. Together these split a slow request into:
+
+    ramble_request_queue_seconds      time waiting for a worker (from the proxy's
+                                      X-Request-Start header), i.e. worker starvation
+    ramble_db_executor_wait_seconds   time an async view's database call waited for a
+                                      free thread in the AsyncDatabaseManager pool
+    ramble_storage_seconds            time in Supabase/SQLite, per operation and table
+    ramble_json_seconds               time serializing JSON responses
+    ramble_request_seconds            the whole request
+
+Metrics live in the worker process that recorded them; with several gunicorn
+workers each scrape sees one worker. Set METRICS_TOKEN to require
+``Authorization: Bearer <token>`` on /metrics.
+"""
+import os
+import time
+import threading
+import functools
+import inspect
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from flask import Response, g, request
+from flask.json.provider import DefaultJSONProvider
+import logging
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = '/metrics'
+
+# Latency buckets in seconds: network round trips and whole requests
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Finer buckets for in-process work (serialization, waiting for a thread)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """A named metric family with fixed label names"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}' for key, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = []
+        for key, values in series:
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(values[-1])}')
+            lines.append(f'{self.name}_count{labels} {values[-2]}')
+        return lines
+
+
+class Registry:
+    """Every metric of the process, rendered together for /metrics"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'ramble_request_seconds', 'Time to handle a request', ('method', 'route')))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'ramble_requests_total', 'Requests handled', ('method', 'route', 'status')))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    'ramble_request_errors_total', 'Requests that raised or returned a 5xx', ('method', 'route')))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'ramble_requests_in_flight', 'Requests being handled right now'))
+REQUEST_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    'ramble_request_queue_seconds', 'Time from the proxy receiving a request (X-Request-Start) to a worker starting it'))
+JSON_SECONDS = REGISTRY.register(Histogram(
+    'ramble_json_seconds', 'Time to serialize a JSON response', buckets=FAST_BUCKETS))
+DB_METHOD_SECONDS = REGISTRY.register(Histogram(
+    'ramble_db_method_seconds', 'Time spent in a DatabaseManager method', ('method',)))
+DB_EXECUTOR_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'ramble_db_executor_wait_seconds', 'Time an async database call waited for a pool thread', buckets=FAST_BUCKETS))
+STORAGE_SECONDS = REGISTRY.register(Histogram(
+    'ramble_storage_seconds', 'Time spent in a storage backend call', ('backend', 'operation', 'table')))
+STORAGE_ERRORS = REGISTRY.register(Counter(
+    'ramble_storage_errors_total', 'Storage backend calls that raised', ('backend', 'operation', 'table')))
+MESSAGES_DROPPED = REGISTRY.register(Counter(
+    'ramble_messages_dropped_total', 'Queued messages that could not be stored after retries'))
+
+
+def parse_request_start(header: Optional[str], now: float = None) -> Optional[float]:
+    """Seconds since an X-Request-Start timestamp (``t=<epoch>`` in s, ms or us), or None"""
+    if not header:
+        return None
+    try:
+        started = float(header.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6  # microseconds
+    elif started > 1e11:
+        started /= 1e3  # milliseconds
+    return max(0.0, (now or time.time()) - started)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing each ``jsonify`` response"""
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            JSON_SECONDS.observe(time.perf_counter() - start)
+
+
+def timed_method(name: str, method: Callable) -> Callable:
+    """Wrap a DatabaseManager method so its duration lands in ramble_db_method_seconds"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            DB_METHOD_SECONDS.observe(time.perf_counter() - start, method=name)
+    return wrapper
+
+
+def instrument_methods(cls):
+    """Class decorator timing every public method of ``cls``"""
+    for name, attribute in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.isfunction(attribute):
+            setattr(cls, name, timed_method(name, attribute))
+    return cls
+
+
+class InstrumentedBackend:
+    """Storage backend proxy timing every public call by operation and table
+
+    ``tables`` maps operation names to the table they touch; unlisted
+    operations are labelled with the operation name only.
+    """
+
+    def __init__(self, backend, tables: Dict[str, str]):
+        self._backend = backend
+        self._tables = tables
+
+    def __getattr__(self, name):
+        attribute = getattr(self._backend, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        labels = {'backend': getattr(self._backend, 'name', ''), 'operation': name,
+                  'table': self._tables.get(name, '')}
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            except Exception:
+                STORAGE_ERRORS.inc(**labels)
+                raise
+            finally:
+                STORAGE_SECONDS.observe(time.perf_counter() - start, **labels)
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+
+def init_metrics(app, registry: Registry = REGISTRY):
+    """Time every request of ``app`` and serve ``registry`` at /metrics"""
+    app.json = TimedJSONProvider(app)
+    token = os.environ.get('METRICS_TOKEN')
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        queued = parse_request_start(request.headers.get('X-Request-Start'))
+        if queued is not None:
+            REQUEST_QUEUE_SECONDS.observe(queued)
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def stop_request_timer(error=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        REQUESTS_IN_FLIGHT.dec()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = 500 if error is not None else g.pop('metrics_status', 500)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route)
+        REQUESTS_TOTAL.inc(method=request.method, route=route, status=status)
+        if status >= 500:
+            REQUEST_ERRORS.inc(method=request.method, route=route)
+
+    @app.route(METRICS_PATH)
+    def metrics():
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return registry
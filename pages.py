@@ -0,0 +1,124 @@
+"""
+Render-once HTML for the page routes
+
+The page templates (login, dashboard, groups, ...) don't depend on the
+request: user data is fetched by the page's own script from the API. Each
+page is therefore rendered once per process, on its first request, and kept
+in memory with gzip (and brotli, if the ``brotli`` package is installed)
+variants. Responses carry a content-hash ETag and a Last-Modified taken from
+the newest template, so every worker agrees on both, and browsers revalidate
+with a 304 instead of downloading the page again. Page routes also skip the
+session store (see session_store.py).
+
+Set PAGE_CACHE=0 (or run in debug mode) to render on every request while
+editing templates.
+"""
+import os
+import gzip
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from flask import Response, render_template, request
+from assets import ENCODINGS, MIN_COMPRESSION_SAVING
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Page URL -> template; these routes are served from the cache and without a session
+PAGES = {
+    '/': 'login.html',
+    '/dashboard': 'dashboard.html',
+    '/groups': 'groups.html',
+    '/leaderboard': 'leaderboard.html',
+    '/profile': 'profile.html',
+    '/quiz': 'quiz.html',
+    '/chat': 'chat.html',
+}
+
+
+def _compress(html: bytes) -> Dict[str, bytes]:
+    """gzip/brotli variants of a page that are meaningfully smaller than it"""
+    compressors = {'gzip': lambda raw: gzip.compress(raw, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        compressors['br'] = lambda raw: brotli.compress(raw, quality=11, mode=brotli.MODE_TEXT)
+    except ImportError:
+        pass
+
+    variants = {}
+    for encoding, compress in compressors.items():
+        compressed = compress(html)
+        if len(compressed) <= len(html) * (1 - MIN_COMPRESSION_SAVING):
+            variants[encoding] = compressed
+    return variants
+
+
+class PageCache:
+    """Rendered pages with their precompressed variants, ETag and Last-Modified"""
+
+    def __init__(self, app, enabled: bool = None):
+        self.app = app
+        if enabled is None:
+            enabled = os.environ.get('PAGE_CACHE', '1').lower() not in ('0', 'false', 'no')
+        self.enabled = enabled
+        self._pages: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._last_modified: Optional[datetime] = None
+
+    @property
+    def last_modified(self) -> datetime:
+        """Modification time of the newest template (the same in every worker of a deploy)"""
+        if self._last_modified is None:
+            folder = os.path.join(self.app.root_path, self.app.template_folder)
+            newest = max(
+                (os.path.getmtime(os.path.join(root, name)) for root, _, files in os.walk(folder) for name in files),
+                default=0
+            )
+            self._last_modified = datetime.fromtimestamp(int(newest), timezone.utc)
+        return self._last_modified
+
+    def _render(self, template: str) -> Dict:
+        html = render_template(template).encode('utf-8')
+        return {
+            'body': html,
+            'etag': hashlib.sha256(html).hexdigest()[:16],
+            'encodings': _compress(html)
+        }
+
+    def page(self, template: str) -> Dict:
+        """Rendered page, rendering it on first use"""
+        if not self.enabled or self.app.debug:
+            return self._render(template)
+        page = self._pages.get(template)
+        if page is None:
+            with self._lock:
+                page = self._pages.get(template)
+                if page is None:
+                    page = self._pages[template] = self._render(template)
+                    logger.info(f"Rendered {template}: {len(page['body'])} bytes, "
+                                f"{ {encoding: len(body) for encoding, body in page['encodings'].items()} }")
+        return page
+
+    def send(self, template: str) -> Response:
+        """Response for a page, precompressed if the client accepts it; 304 if the client's copy is current"""
+        page = self.page(template)
+        encoding = next(
+            (encoding for encoding, _ in ENCODINGS
+             if encoding in page['encodings'] and request.accept_encodings[encoding] > 0),
+            None
+        )
+        response = Response(page['encodings'][encoding] if encoding else page['body'], mimetype='text/html')
+        response.set_etag(f"{page['etag']}-{encoding}" if encoding else page['etag'])
+        response.last_modified = self.last_modified
+        response.cache_control.no_cache = True
+        if page['encodings']:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        return response.make_conditional(request)
+
+
+def init_pages(app, cache: PageCache = None) -> PageCache:
+    """Create the page cache used by the page routes"""
+    return cache or PageCache(app)
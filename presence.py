@@ -0,0 +1,264 @@
+"""
+Presence tracking for chat users
+
+Heartbeats (the online-status endpoint and every open /api/chat/stream) land
+in a presence store instead of the users table. A user stays online until
+PRESENCE_TTL_SECONDS pass without a heartbeat. A background flusher writes
+is_online/last_seen back to the database in bulk every PRESENCE_FLUSH_SECONDS.
+
+Select the store with the PRESENCE_BACKEND environment variable:
+    memory (default) - in-process; one view of presence per worker
+    redis            - shared sorted set via REDIS_URL, so every worker agrees
+"""
+import os
+import time
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def epoch_to_iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='microseconds')
+
+
+class PresenceStore:
+    """Interface implemented by every presence store (timestamps are epoch seconds)"""
+
+    name = 'base'
+
+    def touch(self, user_id: str, now: float) -> bool:
+        """Record a heartbeat; True if the user was not online before"""
+        raise NotImplementedError
+
+    def remove(self, user_id: str) -> bool:
+        """Mark a user offline; True if they were online"""
+        raise NotImplementedError
+
+    def online(self, user_ids: Iterable[str], cutoff: float) -> Dict[str, float]:
+        """Last heartbeat of each given user whose heartbeat is newer than ``cutoff``"""
+        raise NotImplementedError
+
+    def expire(self, cutoff: float) -> List[str]:
+        """Remove and return users whose last heartbeat is older than ``cutoff``"""
+        raise NotImplementedError
+
+    def drain_changes(self) -> Tuple[List[str], List[str]]:
+        """Return and reset the (seen online, gone offline) user ids since the last drain"""
+        raise NotImplementedError
+
+
+class InMemoryPresenceStore(PresenceStore):
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_heartbeat: Dict[str, float] = {}
+        self._seen: set = set()
+        self._gone: set = set()
+
+    def touch(self, user_id, now):
+        with self._lock:
+            was_online = user_id in self._last_heartbeat
+            self._last_heartbeat[user_id] = now
+            self._seen.add(user_id)
+            self._gone.discard(user_id)
+            return not was_online
+
+    def remove(self, user_id):
+        with self._lock:
+            if self._last_heartbeat.pop(user_id, None) is None:
+                return False
+            self._seen.discard(user_id)
+            self._gone.add(user_id)
+            return True
+
+    def online(self, user_ids, cutoff):
+        with self._lock:
+            result = {}
+            for user_id in user_ids:
+                timestamp = self._last_heartbeat.get(user_id)
+                if timestamp is not None and timestamp >= cutoff:
+                    result[user_id] = timestamp
+            return result
+
+    def expire(self, cutoff):
+        with self._lock:
+            expired = [user_id for user_id, timestamp in self._last_heartbeat.items() if timestamp < cutoff]
+            for user_id in expired:
+                del self._last_heartbeat[user_id]
+                self._seen.discard(user_id)
+                self._gone.add(user_id)
+            return expired
+
+    def drain_changes(self):
+        with self._lock:
+            seen, gone = list(self._seen), list(self._gone)
+            self._seen.clear()
+            self._gone.clear()
+            return seen, gone
+
+
+class RedisPresenceStore(PresenceStore):
+    """Presence shared by all workers (requires the ``redis`` package)"""
+
+    name = 'redis'
+
+    def __init__(self, redis_url: str, prefix: str = 'ramble:presence:'):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.online_key = prefix + 'online'
+        self.seen_key = prefix + 'seen'
+        self.gone_key = prefix + 'gone'
+
+    def touch(self, user_id, now):
+        pipe = self.client.pipeline()
+        pipe.zadd(self.online_key, {user_id: now})
+        pipe.sadd(self.seen_key, user_id)
+        pipe.srem(self.gone_key, user_id)
+        added, _, _ = pipe.execute()
+        return bool(added)
+
+    def remove(self, user_id):
+        pipe = self.client.pipeline()
+        pipe.zrem(self.online_key, user_id)
+        pipe.srem(self.seen_key, user_id)
+        pipe.sadd(self.gone_key, user_id)
+        removed, _, _ = pipe.execute()
+        return bool(removed)
+
+    def online(self, user_ids, cutoff):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        scores = self.client.zmscore(self.online_key, user_ids)
+        return {
+            user_id: score for user_id, score in zip(user_ids, scores)
+            if score is not None and score >= cutoff
+        }
+
+    def expire(self, cutoff):
+        candidates = self.client.zrangebyscore(self.online_key, '-inf', f'({cutoff}')
+        expired = []
+        for user_id in candidates:
+            # Only the worker whose ZREM succeeds reports the transition
+            if self.client.zrem(self.online_key, user_id):
+                self.client.sadd(self.gone_key, user_id)
+                expired.append(user_id)
+        return expired
+
+    def drain_changes(self):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.smembers(self.seen_key)
+        pipe.delete(self.seen_key)
+        pipe.smembers(self.gone_key)
+        pipe.delete(self.gone_key)
+        seen, _, gone, _ = pipe.execute()
+        return list(seen), list(gone)
+
+
+class PresenceService:
+    """Heartbeat tracking with TTL expiry and batched write-back
+
+    ``on_change(user_id, is_online, timestamp)`` fires on online/offline
+    transitions only. ``flush(seen_ids, gone_ids)`` persists the users who
+    were seen online and the users who went offline since the last flush.
+    """
+
+    def __init__(self, store: PresenceStore, ttl_seconds: float = 45, flush_seconds: float = 30,
+                 on_change: Optional[Callable[[str, bool, float], None]] = None,
+                 flush: Optional[Callable[[List[str], List[str]], None]] = None):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.flush_seconds = flush_seconds
+        self.on_change = on_change
+        self.flush = flush
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_lock = threading.Lock()
+
+    def heartbeat(self, user_id: str):
+        """Mark a user online for another TTL period"""
+        now = time.time()
+        if self.store.touch(user_id, now) and self.on_change:
+            self.on_change(user_id, True, now)
+        self._ensure_flusher()
+
+    def set_offline(self, user_id: str):
+        """Mark a user offline immediately"""
+        if self.store.remove(user_id) and self.on_change:
+            self.on_change(user_id, False, time.time())
+        self._ensure_flusher()
+
+    def online_users(self, user_ids: Iterable[str]) -> Dict[str, float]:
+        """Last heartbeat of each given user that is currently online"""
+        return self.store.online(user_ids, time.time() - self.ttl_seconds)
+
+    def merge(self, rows: list, nested: str = None) -> list:
+        """Overlay live online flags onto user rows (or rows[i][nested] embeds)
+
+        The store is authoritative: a user without a live heartbeat is shown
+        offline even if the row's is_online has not been flushed yet.
+        """
+        users = [row.get(nested) if nested else row for row in rows]
+        users = [user for user in users if user and user.get('id')]
+        online = self.online_users(user['id'] for user in users)
+        for user in users:
+            timestamp = online.get(user['id'])
+            if timestamp is not None:
+                user['is_online'] = True
+                user['last_seen'] = epoch_to_iso(timestamp)
+            else:
+                user['is_online'] = False
+        return rows
+
+    def sweep_and_flush(self):
+        """Expire stale heartbeats, then persist changes since the last flush"""
+        now = time.time()
+        for user_id in self.store.expire(now - self.ttl_seconds):
+            if self.on_change:
+                self.on_change(user_id, False, now)
+        seen, gone = self.store.drain_changes()
+        if self.flush and (seen or gone):
+            self.flush(seen, gone)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name='presence-flusher', daemon=True)
+                self._flusher.start()
+                atexit.register(self._flush_safely)
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self._flush_safely()
+
+    def _flush_safely(self):
+        try:
+            self.sweep_and_flush()
+        except Exception as e:
+            logger.error(f"Error flushing presence: {e}")
+
+
+def create_presence_store(backend_name: str = None) -> PresenceStore:
+    """Build the store selected by PRESENCE_BACKEND, falling back to in-memory"""
+    backend_name = (backend_name or os.environ.get('PRESENCE_BACKEND', 'memory')).lower()
+
+    if backend_name == 'redis':
+        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        try:
+            store = RedisPresenceStore(redis_url)
+            logger.info("Redis presence store initialized successfully")
+            return store
+        except Exception as e:
+            logger.error(f"Failed to initialize Redis presence store, using in-memory store: {e}")
+    elif backend_name != 'memory':
+        logger.error(f"Unknown PRESENCE_BACKEND '{backend_name}', using in-memory store")
+
+    return InMemoryPresenceStore()
@@ -0,0 +1,182 @@
+"""
+Publish/subscribe broker for real-time chat events
+
+DatabaseManager publishes events (new messages, invitations, presence,
+group joins) and the /api/chat/stream endpoint relays them to browsers over
+Server-Sent Events.
+
+Select the broker with the PUBSUB_BACKEND environment variable:
+    memory (default) - in-process; only reaches subscribers in the same worker
+    redis            - Redis PUBLISH/SUBSCRIBE via REDIS_URL; shared by all workers
+"""
+import os
+import json
+import queue
+import threading
+from typing import Optional, Dict, Any, Iterable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Channel every subscriber listens on for presence changes
+PRESENCE_CHANNEL = 'presence'
+
+
+def user_channel(user_id: str) -> str:
+    return f'user:{user_id}'
+
+
+def group_channel(group_id: str) -> str:
+    return f'group:{group_id}'
+
+
+class Subscription:
+    """A subscriber's view of one or more channels"""
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for the next event ({'event': ..., 'data': ...})"""
+        raise NotImplementedError
+
+    def add(self, channels: Iterable[str]):
+        """Also listen on ``channels`` from now on (e.g. a group the user just joined)"""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class PubSub:
+    """Interface implemented by every broker"""
+
+    name = 'base'
+
+    def publish(self, channel: str, event: str, data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        raise NotImplementedError
+
+
+class _MemorySubscription(Subscription):
+    def __init__(self, broker: 'InMemoryPubSub', channels: Iterable[str], max_queue: int):
+        self.broker = broker
+        self.channels = list(channels)
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def add(self, channels):
+        self.broker._add(self, channels)
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class InMemoryPubSub(PubSub):
+    """Thread-safe broker for a single process"""
+
+    name = 'memory'
+
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, set] = {}
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait({'event': event, 'data': data})
+            except queue.Full:
+                logger.warning(f"Dropping {event} event for slow subscriber on {channel}")
+
+    def subscribe(self, channels):
+        subscription = _MemorySubscription(self, (), self.max_queue)
+        self._add(subscription, channels)
+        return subscription
+
+    def _add(self, subscription: _MemorySubscription, channels: Iterable[str]):
+        with self._lock:
+            for channel in channels:
+                if channel not in subscription.channels:
+                    subscription.channels.append(channel)
+                    self._subscribers.setdefault(channel, set()).add(subscription)
+
+    def _unsubscribe(self, subscription: _MemorySubscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class _RedisSubscription(Subscription):
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    def get(self, timeout):
+        message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if not message:
+            return None
+        return json.loads(message['data'])
+
+    def add(self, channels):
+        self.pubsub.subscribe(*channels)
+
+    def close(self):
+        self.pubsub.close()
+
+
+class RedisPubSub(PubSub):
+    """Broker shared across gunicorn workers and hosts (requires the ``redis`` package)"""
+
+    name = 'redis'
+
+    def __init__(self, redis_url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+
+    def publish(self, channel, event, data):
+        self.client.publish(channel, json.dumps({'event': event, 'data': data}, default=str))
+
+    def subscribe(self, channels):
+        pubsub = self.client.pubsub()
+        pubsub.subscribe(*channels)
+        return _RedisSubscription(pubsub)
+
+
+def create_pubsub(backend_name: str = None) -> PubSub:
+    """Build the broker selected by PUBSUB_BACKEND, falling back to in-memory"""
+    backend_name = (backend_name or os.environ.get('PUBSUB_BACKEND', 'memory')).lower()
+
+    if backend_name == 'redis':
+        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        try:
+            broker = RedisPubSub(redis_url)
+            logger.info("Redis pub/sub initialized successfully")
+            return broker
+        except Exception as e:
+            logger.error(f"Failed to initialize Redis pub/sub, using in-memory broker: {e}")
+    elif backend_name != 'memory':
+        logger.error(f"Unknown PUBSUB_BACKEND '{backend_name}', using in-memory broker")
+
+    return InMemoryPubSub()
+
+
+# Global broker instance - created on first use
+pubsub = None
+
+def get_pubsub() -> PubSub:
+    """Get the broker instance, initializing if needed"""
+    global pubsub
+    if pubsub is None:
+        pubsub = create_pubsub()
+    return pubsub
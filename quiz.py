@@ -0,0 +1,236 @@
+"""
+Server-side quizzes: question sets, vectorized scoring and batched results
+
+Question sets are JSON files in QUIZ_DIR (default quizzes/). Each option
+names the outcome it counts towards and the points it is worth. Browsers
+get the questions without that scoring key, submit the chosen option
+indexes, and the server scores them.
+
+Scoring is precomputed per quiz as a (question, option) -> outcome weight
+matrix and a points vector, so a whole batch of submissions is scored with
+one gather-and-sum over an answers matrix. Submissions are group-committed:
+a writer thread collects the ones arriving within QUIZ_BATCH_INTERVAL_MS (up
+to QUIZ_BATCH_SIZE), scores them together and records them in one write
+that also adds the points and the per-question answer counts. Each submitter
+waits only for its own batch.
+"""
+import os
+import json
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import logging
+from write_queue import QueueFull, WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+QUIZ_DIR = os.environ.get('QUIZ_DIR', 'quizzes')
+
+# How long a submitter waits for its batch to be recorded
+SUBMIT_TIMEOUT_SECONDS = 10
+
+# Answer value for a question left unanswered (timed out)
+UNANSWERED = -1
+
+
+class Quiz:
+    """A question set compiled into scoring arrays"""
+
+    def __init__(self, definition: Dict[str, Any]):
+        self.id: str = definition['id']
+        self.title: str = definition.get('title', self.id)
+        self.seconds_per_question: int = definition.get('seconds_per_question', 10)
+        self.outcomes: List[str] = definition['outcomes']
+        self.questions: List[Dict[str, Any]] = definition['questions']
+
+        self.option_counts = np.array([len(question['options']) for question in self.questions])
+        width = int(self.option_counts.max())
+        # Slot of (question q, option o) is q * width + o; the extra last slot scores nothing
+        self.offsets = np.arange(len(self.questions)) * width
+        self.blank_slot = len(self.questions) * width
+        self.weights = np.zeros((self.blank_slot + 1, len(self.outcomes)), dtype=np.int32)
+        self.points = np.zeros(self.blank_slot + 1, dtype=np.int32)
+        for q, question in enumerate(self.questions):
+            for o, option in enumerate(question['options']):
+                if option.get('outcome'):
+                    self.weights[q * width + o, self.outcomes.index(option['outcome'])] = option.get('weight', 1)
+                self.points[q * width + o] = option.get('points', 0)
+
+    def public(self) -> Dict[str, Any]:
+        """Questions as shown to players (without outcomes or points)"""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'seconds_per_question': self.seconds_per_question,
+            'questions': [
+                {
+                    'question': question['question'],
+                    'options': [{'icon': option.get('icon'), 'text': option['text']} for option in question['options']]
+                }
+                for question in self.questions
+            ]
+        }
+
+    def parse_answers(self, answers: Any) -> List[int]:
+        """Validate one option index (or null for unanswered) per question; raises ValueError"""
+        if not isinstance(answers, list) or len(answers) != len(self.questions):
+            raise ValueError(f"answers must be a list of {len(self.questions)} option indexes")
+        parsed = []
+        for answer, option_count in zip(answers, self.option_counts):
+            if answer is None:
+                parsed.append(UNANSWERED)
+            elif isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < option_count:
+                parsed.append(answer)
+            else:
+                raise ValueError(f"Invalid answer: {answer!r}")
+        return parsed
+
+    def score(self, answers: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Score an (n, questions) matrix of option indexes
+
+        Returns each row's outcome index (ties go to the earlier outcome), its
+        per-outcome totals and the points earned.
+        """
+        slots = np.where(answers >= 0, answers + self.offsets, self.blank_slot)
+        totals = self.weights[slots].sum(axis=1)
+        return totals.argmax(axis=1), totals, self.points[slots].sum(axis=1)
+
+    def distribution(self, counts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Answer counts (question_index, option_index, answer_count rows) laid out per question"""
+        matrix = np.zeros((len(self.questions), int(self.option_counts.max())), dtype=np.int64)
+        for row in counts:
+            if row['question_index'] < len(self.questions) and row['option_index'] < matrix.shape[1]:
+                matrix[row['question_index'], row['option_index']] = row['answer_count']
+        answered = matrix.sum(axis=1)
+        return {
+            'quiz_id': self.id,
+            'responses': int(answered.max()) if len(answered) else 0,
+            'questions': [
+                {
+                    'question': question['question'],
+                    'answered': int(answered[q]),
+                    'options': [
+                        {
+                            'text': option['text'],
+                            'count': int(matrix[q, o]),
+                            'share': round(float(matrix[q, o]) / answered[q], 4) if answered[q] else 0.0
+                        }
+                        for o, option in enumerate(question['options'])
+                    ]
+                }
+                for q, question in enumerate(self.questions)
+            ]
+        }
+
+
+def load_quizzes(directory: str = QUIZ_DIR) -> Dict[str, Quiz]:
+    """Compile every *.json question set in ``directory``"""
+    quizzes = {}
+    if not os.path.isdir(directory):
+        logger.warning(f"No quiz directory at {directory}")
+        return quizzes
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                quiz = Quiz(json.load(f))
+            quizzes[quiz.id] = quiz
+        except Exception as e:
+            logger.error(f"Error loading quiz {name}: {e}")
+    return quizzes
+
+
+class QuizEngine:
+    """Scores submissions in batches and records them through ``record(quiz_id, results)``
+
+    ``record`` stores a list of ``{user_id, answers, outcome, points}`` and
+    returns the users rows whose points were increased (users who already
+    completed the quiz are left out, so points are awarded once).
+    """
+
+    def __init__(self, quizzes: Dict[str, Quiz], record: Callable[[str, List[Dict[str, Any]]], list],
+                 batch_size: int = 500, flush_interval: float = 0.01, max_queue: int = 20000):
+        self.quizzes = quizzes
+        self.record = record
+        self.queue = WriteBehindQueue(
+            self._flush, batch_size=batch_size, flush_interval=flush_interval, max_queue=max_queue,
+            name='quiz-writer', on_drop=self._on_drop
+        )
+
+    def get(self, quiz_id: str) -> Optional[Quiz]:
+        return self.quizzes.get(quiz_id)
+
+    def submit(self, user_id: str, quiz_id: str, answers: Any) -> Dict[str, Any]:
+        """Queue a submission and wait for its batch; raises ValueError for an unknown quiz or bad answers"""
+        quiz = self.quizzes.get(quiz_id)
+        if quiz is None:
+            raise ValueError(f"Unknown quiz: {quiz_id}")
+        future: Future = Future()
+        row = {
+            'id': f'{quiz_id}:{user_id}',
+            'quiz_id': quiz_id,
+            'user_id': user_id,
+            'answers': quiz.parse_answers(answers),
+            'future': future
+        }
+        try:
+            self.queue.enqueue(row)
+        except QueueFull:
+            logger.warning("Quiz queue full, recording submission synchronously")
+            self._flush([row])
+        return future.result(timeout=SUBMIT_TIMEOUT_SECONDS)
+
+    def _flush(self, rows: List[Dict[str, Any]]):
+        by_quiz: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_quiz.setdefault(row['quiz_id'], []).append(row)
+
+        for quiz_id, quiz_rows in by_quiz.items():
+            # A user submitting twice in one batch is scored once
+            quiz_rows = list({row['user_id']: row for row in quiz_rows}.values())
+            quiz = self.quizzes[quiz_id]
+            outcomes, totals, points = quiz.score(np.array([row['answers'] for row in quiz_rows], dtype=np.int64))
+            results = [
+                {
+                    'user_id': row['user_id'],
+                    'answers': row['answers'],
+                    'outcome': quiz.outcomes[outcome],
+                    'points': int(earned)
+                }
+                for row, outcome, earned in zip(quiz_rows, outcomes, points)
+            ]
+            awarded = {user['id']: user for user in self.record(quiz_id, results)}
+
+            responses = {}
+            for result, scores in zip(results, totals):
+                user = awarded.get(result['user_id'])
+                responses[result['user_id']] = {
+                    'quiz_id': quiz_id,
+                    'outcome': result['outcome'],
+                    'scores': dict(zip(quiz.outcomes, scores.tolist())),
+                    'points_awarded': result['points'] if user else 0,
+                    'total_points': user.get('points') if user else None,
+                    'already_completed': user is None
+                }
+            for row in by_quiz[quiz_id]:
+                if not row['future'].done():
+                    row['future'].set_result(responses[row['user_id']])
+
+    @staticmethod
+    def _on_drop(row: Dict[str, Any], error: Exception):
+        if not row['future'].done():
+            row['future'].set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.queue.stats()
+
+
+def create_quiz_engine(record: Callable[[str, List[Dict[str, Any]]], list]) -> QuizEngine:
+    """Build the quiz engine from QUIZ_DIR, QUIZ_BATCH_SIZE and QUIZ_BATCH_INTERVAL_MS"""
+    return QuizEngine(
+        load_quizzes(),
+        record,
+        batch_size=int(os.environ.get('QUIZ_BATCH_SIZE', 500)),
+        flush_interval=float(os.environ.get('QUIZ_BATCH_INTERVAL_MS', 10)) / 1000
+    )
@@ -0,0 +1,153 @@
+"""
+Server-side session storage (Flask-Session)
+
+The session cookie carries only a random session id. Session data (the signed
+in user's id, login method and OAuth state) lives in the store selected by
+the SESSION_BACKEND environment variable:
+    filesystem (default) - files under SESSION_FILE_DIR (default flask_session)
+    sqlite               - a table in SESSION_SQLITE_PATH (default sessions.db)
+    redis                - shared store via REDIS_URL, for several workers/instances
+
+The filesystem and sqlite stores live on the instance's local disk, which a
+deploy wipes on most hosts (Render included), signing everyone out; use
+redis in production.
+
+Requests for images and other static files, and for the page routes (whose
+HTML is the same for everyone, see pages.py), never touch the store.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from cachelib import BaseCache
+from cachelib.file import FileSystemCache
+from flask.sessions import SessionInterface
+from flask_session import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Paths served without a session (static assets and images)
+STATIC_PATH_PREFIXES = ('/static/', '/public/', '/images/', '/assets/')
+
+
+class SQLiteSessionCache(BaseCache):
+    """cachelib backend keeping sessions in a SQLite table (one connection per thread)"""
+
+    def __init__(self, path: str, default_timeout: int = 300):
+        super().__init__(default_timeout)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires)')
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM sessions WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + self._normalize_timeout(timeout) if timeout != 0 else float('inf')
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (key, value, expires) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value), expires)
+            )
+            # Expired sessions are swept lazily on writes
+            conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+        return True
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE key = ?', (key,))
+        return True
+
+
+class StaticAwareSessionInterface(SessionInterface):
+    """Wraps a session interface so static asset and page requests skip the session store"""
+
+    def __init__(self, inner: SessionInterface, static_prefixes=STATIC_PATH_PREFIXES, static_paths=()):
+        self.inner = inner
+        self.static_prefixes = static_prefixes
+        self.static_paths = frozenset(static_paths)
+
+    def open_session(self, app, request):
+        if request.path.startswith(self.static_prefixes) or request.path in self.static_paths:
+            return self.inner.make_null_session(app)
+        return self.inner.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.inner.save_session(app, session, response)
+
+    def make_null_session(self, app):
+        return self.inner.make_null_session(app)
+
+    def is_null_session(self, obj):
+        return self.inner.is_null_session(obj)
+
+    def regenerate(self, session):
+        """Move ``session`` to a new id, deleting the stored one (call on login)"""
+        self.inner.regenerate(session)
+
+
+def _session_client(backend_name: str):
+    """Flask-Session settings for the selected store, falling back to the filesystem"""
+    if backend_name == 'redis':
+        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_url)
+            logger.info("Redis session store initialized successfully")
+            return {'SESSION_TYPE': 'redis', 'SESSION_REDIS': client}
+        except Exception as e:
+            logger.error(f"Failed to initialize Redis session store, using filesystem: {e}")
+    elif backend_name == 'sqlite':
+        path = os.environ.get('SESSION_SQLITE_PATH', 'sessions.db')
+        try:
+            client = SQLiteSessionCache(path)
+            logger.info(f"SQLite session store initialized successfully: {path}")
+            return {'SESSION_TYPE': 'cachelib', 'SESSION_CACHELIB': client}
+        except Exception as e:
+            logger.error(f"Failed to initialize SQLite session store, using filesystem: {e}")
+    elif backend_name != 'filesystem':
+        logger.error(f"Unknown SESSION_BACKEND '{backend_name}', using filesystem")
+
+    # threshold=0: never prune by file count; cachelib prunes live sessions (every third file) once over it
+    client = FileSystemCache(
+        os.environ.get('SESSION_FILE_DIR', 'flask_session'),
+        threshold=int(os.environ.get('SESSION_FILE_THRESHOLD', 0))
+    )
+    return {'SESSION_TYPE': 'cachelib', 'SESSION_CACHELIB': client}
+
+
+def init_sessions(app, backend_name: str = None, static_paths=()):
+    """Install the server-side session store selected by SESSION_BACKEND on ``app``
+
+    Requests for ``static_paths`` (exact paths) get no session.
+    """
+    backend_name = (backend_name or os.environ.get('SESSION_BACKEND', 'filesystem')).lower()
+    app.config.update(_session_client(backend_name))
+    app.config.update(
+        SESSION_PERMANENT=True,
+        PERMANENT_SESSION_LIFETIME=timedelta(days=int(os.environ.get('SESSION_LIFETIME_DAYS', 14))),
+        # Only send Set-Cookie when the session changes, not on every response
+        SESSION_REFRESH_EACH_REQUEST=False,
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE='Lax'
+    )
+    Session(app)
+    app.session_interface = StaticAwareSessionInterface(app.session_interface, static_paths=static_paths)
@@ -5,6 +5,7 @@ This script helps you set up the database table
 import os
 from dotenv import load_dotenv
 from database import db_manager
+from log_config import configure_logging
 
 def main():
     """Main setup function"""
@@ -13,6 +14,7 @@ def main():
     
     # Load environment variables
     load_dotenv()
+    configure_logging()
     
     # Check if Supabase credentials are configured
     if not os.environ.get('SUPABASE_URL') or not os.environ.get('SUPABASE_KEY'):
@@ -1,10 +1,30 @@
 #!/bin/bash
 # Production startup script for Render
 echo "Starting Ramble app in production mode..."
+export APP_ENV=${APP_ENV:-production}
 echo "Environment variables:"
 echo "PORT: $PORT"
 echo "SUPABASE_URL: ${SUPABASE_URL:0:20}..."
 echo "LINKEDIN_CLIENT_ID: $LINKEDIN_CLIENT_ID"
 
-# Start with Gunicorn for production
-gunicorn app:app --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+# Start with Gunicorn for production.
+# Every open chat page holds a /api/chat/stream connection for up to
+# SSE_MAX_STREAM_SECONDS (300 s by default), so the default worker class is
+# gevent: each request, stream or not, is a greenlet and up to
+# GUNICORN_WORKER_CONNECTIONS streams stay open without starving other
+# requests. gthread is still available (GUNICORN_WORKER_CLASS=gthread), but
+# there every stream pins one of GUNICORN_THREADS threads, so the thread count
+# must exceed the number of open chat pages per worker.
+# The in-memory pub/sub only reaches streams in its own process, so run a
+# single worker unless a shared broker (PUBSUB_BACKEND=redis) is configured.
+if [ "$PUBSUB_BACKEND" = "redis" ]; then
+    WORKERS=${WEB_CONCURRENCY:-2}
+else
+    WORKERS=1
+fi
+
+if [ "${GUNICORN_WORKER_CLASS:-gevent}" = "gthread" ]; then
+    gunicorn app:app --bind 0.0.0.0:$PORT --workers $WORKERS --worker-class gthread --threads ${GUNICORN_THREADS:-32} --timeout 120
+else
+    gunicorn app:app --bind 0.0.0.0:$PORT --workers $WORKERS --worker-class gevent --worker-connections ${GUNICORN_WORKER_CONNECTIONS:-1000} --timeout 120
+fi
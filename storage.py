@@ -0,0 +1,1561 @@
+"""
+Storage backends for DatabaseManager
+
+DatabaseManager owns logging and error handling; a backend only knows how to
+run each operation against its engine and return plain dicts shaped like the
+Supabase responses (including the nested ``users``/``groups`` embeds).
+
+Select the engine with the DATABASE_BACKEND environment variable:
+    supabase (default) - remote Supabase project (SUPABASE_URL / SUPABASE_KEY)
+    sqlite             - local SQLite file in WAL mode (SQLITE_DATABASE_PATH)
+"""
+import os
+import json
+import sqlite3
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sentinel for "current server time" in update payloads
+NOW = 'now()'
+
+# Emails per ``IN (...)`` filter when checking which already exist (keeps PostgREST URLs short)
+EMAIL_LOOKUP_CHUNK = 200
+
+# SQLite's default cap on bound parameters per statement (older builds)
+SQLITE_MAX_VARIABLES = 999
+
+
+def utc_now() -> str:
+    """Current UTC time as an ISO 8601 string (matches Supabase timestamps)"""
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def conversation_key(user_a: str, user_b: str) -> str:
+    """Canonical id of the private conversation between two users (same for both directions)
+
+    Matches the ``messages.conversation_key`` column (Postgres) and the
+    idx_messages_conversation expression index (SQLite).
+    """
+    return f'{min(user_a, user_b)}:{max(user_a, user_b)}'
+
+
+class EmailConflict(Exception):
+    """A new LinkedIn member has no email, or their email belongs to another LinkedIn account"""
+
+    def __init__(self, email: Optional[str]):
+        self.email = email
+        if email:
+            super().__init__(f"The email address {email} is already linked to another LinkedIn account")
+        else:
+            super().__init__("LinkedIn did not share an email address for this account")
+
+
+class StorageBackend:
+    """Interface implemented by every storage engine"""
+
+    name = 'base'
+
+    def create_tables(self) -> bool:
+        raise NotImplementedError
+
+    # Users
+    def insert_user(self, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def find_user(self, **filters) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update_user(self, user_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def find_users(self, user_ids: list) -> list:
+        """Full rows (like find_user) of the given users, in no particular order"""
+        raise NotImplementedError
+
+    def list_scores(self) -> list:
+        """Every user's ``id`` and ``points`` (loads the leaderboard)"""
+        raise NotImplementedError
+
+    def list_profiles(self) -> list:
+        """Every user's ``id`` and ``birthday`` (loads the matching engine)"""
+        raise NotImplementedError
+
+    def bulk_update_users(self, user_ids: list, update_data: Dict[str, Any]) -> int:
+        """Apply the same update to many users in one statement; returns rows updated"""
+        raise NotImplementedError
+
+    def find_emails(self, emails: list) -> set:
+        """The subset of ``emails`` that already belong to a user"""
+        raise NotImplementedError
+
+    def upsert_linkedin_user(self, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Insert a LinkedIn user, or refresh the user with that ``linkedin_id``; returns the row
+
+        ``user_data`` holds linkedin_id, email, first_name, surname,
+        profile_picture_url, points and rank. A user registered with the same
+        email and no linkedin_id (an email signup or imported attendee) gets
+        the linkedin_id attached. For an existing user only the name and
+        picture are updated (empty values keep the stored ones); points, rank
+        and email stay as they are. Raises EmailConflict instead of creating a
+        user without an email or taking over one linked to another member.
+        """
+        raise NotImplementedError
+
+    def insert_users(self, users: list) -> list:
+        """Insert many users (same columns) with multi-row statements; returns the rows created
+
+        Rows whose email or linkedin_id is already taken are skipped, not raised.
+        """
+        raise NotImplementedError
+
+    def list_users(self, exclude_user_id: str = None, search: str = None, limit: int = None,
+                   after: Optional[Tuple] = None, online_first: bool = False) -> list:
+        """Directory page ordered by (first_name, id), or (is_online DESC, first_name, id)
+
+        A missing first name sorts as '' (COALESCE(first_name, ''); the
+        ``directory_name`` column on Postgres) so NULLs page like any other name.
+        ``search`` is a case-insensitive prefix matched against first name,
+        surname and email; ``after`` is the sort key of the previous page's last row.
+        """
+        raise NotImplementedError
+
+    # Groups
+    def insert_group(self, group_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def insert_group_member(self, member_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def insert_group_with_owner(self, group_data: Dict[str, Any], member_ids: list) -> Optional[Dict[str, Any]]:
+        """Create a group, its creator as admin and ``member_ids`` as members atomically"""
+        raise NotImplementedError
+
+    def list_user_groups(self, user_id: str) -> list:
+        raise NotImplementedError
+
+    def list_group_members(self, group_id: str) -> list:
+        raise NotImplementedError
+
+    # Messages
+    def insert_message(self, message_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def insert_messages(self, messages: list):
+        """Insert many messages (same columns, ids assigned) in one statement
+
+        Rows whose id already exists are skipped, so a retried batch is harmless.
+        """
+        raise NotImplementedError
+
+    def list_messages(self, group_id: str = None, conversation: str = None, limit: int = 50,
+                      before: Optional[Tuple[str, str]] = None, after: Optional[Tuple[str, str]] = None) -> list:
+        """Newest-first page of a group's or a private conversation's messages
+
+        ``conversation`` is a conversation_key; ``before``/``after`` are
+        (created_at, id) keyset cursors.
+        """
+        raise NotImplementedError
+
+    # Invitations
+    def insert_invitation(self, invitation_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_pending_invitations(self, user_id: str) -> list:
+        raise NotImplementedError
+
+    def update_invitation(self, invitation_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def accept_invitation(self, invitation_id: str, user_id: str) -> Optional[str]:
+        """Mark ``user_id``'s invitation accepted and add them to the group atomically
+
+        Returns the group id, or None if the invitation does not exist, is not
+        addressed to the user, or was declined. Accepting twice is a no-op.
+        """
+        raise NotImplementedError
+
+    # Unread counters (incremented by an insert trigger on messages)
+    def list_unread(self, user_id: str) -> list:
+        """The user's chats with unread messages, one counter row each"""
+        raise NotImplementedError
+
+    def mark_read(self, user_id: str, chat_type: str, chat_id: str, created_at: str, message_id: str) -> int:
+        """Advance the user's last-read cursor in a chat and return how many messages are still unread
+
+        ``chat_type`` is 'user' (``chat_id`` is the other user) or 'group'. The
+        cursor only moves forward, and private messages up to it are flagged
+        ``is_read``. The count is recomputed from the messages after the
+        cursor, so it stays exact if messages arrive while the chat is open.
+        """
+        raise NotImplementedError
+
+    # Quiz results (see quiz.py)
+    def record_quiz_results(self, quiz_id: str, results: list) -> list:
+        """Store a batch of scored quiz submissions in one transaction
+
+        ``results`` holds ``{user_id, answers, outcome, points}`` dicts. Only a
+        user's first result per quiz is kept. For each newly stored result the
+        points are added to ``users.points`` and the count of every chosen
+        option in quiz_answer_counts goes up by one. Returns the updated users
+        rows (id, email, linkedin_id, points).
+        """
+        raise NotImplementedError
+
+    def list_quiz_answer_counts(self, quiz_id: str) -> list:
+        """(question_index, option_index, answer_count) rows of a quiz"""
+        raise NotImplementedError
+
+    def list_quiz_results(self) -> list:
+        """(user_id, quiz_id, answers, outcome) of every stored quiz result"""
+        raise NotImplementedError
+
+
+class SupabaseBackend(StorageBackend):
+    """Remote Supabase (PostgREST) backend"""
+
+    name = 'supabase'
+
+    def __init__(self, supabase_url: str, supabase_key: str):
+        from supabase import create_client
+
+        try:
+            self.client = create_client(supabase_url, supabase_key)
+        except TypeError:
+            # Fallback for different client versions
+            self.client = create_client(
+                supabase_url=supabase_url,
+                supabase_key=supabase_key
+            )
+
+    @staticmethod
+    def _first(result) -> Optional[Dict[str, Any]]:
+        return result.data[0] if result.data else None
+
+    @staticmethod
+    def _all(result) -> list:
+        return result.data if result.data else []
+
+    @staticmethod
+    def _quote(value) -> str:
+        """Quote a value for a raw PostgREST logical filter"""
+        return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    def create_tables(self) -> bool:
+        # Tables are created through the Supabase dashboard or migrations
+        logger.info("Please create the following tables in your Supabase dashboard:")
+        logger.info(POSTGRES_SCHEMA)
+        return True
+
+    def insert_user(self, user_data):
+        return self._first(self.client.table('users').insert(user_data).execute())
+
+    def find_user(self, **filters):
+        query = self.client.table('users').select('*')
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        return self._first(query.execute())
+
+    def update_user(self, user_id, update_data):
+        return self._first(self.client.table('users').update(update_data).eq('id', user_id).execute())
+
+    def find_users(self, user_ids):
+        return self._all(self.client.table('users').select('*').in_('id', user_ids).execute())
+
+    def _scan_users(self, columns: str) -> list:
+        """``columns`` of every user; PostgREST caps a response at 1000 rows, so page through by id"""
+        rows, last_id = [], None
+        while True:
+            query = self.client.table('users').select(columns).order('id').limit(1000)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            page = self._all(query.execute())
+            rows.extend(page)
+            if len(page) < 1000:
+                return rows
+            last_id = page[-1]['id']
+
+    def list_scores(self):
+        return self._scan_users('id, points')
+
+    def list_profiles(self):
+        return self._scan_users('id, birthday')
+
+    def bulk_update_users(self, user_ids, update_data):
+        result = self.client.table('users').update(update_data).in_('id', user_ids).execute()
+        return len(result.data) if result.data else 0
+
+    def find_emails(self, emails):
+        found = set()
+        for start in range(0, len(emails), EMAIL_LOOKUP_CHUNK):
+            chunk = emails[start:start + EMAIL_LOOKUP_CHUNK]
+            found.update(row['email'] for row in self._all(
+                self.client.table('users').select('email').in_('email', chunk).execute()
+            ))
+        return found
+
+    def upsert_linkedin_user(self, user_data):
+        from postgrest.exceptions import APIError
+
+        try:
+            result = self.client.rpc('upsert_linkedin_user', {
+                'p_linkedin_id': user_data['linkedin_id'],
+                'p_email': user_data.get('email'),
+                'p_first_name': user_data.get('first_name'),
+                'p_surname': user_data.get('surname'),
+                'p_profile_picture_url': user_data.get('profile_picture_url'),
+                'p_points': user_data.get('points', 0),
+                'p_rank': user_data.get('rank', 1)
+            }).execute()
+        except APIError as e:
+            # not_null_violation: no email; unique_violation: the email belongs to another member
+            email = (user_data.get('email') or '').strip() or None
+            if (e.code == '23502' and not email) or (e.code == '23505' and email):
+                raise EmailConflict(email) from e
+            raise
+        return self._first(result)
+
+    def insert_users(self, users):
+        # ON CONFLICT DO NOTHING on any unique column: only the rows actually inserted come back
+        result = self.client.rpc('import_users', {'p_users': users}).execute()
+        return self._all(result)
+
+    def list_users(self, exclude_user_id=None, search=None, limit=None, after=None, online_first=False):
+        query = self.client.table('users').select('id, first_name, surname, email, profile_picture_url, is_online, last_seen, login_method, linkedin_id')
+        if exclude_user_id:
+            query = query.neq('id', exclude_user_id)
+
+        conditions = []
+        if search:
+            pattern = self._quote(search.replace('*', '') + '*')
+            conditions.append(
+                f'or(first_name.ilike.{pattern},surname.ilike.{pattern},email.ilike.{pattern})'
+            )
+        if after:
+            *online, first_name, user_id = after
+            first_name, user_id = self._quote(first_name or ''), self._quote(user_id)
+            keyset = f'or(directory_name.gt.{first_name},and(directory_name.eq.{first_name},id.gt.{user_id}))'
+            if online_first:
+                is_online = str(bool(online[0])).lower()
+                keyset = f'or(is_online.lt.{is_online},and(is_online.eq.{is_online},{keyset}))'
+            conditions.append(keyset)
+        if conditions:
+            query.params = query.params.add('and', f'({",".join(conditions)})')
+
+        order = 'directory_name.asc,id.asc'
+        if online_first:
+            order = 'is_online.desc,' + order
+        query.params = query.params.add('order', order)
+        if limit:
+            query = query.limit(limit)
+        return self._all(query.execute())
+
+    def insert_group(self, group_data):
+        return self._first(self.client.table('groups').insert(group_data).execute())
+
+    def insert_group_member(self, member_data):
+        return self._first(self.client.table('group_members').insert(member_data).execute())
+
+    def insert_group_with_owner(self, group_data, member_ids):
+        # One round trip; the create_group_with_owner function runs in a single transaction
+        result = self.client.rpc('create_group_with_owner', {
+            'p_name': group_data['name'],
+            'p_description': group_data.get('description'),
+            'p_created_by': group_data['created_by'],
+            'p_is_private': bool(group_data.get('is_private', False)),
+            'p_member_ids': member_ids
+        }).execute()
+        if isinstance(result.data, list):
+            return result.data[0] if result.data else None
+        return result.data
+
+    def list_user_groups(self, user_id):
+        return self._all(self.client.table('group_members').select('''
+            group_id,
+            groups!inner(id, name, description, created_by, is_private, created_at)
+        ''').eq('user_id', user_id).execute())
+
+    def list_group_members(self, group_id):
+        return self._all(self.client.table('group_members').select('''
+            user_id,
+            role,
+            joined_at,
+            users!inner(id, first_name, surname, email, profile_picture_url, is_online, last_seen)
+        ''').eq('group_id', group_id).execute())
+
+    def insert_message(self, message_data):
+        return self._first(self.client.table('messages').insert(message_data).execute())
+
+    def insert_messages(self, messages):
+        from postgrest.types import ReturnMethod
+
+        self.client.table('messages').upsert(
+            messages, returning=ReturnMethod.minimal, ignore_duplicates=True
+        ).execute()
+
+    def list_messages(self, group_id=None, conversation=None, limit=50, before=None, after=None):
+        query = self.client.table('messages').select('''
+            id,
+            content,
+            message_type,
+            is_read,
+            created_at,
+            sender_id,
+            recipient_id,
+            users!inner(id, first_name, surname, profile_picture_url)
+        ''').limit(limit)
+
+        if group_id:
+            query = query.eq('group_id', group_id)
+        elif conversation:
+            query = query.eq('conversation_key', conversation)
+
+        # postgrest-py 0.10 has no or_() helper and emits one "order" param per
+        # order() call, so the keyset filter and composite sort are added raw.
+        cursor, op = (after, 'gt') if after else (before, 'lt')
+        if cursor:
+            created_at, message_id = cursor
+            created_at, message_id = self._quote(created_at), self._quote(message_id)
+            query.params = query.params.add(
+                'or', f'(created_at.{op}.{created_at},and(created_at.eq.{created_at},id.{op}.{message_id}))'
+            )
+        direction = 'asc' if after else 'desc'
+        query.params = query.params.add('order', f'created_at.{direction},id.{direction}')
+
+        messages = self._all(query.execute())
+        return messages[::-1] if after else messages
+
+    def insert_invitation(self, invitation_data):
+        return self._first(self.client.table('group_invitations').insert(invitation_data).execute())
+
+    def list_pending_invitations(self, user_id):
+        return self._all(self.client.table('group_invitations').select('''
+            id,
+            group_id,
+            invited_by,
+            status,
+            created_at,
+            groups!inner(id, name, description),
+            users!inner(id, first_name, surname)
+        ''').eq('invited_user_id', user_id).eq('status', 'pending').execute())
+
+    def update_invitation(self, invitation_id, update_data):
+        return self._first(self.client.table('group_invitations').update(update_data).eq('id', invitation_id).execute())
+
+    def accept_invitation(self, invitation_id, user_id):
+        result = self.client.rpc('accept_group_invitation', {
+            'p_invitation_id': invitation_id,
+            'p_user_id': user_id
+        }).execute()
+        return result.data or None
+
+    def list_unread(self, user_id):
+        return self._all(
+            self.client.table('unread_counters')
+            .select('chat_type, chat_id, unread_count, last_read_at, last_read_message_id')
+            .eq('user_id', user_id)
+            .gt('unread_count', 0)
+            .execute()
+        )
+
+    def mark_read(self, user_id, chat_type, chat_id, created_at, message_id):
+        result = self.client.rpc('mark_conversation_read', {
+            'p_user_id': user_id,
+            'p_chat_type': chat_type,
+            'p_chat_id': chat_id,
+            'p_created_at': created_at,
+            'p_message_id': message_id
+        }).execute()
+        return result.data or 0
+
+    def record_quiz_results(self, quiz_id, results):
+        result = self.client.rpc('record_quiz_results', {
+            'p_quiz_id': quiz_id,
+            'p_results': results
+        }).execute()
+        return self._all(result)
+
+    def list_quiz_answer_counts(self, quiz_id):
+        return self._all(
+            self.client.table('quiz_answer_counts')
+            .select('question_index, option_index, answer_count')
+            .eq('quiz_id', quiz_id)
+            .execute()
+        )
+
+    def list_quiz_results(self):
+        results, start = [], 0
+        while True:
+            page = self._all(
+                self.client.table('quiz_results')
+                .select('user_id, quiz_id, answers, outcome')
+                .order('user_id').order('quiz_id')
+                .range(start, start + 999)
+                .execute()
+            )
+            results.extend(page)
+            if len(page) < 1000:
+                return results
+            start += 1000
+
+
+class SQLiteBackend(StorageBackend):
+    """Local single-node backend on SQLite (WAL mode)
+
+    Each thread gets its own connection, so gunicorn threads and the Flask
+    dev server can read concurrently while a single writer appends to the WAL.
+    """
+
+    name = 'sqlite'
+
+    _BOOL_COLUMNS = ('is_online', 'is_private', 'is_read')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.create_tables()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    @classmethod
+    def _to_dict(cls, row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert a row to a dict, nesting ``table__column`` aliases like Supabase embeds"""
+        result: Dict[str, Any] = {}
+        for key in row.keys():
+            value = row[key]
+            column = key.split('__', 1)[-1]
+            if column in cls._BOOL_COLUMNS and value is not None:
+                value = bool(value)
+            if '__' in key:
+                embed, _ = key.split('__', 1)
+                result.setdefault(embed, {})[column] = value
+            else:
+                result[key] = value
+        return result
+
+    @staticmethod
+    def _prepare(data: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: (utc_now() if v == NOW else v) for k, v in data.items()}
+
+    def _query(self, sql: str, params=()) -> list:
+        return [self._to_dict(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    def _insert(self, table: str, data: Dict[str, Any], timestamp_column: str = 'created_at') -> Optional[Dict[str, Any]]:
+        row = self._prepare(data)
+        row.setdefault('id', str(uuid.uuid4()))
+        if timestamp_column:
+            row.setdefault(timestamp_column, utc_now())
+        columns = ', '.join(row)
+        placeholders = ', '.join('?' for _ in row)
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) RETURNING *',
+                tuple(row.values())
+            )
+            inserted = cursor.fetchone()
+        return self._to_dict(inserted) if inserted else None
+
+    def _update(self, table: str, row_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        row = self._prepare(data)
+        assignments = ', '.join(f'{column} = ?' for column in row)
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                f'UPDATE {table} SET {assignments} WHERE id = ? RETURNING *',
+                (*row.values(), row_id)
+            )
+            updated = cursor.fetchone()
+        return self._to_dict(updated) if updated else None
+
+    def create_tables(self) -> bool:
+        conn = self._connection()
+        with conn:
+            conn.executescript(SQLITE_SCHEMA)
+        return True
+
+    def insert_user(self, user_data):
+        data = dict(user_data)
+        data.setdefault('last_seen', utc_now())
+        data.setdefault('updated_at', utc_now())
+        return self._insert('users', data)
+
+    def find_user(self, **filters):
+        where = ' AND '.join(f'{column} = ?' for column in filters)
+        rows = self._query(f'SELECT * FROM users WHERE {where} LIMIT 1', tuple(filters.values()))
+        return rows[0] if rows else None
+
+    def update_user(self, user_id, update_data):
+        return self._update('users', user_id, update_data)
+
+    def find_users(self, user_ids):
+        placeholders = ', '.join('?' for _ in user_ids)
+        return self._query(f'SELECT * FROM users WHERE id IN ({placeholders})', tuple(user_ids))
+
+    def list_scores(self):
+        return self._query('SELECT id, points FROM users')
+
+    def list_profiles(self):
+        return self._query('SELECT id, birthday FROM users')
+
+    def bulk_update_users(self, user_ids, update_data):
+        row = self._prepare(update_data)
+        assignments = ', '.join(f'{column} = ?' for column in row)
+        placeholders = ', '.join('?' for _ in user_ids)
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                f'UPDATE users SET {assignments} WHERE id IN ({placeholders})',
+                (*row.values(), *user_ids)
+            )
+        return cursor.rowcount
+
+    def find_emails(self, emails):
+        found = set()
+        for start in range(0, len(emails), SQLITE_MAX_VARIABLES):
+            chunk = emails[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ', '.join('?' for _ in chunk)
+            found.update(row['email'] for row in self._query(
+                f'SELECT email FROM users WHERE email IN ({placeholders})', tuple(chunk)
+            ))
+        return found
+
+    def upsert_linkedin_user(self, user_data):
+        now = utc_now()
+        row = {
+            'id': str(uuid.uuid4()),
+            'linkedin_id': user_data['linkedin_id'],
+            'email': (user_data.get('email') or '').strip() or None,
+            'first_name': user_data.get('first_name'),
+            'surname': user_data.get('surname'),
+            'profile_picture_url': user_data.get('profile_picture_url'),
+            'points': user_data.get('points', 0),
+            'rank': user_data.get('rank', 1),
+            'login_method': 'linkedin',
+            'last_seen': now,
+            'created_at': now,
+            'updated_at': now
+        }
+        columns = ', '.join(row)
+        placeholders = ', '.join('?' for _ in row)
+        profile = (row['first_name'], row['surname'], row['profile_picture_url'], now)
+        conn = self._connection()
+        with conn:
+            # A returning member
+            upserted = conn.execute(
+                '''
+                UPDATE users
+                SET first_name = COALESCE(NULLIF(?, ''), first_name),
+                    surname = COALESCE(NULLIF(?, ''), surname),
+                    profile_picture_url = COALESCE(NULLIF(?, ''), profile_picture_url),
+                    updated_at = ?
+                WHERE linkedin_id = ?
+                RETURNING *
+                ''',
+                (*profile, row['linkedin_id'])
+            ).fetchone()
+            if upserted is None and row['email'] is None:
+                raise EmailConflict(None)
+            if upserted is None:
+                # An email signup or imported attendee logging in with LinkedIn for the first time
+                upserted = conn.execute(
+                    '''
+                    UPDATE users
+                    SET linkedin_id = ?,
+                        first_name = COALESCE(NULLIF(?, ''), first_name),
+                        surname = COALESCE(NULLIF(?, ''), surname),
+                        profile_picture_url = COALESCE(NULLIF(?, ''), profile_picture_url),
+                        updated_at = ?
+                    WHERE email = ? AND linkedin_id IS NULL
+                    RETURNING *
+                    ''',
+                    (row['linkedin_id'], *profile, row['email'])
+                ).fetchone()
+            if upserted is None:
+                try:
+                    upserted = conn.execute(
+                        f'''
+                        INSERT INTO users ({columns}) VALUES ({placeholders})
+                        ON CONFLICT (linkedin_id) DO UPDATE
+                        SET first_name = COALESCE(NULLIF(excluded.first_name, ''), first_name),
+                            surname = COALESCE(NULLIF(excluded.surname, ''), surname),
+                            profile_picture_url = COALESCE(NULLIF(excluded.profile_picture_url, ''), profile_picture_url),
+                            updated_at = excluded.updated_at
+                        RETURNING *
+                        ''',
+                        tuple(row.values())
+                    ).fetchone()
+                except sqlite3.IntegrityError as e:
+                    # The email belongs to a user linked to another LinkedIn account
+                    raise EmailConflict(row['email']) from e
+        return self._to_dict(upserted) if upserted else None
+
+    def insert_users(self, users):
+        now = utc_now()
+        rows = [
+            {'id': str(uuid.uuid4()), 'created_at': now, 'last_seen': now, 'updated_at': now, **self._prepare(user)}
+            for user in users
+        ]
+        columns = list(rows[0])
+        row_placeholders = '(' + ', '.join('?' for _ in columns) + ')'
+        per_statement = max(1, SQLITE_MAX_VARIABLES // len(columns))
+        created = []
+        conn = self._connection()
+        with conn:
+            for start in range(0, len(rows), per_statement):
+                chunk = rows[start:start + per_statement]
+                cursor = conn.execute(
+                    f'INSERT OR IGNORE INTO users ({", ".join(columns)}) '
+                    f'VALUES {", ".join(row_placeholders for _ in chunk)} RETURNING *',
+                    tuple(row[column] for row in chunk for column in columns)
+                )
+                created.extend(self._to_dict(row) for row in cursor.fetchall())
+        return created
+
+    def list_users(self, exclude_user_id=None, search=None, limit=None, after=None, online_first=False):
+        sql = ('SELECT id, first_name, surname, email, profile_picture_url, is_online, last_seen, '
+               'login_method, linkedin_id FROM users')
+        conditions = []
+        params: list = []
+        if exclude_user_id:
+            conditions.append('id != ?')
+            params.append(exclude_user_id)
+
+        if search:
+            # LIKE is case-insensitive and uses the NOCASE indexes for a prefix match
+            pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(first_name LIKE ? ESCAPE '\\' OR surname LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\')")
+            params.extend([pattern] * 3)
+
+        # Users without a first name sort (and page) as '', matching the expression indexes
+        if after:
+            *online, first_name, user_id = after
+            if online_first:
+                conditions.append("(is_online < ? OR (is_online = ? AND (COALESCE(first_name, ''), id) > (?, ?)))")
+                params.extend([int(bool(online[0])), int(bool(online[0])), first_name or '', user_id])
+            else:
+                conditions.append("(COALESCE(first_name, ''), id) > (?, ?)")
+                params.extend([first_name or '', user_id])
+
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ' + ('is_online DESC, ' if online_first else '') + "COALESCE(first_name, ''), id"
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self._query(sql, tuple(params))
+
+    def insert_group(self, group_data):
+        data = dict(group_data)
+        data.setdefault('updated_at', utc_now())
+        return self._insert('groups', data)
+
+    def insert_group_member(self, member_data):
+        return self._insert('group_members', member_data, timestamp_column='joined_at')
+
+    def insert_group_with_owner(self, group_data, member_ids):
+        group = self._prepare(group_data)
+        group.setdefault('id', str(uuid.uuid4()))
+        group.setdefault('created_at', utc_now())
+        joined_at = utc_now()
+        members = [(str(uuid.uuid4()), group['id'], group['created_by'], 'admin', joined_at)]
+        members += [
+            (str(uuid.uuid4()), group['id'], user_id, 'member', joined_at)
+            for user_id in dict.fromkeys(member_ids) if user_id != group['created_by']
+        ]
+        columns = ', '.join(group)
+        placeholders = ', '.join('?' for _ in group)
+        conn = self._connection()
+        with conn:
+            inserted = conn.execute(
+                f'INSERT INTO groups ({columns}) VALUES ({placeholders}) RETURNING *',
+                tuple(group.values())
+            ).fetchone()
+            conn.executemany(
+                'INSERT INTO group_members (id, group_id, user_id, role, joined_at) VALUES (?, ?, ?, ?, ?)',
+                members
+            )
+        return self._to_dict(inserted)
+
+    def list_user_groups(self, user_id):
+        return self._query('''
+            SELECT gm.group_id,
+                   g.id AS groups__id, g.name AS groups__name, g.description AS groups__description,
+                   g.created_by AS groups__created_by, g.is_private AS groups__is_private,
+                   g.created_at AS groups__created_at
+            FROM group_members gm
+            JOIN groups g ON g.id = gm.group_id
+            WHERE gm.user_id = ?
+        ''', (user_id,))
+
+    def list_group_members(self, group_id):
+        return self._query('''
+            SELECT gm.user_id, gm.role, gm.joined_at,
+                   u.id AS users__id, u.first_name AS users__first_name, u.surname AS users__surname,
+                   u.email AS users__email, u.profile_picture_url AS users__profile_picture_url,
+                   u.is_online AS users__is_online, u.last_seen AS users__last_seen
+            FROM group_members gm
+            JOIN users u ON u.id = gm.user_id
+            WHERE gm.group_id = ?
+        ''', (group_id,))
+
+    def insert_message(self, message_data):
+        return self._insert('messages', message_data)
+
+    def insert_messages(self, messages):
+        rows = [self._prepare(message) for message in messages]
+        columns = ', '.join(rows[0])
+        placeholders = ', '.join('?' for _ in rows[0])
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                f'INSERT OR IGNORE INTO messages ({columns}) VALUES ({placeholders})',
+                [tuple(row.values()) for row in rows]
+            )
+
+    def list_messages(self, group_id=None, conversation=None, limit=50, before=None, after=None):
+        sql = '''
+            SELECT m.id, m.content, m.message_type, m.is_read, m.created_at, m.sender_id, m.recipient_id,
+                   u.id AS users__id, u.first_name AS users__first_name, u.surname AS users__surname,
+                   u.profile_picture_url AS users__profile_picture_url
+            FROM messages m
+            JOIN users u ON u.id = m.sender_id
+        '''
+        conditions = []
+        params: list = []
+        if group_id:
+            conditions.append('m.group_id = ?')
+            params.append(group_id)
+        elif conversation:
+            # Same expression as idx_messages_conversation, so this is one index range scan
+            conditions.append(f'{SQLITE_CONVERSATION_KEY} = ?')
+            params.append(conversation)
+
+        # Row-value comparison keeps the range scan on (group_id|conversation, created_at, id)
+        if after:
+            conditions.append('(m.created_at, m.id) > (?, ?)')
+            params.extend(after)
+        elif before:
+            conditions.append('(m.created_at, m.id) < (?, ?)')
+            params.extend(before)
+
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        direction = 'ASC' if after else 'DESC'
+        sql += f' ORDER BY m.created_at {direction}, m.id {direction} LIMIT ?'
+        params.append(limit)
+
+        messages = self._query(sql, tuple(params))
+        return messages[::-1] if after else messages
+
+    def insert_invitation(self, invitation_data):
+        return self._insert('group_invitations', invitation_data)
+
+    def list_pending_invitations(self, user_id):
+        return self._query('''
+            SELECT i.id, i.group_id, i.invited_by, i.status, i.created_at,
+                   g.id AS groups__id, g.name AS groups__name, g.description AS groups__description,
+                   u.id AS users__id, u.first_name AS users__first_name, u.surname AS users__surname
+            FROM group_invitations i
+            JOIN groups g ON g.id = i.group_id
+            JOIN users u ON u.id = i.invited_by
+            WHERE i.invited_user_id = ? AND i.status = 'pending'
+        ''', (user_id,))
+
+    def update_invitation(self, invitation_id, update_data):
+        return self._update('group_invitations', invitation_id, update_data)
+
+    def accept_invitation(self, invitation_id, user_id):
+        conn = self._connection()
+        with conn:
+            accepted = conn.execute('''
+                UPDATE group_invitations
+                SET status = 'accepted', responded_at = COALESCE(responded_at, ?)
+                WHERE id = ? AND invited_user_id = ? AND status IN ('pending', 'accepted')
+                RETURNING group_id
+            ''', (utc_now(), invitation_id, user_id)).fetchone()
+            if accepted is None:
+                return None
+            conn.execute(
+                "INSERT OR IGNORE INTO group_members (id, group_id, user_id, role, joined_at) VALUES (?, ?, ?, 'member', ?)",
+                (str(uuid.uuid4()), accepted['group_id'], user_id, utc_now())
+            )
+        return accepted['group_id']
+
+    def list_unread(self, user_id):
+        return self._query('''
+            SELECT chat_type, chat_id, unread_count, last_read_at, last_read_message_id
+            FROM unread_counters
+            WHERE user_id = ? AND unread_count > 0
+        ''', (user_id,))
+
+    def mark_read(self, user_id, chat_type, chat_id, created_at, message_id):
+        if chat_type == 'user':
+            chat_filter = f'{SQLITE_CONVERSATION_KEY} = ? AND m.sender_id = ?'
+            chat_params = (conversation_key(user_id, chat_id), chat_id)
+        else:
+            chat_filter = 'm.group_id = ? AND m.sender_id != ?'
+            chat_params = (chat_id, user_id)
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO unread_counters (user_id, chat_type, chat_id, unread_count) VALUES (?, ?, ?, 0)',
+                (user_id, chat_type, chat_id)
+            )
+            row = conn.execute('''
+                SELECT last_read_at, last_read_message_id FROM unread_counters
+                WHERE user_id = ? AND chat_type = ? AND chat_id = ?
+            ''', (user_id, chat_type, chat_id)).fetchone()
+            previous = (row['last_read_at'] or '', row['last_read_message_id'] or '')
+
+            cursor = (created_at, message_id)
+            if cursor > previous:
+                conn.execute('''
+                    UPDATE unread_counters SET last_read_at = ?, last_read_message_id = ?, updated_at = ?
+                    WHERE user_id = ? AND chat_type = ? AND chat_id = ?
+                ''', (*cursor, utc_now(), user_id, chat_type, chat_id))
+                if chat_type == 'user':
+                    # Read receipts: only messages between the old and the new cursor change
+                    conn.execute(f'''
+                        UPDATE messages SET is_read = 1 WHERE id IN (
+                            SELECT m.id FROM messages m
+                            WHERE {chat_filter} AND m.is_read = 0
+                              AND (m.created_at, m.id) > (?, ?) AND (m.created_at, m.id) <= (?, ?)
+                        )
+                    ''', (*chat_params, *previous, *cursor))
+            else:
+                cursor = previous
+
+            remaining = conn.execute(
+                f'SELECT COUNT(*) FROM messages m WHERE {chat_filter} AND (m.created_at, m.id) > (?, ?)',
+                (*chat_params, *cursor)
+            ).fetchone()[0]
+            conn.execute(
+                'UPDATE unread_counters SET unread_count = ? WHERE user_id = ? AND chat_type = ? AND chat_id = ?',
+                (remaining, user_id, chat_type, chat_id)
+            )
+        return remaining
+
+    def record_quiz_results(self, quiz_id, results):
+        now = utc_now()
+        conn = self._connection()
+        with conn:
+            recorded = [
+                result for result in results
+                if conn.execute(
+                    'INSERT OR IGNORE INTO quiz_results (quiz_id, user_id, answers, outcome, points, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (quiz_id, result['user_id'], json.dumps(result['answers']), result['outcome'],
+                     result['points'], now)
+                ).rowcount
+            ]
+            if not recorded:
+                return []
+
+            counts = Counter(
+                (question, option)
+                for result in recorded
+                for question, option in enumerate(result['answers'])
+                if option is not None and option >= 0
+            )
+            conn.executemany('''
+                INSERT INTO quiz_answer_counts (quiz_id, question_index, option_index, answer_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (quiz_id, question_index, option_index)
+                DO UPDATE SET answer_count = answer_count + excluded.answer_count
+            ''', [(quiz_id, question, option, count) for (question, option), count in counts.items()])
+
+            conn.executemany(
+                'UPDATE users SET points = COALESCE(points, 0) + ?, updated_at = ? WHERE id = ?',
+                [(result['points'], now, result['user_id']) for result in recorded]
+            )
+            user_ids = [result['user_id'] for result in recorded]
+            placeholders = ', '.join('?' for _ in user_ids)
+            return [self._to_dict(row) for row in conn.execute(
+                f'SELECT id, email, linkedin_id, points FROM users WHERE id IN ({placeholders})', user_ids
+            ).fetchall()]
+
+    def list_quiz_answer_counts(self, quiz_id):
+        return self._query(
+            'SELECT question_index, option_index, answer_count FROM quiz_answer_counts WHERE quiz_id = ?',
+            (quiz_id,)
+        )
+
+    def list_quiz_results(self):
+        rows = self._query('SELECT user_id, quiz_id, answers, outcome FROM quiz_results')
+        for row in rows:
+            row['answers'] = json.loads(row['answers'])
+        return rows
+
+
+# Backend operation -> primary table it touches, for the storage timing metrics
+OPERATION_TABLES = {
+    'create_tables': 'all',
+    'insert_user': 'users',
+    'find_user': 'users',
+    'find_users': 'users',
+    'update_user': 'users',
+    'bulk_update_users': 'users',
+    'find_emails': 'users',
+    'insert_users': 'users',
+    'upsert_linkedin_user': 'users',
+    'list_users': 'users',
+    'list_scores': 'users',
+    'list_profiles': 'users',
+    'insert_group': 'groups',
+    'insert_group_with_owner': 'groups',
+    'insert_group_member': 'group_members',
+    'list_user_groups': 'group_members',
+    'list_group_members': 'group_members',
+    'insert_message': 'messages',
+    'insert_messages': 'messages',
+    'list_messages': 'messages',
+    'list_unread': 'unread_counters',
+    'mark_read': 'unread_counters',
+    'insert_invitation': 'group_invitations',
+    'update_invitation': 'group_invitations',
+    'list_pending_invitations': 'group_invitations',
+    'accept_invitation': 'group_invitations',
+    'record_quiz_results': 'quiz_results',
+    'list_quiz_results': 'quiz_results',
+    'list_quiz_answer_counts': 'quiz_answer_counts',
+}
+
+
+def create_backend(backend_name: str = None) -> Optional[StorageBackend]:
+    """Build the storage backend selected by DATABASE_BACKEND"""
+    backend_name = (backend_name or os.environ.get('DATABASE_BACKEND', 'supabase')).lower()
+
+    if backend_name == 'sqlite':
+        path = os.environ.get('SQLITE_DATABASE_PATH', 'ramble.db')
+        try:
+            backend = SQLiteBackend(path)
+            logger.info(f"SQLite backend initialized successfully: {path}")
+            return backend
+        except Exception as e:
+            logger.error(f"Failed to initialize SQLite backend: {e}")
+            return None
+
+    if backend_name != 'supabase':
+        logger.error(f"Unknown DATABASE_BACKEND '{backend_name}'. Database operations will be disabled.")
+        return None
+
+    supabase_url = os.environ.get('SUPABASE_URL')
+    supabase_key = os.environ.get('SUPABASE_KEY')
+
+    if not supabase_url or not supabase_key:
+        logger.warning("Supabase credentials not found. Database operations will be disabled.")
+        return None
+
+    try:
+        backend = SupabaseBackend(supabase_url, supabase_key)
+        logger.info("Supabase client initialized successfully")
+        return backend
+    except Exception as e:
+        logger.error(f"Failed to initialize Supabase client: {e}")
+        logger.error(f"URL: {supabase_url}")
+        logger.error(f"Key: {supabase_key[:20]}...")
+        return None
+
+
+POSTGRES_SCHEMA = """
+            -- Users table
+            CREATE TABLE users (
+                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+                email VARCHAR(255) UNIQUE NOT NULL,
+                first_name VARCHAR(100),
+                middle_name VARCHAR(100),
+                surname VARCHAR(100),
+                birthday DATE,
+                gender VARCHAR(50),
+                password VARCHAR(255),
+                points INTEGER DEFAULT 0,
+                rank INTEGER DEFAULT 1,
+                login_method VARCHAR(50) DEFAULT 'email',
+                linkedin_id VARCHAR(255) UNIQUE,
+                profile_picture_url TEXT,
+                is_online BOOLEAN DEFAULT FALSE,
+                last_seen TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                -- Directory sort key: users without a first name sort (and page) as ''
+                directory_name VARCHAR(100) GENERATED ALWAYS AS (COALESCE(first_name, '')) STORED
+            );
+
+            -- Groups table
+            CREATE TABLE groups (
+                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                description TEXT,
+                created_by UUID REFERENCES users(id) ON DELETE CASCADE,
+                is_private BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+
+            -- Group members table
+            CREATE TABLE group_members (
+                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+                group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
+                user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+                role VARCHAR(50) DEFAULT 'member', -- 'admin', 'member'
+                joined_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                UNIQUE(group_id, user_id)
+            );
+
+            -- Messages table
+            CREATE TABLE messages (
+                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+                sender_id UUID REFERENCES users(id) ON DELETE CASCADE,
+                group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
+                recipient_id UUID REFERENCES users(id) ON DELETE CASCADE, -- For private messages
+                content TEXT NOT NULL,
+                message_type VARCHAR(50) DEFAULT 'text', -- 'text', 'image', 'file'
+                is_read BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                -- '<lower user id>:<higher user id>' for private messages, NULL for group messages
+                conversation_key TEXT GENERATED ALWAYS AS (
+                    LEAST(sender_id, recipient_id)::text || ':' || GREATEST(sender_id, recipient_id)::text
+                ) STORED
+            );
+
+            -- Per-user unread counters and last-read cursors, one row per chat
+            CREATE TABLE unread_counters (
+                user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+                chat_type VARCHAR(10) NOT NULL, -- 'user' (chat_id is the other user) or 'group'
+                chat_id UUID NOT NULL,
+                unread_count INTEGER NOT NULL DEFAULT 0,
+                last_read_at TIMESTAMP WITH TIME ZONE,
+                last_read_message_id UUID,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                PRIMARY KEY (user_id, chat_type, chat_id)
+            );
+
+            -- Quiz results, one per user per quiz (question sets live in quizzes/*.json)
+            CREATE TABLE quiz_results (
+                quiz_id VARCHAR(100) NOT NULL,
+                user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+                answers INTEGER[] NOT NULL, -- option index per question, -1 if unanswered
+                outcome VARCHAR(100),
+                points INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                PRIMARY KEY (quiz_id, user_id)
+            );
+
+            -- How often each quiz option was chosen, kept up to date as results are recorded
+            CREATE TABLE quiz_answer_counts (
+                quiz_id VARCHAR(100) NOT NULL,
+                question_index INTEGER NOT NULL,
+                option_index INTEGER NOT NULL,
+                answer_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (quiz_id, question_index, option_index)
+            );
+
+            -- Group invitations table
+            CREATE TABLE group_invitations (
+                id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+                group_id UUID REFERENCES groups(id) ON DELETE CASCADE,
+                invited_by UUID REFERENCES users(id) ON DELETE CASCADE,
+                invited_user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+                status VARCHAR(50) DEFAULT 'pending', -- 'pending', 'accepted', 'declined'
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                responded_at TIMESTAMP WITH TIME ZONE
+            );
+
+            -- Create indexes for better performance
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX idx_users_first_name_trgm ON users USING gin (first_name gin_trgm_ops);
+            CREATE INDEX idx_users_surname_trgm ON users USING gin (surname gin_trgm_ops);
+            CREATE INDEX idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+            CREATE INDEX idx_users_directory ON users(directory_name, id);
+            CREATE INDEX idx_users_online_directory ON users(is_online DESC, directory_name, id);
+            CREATE INDEX idx_messages_group_id ON messages(group_id);
+            CREATE INDEX idx_messages_sender_id ON messages(sender_id);
+            CREATE INDEX idx_messages_recipient_id ON messages(recipient_id);
+            CREATE INDEX idx_messages_created_at ON messages(created_at);
+            CREATE INDEX idx_messages_group_created ON messages(group_id, created_at DESC, id DESC);
+            CREATE INDEX idx_messages_recipient_created ON messages(recipient_id, created_at DESC, id DESC);
+            CREATE INDEX idx_messages_conversation ON messages(conversation_key, created_at DESC, id DESC)
+                WHERE conversation_key IS NOT NULL;
+            CREATE INDEX idx_group_members_group_id ON group_members(group_id);
+            CREATE INDEX idx_group_members_user_id ON group_members(user_id);
+            CREATE INDEX idx_group_invitations_group_id ON group_invitations(group_id);
+            CREATE INDEX idx_group_invitations_invited_user_id ON group_invitations(invited_user_id);
+
+            -- Create a group with its creator as admin and initial members in one
+            -- transaction (called over RPC by SupabaseBackend.insert_group_with_owner)
+            CREATE OR REPLACE FUNCTION create_group_with_owner(
+                p_name VARCHAR,
+                p_description TEXT,
+                p_created_by UUID,
+                p_is_private BOOLEAN DEFAULT FALSE,
+                p_member_ids UUID[] DEFAULT '{}'
+            ) RETURNS groups AS $$
+            DECLARE
+                new_group groups;
+            BEGIN
+                INSERT INTO groups (name, description, created_by, is_private)
+                VALUES (p_name, p_description, p_created_by, p_is_private)
+                RETURNING * INTO new_group;
+
+                INSERT INTO group_members (group_id, user_id, role)
+                VALUES (new_group.id, p_created_by, 'admin');
+
+                INSERT INTO group_members (group_id, user_id, role)
+                SELECT DISTINCT new_group.id, member_id, 'member'
+                FROM unnest(p_member_ids) AS member_id
+                WHERE member_id <> p_created_by;
+
+                RETURN new_group;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            -- Accept an invitation and add the invitee to the group in one transaction.
+            -- Returns the group id (NULL if not found/declined); accepting twice is a no-op.
+            CREATE OR REPLACE FUNCTION accept_group_invitation(
+                p_invitation_id UUID,
+                p_user_id UUID
+            ) RETURNS UUID AS $$
+            DECLARE
+                accepted_group_id UUID;
+            BEGIN
+                UPDATE group_invitations
+                SET status = 'accepted', responded_at = COALESCE(responded_at, NOW())
+                WHERE id = p_invitation_id AND invited_user_id = p_user_id AND status IN ('pending', 'accepted')
+                RETURNING group_id INTO accepted_group_id;
+
+                IF accepted_group_id IS NOT NULL THEN
+                    INSERT INTO group_members (group_id, user_id, role)
+                    VALUES (accepted_group_id, p_user_id, 'member')
+                    ON CONFLICT (group_id, user_id) DO NOTHING;
+                END IF;
+
+                RETURN accepted_group_id;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            -- Count a new message as unread for its recipient, or for every other group
+            -- member (keeps unread_counters current without scanning messages)
+            CREATE OR REPLACE FUNCTION count_unread_message() RETURNS TRIGGER AS $$
+            BEGIN
+                IF NEW.recipient_id IS NOT NULL AND NEW.recipient_id <> NEW.sender_id THEN
+                    INSERT INTO unread_counters (user_id, chat_type, chat_id, unread_count, updated_at)
+                    VALUES (NEW.recipient_id, 'user', NEW.sender_id, 1, NEW.created_at)
+                    ON CONFLICT (user_id, chat_type, chat_id)
+                    DO UPDATE SET unread_count = unread_counters.unread_count + 1, updated_at = EXCLUDED.updated_at;
+                ELSIF NEW.group_id IS NOT NULL THEN
+                    INSERT INTO unread_counters (user_id, chat_type, chat_id, unread_count, updated_at)
+                    SELECT user_id, 'group', NEW.group_id, 1, NEW.created_at
+                    FROM group_members
+                    WHERE group_id = NEW.group_id AND user_id <> NEW.sender_id
+                    ORDER BY user_id
+                    ON CONFLICT (user_id, chat_type, chat_id)
+                    DO UPDATE SET unread_count = unread_counters.unread_count + 1, updated_at = EXCLUDED.updated_at;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER trg_messages_unread AFTER INSERT ON messages
+                FOR EACH ROW EXECUTE FUNCTION count_unread_message();
+
+            -- Advance a user's last-read cursor in a chat, flag private messages up to it
+            -- as read and return the exact number still unread (called over RPC by
+            -- SupabaseBackend.mark_read)
+            CREATE OR REPLACE FUNCTION mark_conversation_read(
+                p_user_id UUID,
+                p_chat_type VARCHAR,
+                p_chat_id UUID,
+                p_created_at TIMESTAMP WITH TIME ZONE,
+                p_message_id UUID
+            ) RETURNS INTEGER AS $$
+            DECLARE
+                chat_key TEXT := LEAST(p_user_id, p_chat_id)::text || ':' || GREATEST(p_user_id, p_chat_id)::text;
+                read_at TIMESTAMP WITH TIME ZONE;
+                read_id UUID;
+                remaining INTEGER;
+            BEGIN
+                INSERT INTO unread_counters (user_id, chat_type, chat_id)
+                VALUES (p_user_id, p_chat_type, p_chat_id)
+                ON CONFLICT (user_id, chat_type, chat_id) DO NOTHING;
+
+                SELECT last_read_at, last_read_message_id INTO read_at, read_id
+                FROM unread_counters
+                WHERE user_id = p_user_id AND chat_type = p_chat_type AND chat_id = p_chat_id
+                FOR UPDATE;
+
+                IF read_at IS NULL OR (p_created_at, p_message_id) > (read_at, read_id) THEN
+                    IF p_chat_type = 'user' THEN
+                        UPDATE messages SET is_read = TRUE
+                        WHERE conversation_key = chat_key AND sender_id = p_chat_id AND NOT is_read
+                          AND (created_at, id) <= (p_created_at, p_message_id)
+                          AND (read_at IS NULL OR (created_at, id) > (read_at, read_id));
+                    END IF;
+                    read_at := p_created_at;
+                    read_id := p_message_id;
+                END IF;
+
+                IF p_chat_type = 'user' THEN
+                    SELECT COUNT(*) INTO remaining FROM messages
+                    WHERE conversation_key = chat_key AND sender_id = p_chat_id AND (created_at, id) > (read_at, read_id);
+                ELSE
+                    SELECT COUNT(*) INTO remaining FROM messages
+                    WHERE group_id = p_chat_id AND sender_id <> p_user_id AND (created_at, id) > (read_at, read_id);
+                END IF;
+
+                UPDATE unread_counters
+                SET unread_count = remaining, last_read_at = read_at, last_read_message_id = read_id, updated_at = NOW()
+                WHERE user_id = p_user_id AND chat_type = p_chat_type AND chat_id = p_chat_id;
+                RETURN remaining;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            -- Store a batch of scored quiz submissions (a user's first result per quiz wins),
+            -- add their points and answer counts, and return the users whose points changed
+            -- (called over RPC by SupabaseBackend.record_quiz_results)
+            CREATE OR REPLACE FUNCTION record_quiz_results(p_quiz_id VARCHAR, p_results JSONB)
+            RETURNS TABLE (id UUID, email VARCHAR, linkedin_id VARCHAR, points INTEGER) AS $$
+                WITH recorded AS (
+                    INSERT INTO quiz_results (quiz_id, user_id, answers, outcome, points)
+                    SELECT p_quiz_id, r.user_id, r.answers, r.outcome, r.points
+                    FROM jsonb_to_recordset(p_results)
+                        AS r(user_id UUID, answers INTEGER[], outcome VARCHAR, points INTEGER)
+                    ON CONFLICT (quiz_id, user_id) DO NOTHING
+                    RETURNING user_id, answers, points
+                ), counted AS (
+                    INSERT INTO quiz_answer_counts (quiz_id, question_index, option_index, answer_count)
+                    SELECT p_quiz_id, a.question_number - 1, a.option_index, COUNT(*)
+                    FROM recorded, unnest(recorded.answers) WITH ORDINALITY AS a(option_index, question_number)
+                    WHERE a.option_index >= 0
+                    GROUP BY a.question_number, a.option_index
+                    ON CONFLICT (quiz_id, question_index, option_index)
+                    DO UPDATE SET answer_count = quiz_answer_counts.answer_count + EXCLUDED.answer_count
+                )
+                UPDATE users u
+                SET points = COALESCE(u.points, 0) + recorded.points, updated_at = NOW()
+                FROM recorded
+                WHERE u.id = recorded.user_id
+                RETURNING u.id, u.email, u.linkedin_id, u.points;
+            $$ LANGUAGE sql;
+
+            -- Create a LinkedIn user, attach the LinkedIn id to the user who registered with the same
+            -- email, or refresh the name and picture of a returning one, and return the row in one
+            -- round trip (called over RPC by SupabaseBackend.upsert_linkedin_user). A new member
+            -- without an email raises not_null_violation, and one whose email belongs to another
+            -- LinkedIn account raises unique_violation; neither takes over an existing user.
+            CREATE OR REPLACE FUNCTION upsert_linkedin_user(
+                p_linkedin_id VARCHAR,
+                p_email VARCHAR,
+                p_first_name VARCHAR,
+                p_surname VARCHAR,
+                p_profile_picture_url TEXT,
+                p_points INTEGER,
+                p_rank INTEGER
+            ) RETURNS SETOF users AS $$
+            DECLARE
+                member_email VARCHAR := NULLIF(TRIM(p_email), '');
+                member users%ROWTYPE;
+            BEGIN
+                -- A returning member
+                UPDATE users
+                SET first_name = COALESCE(NULLIF(p_first_name, ''), users.first_name),
+                    surname = COALESCE(NULLIF(p_surname, ''), users.surname),
+                    profile_picture_url = COALESCE(NULLIF(p_profile_picture_url, ''), users.profile_picture_url),
+                    updated_at = NOW()
+                WHERE linkedin_id = p_linkedin_id
+                RETURNING * INTO member;
+                IF FOUND THEN
+                    RETURN NEXT member;
+                    RETURN;
+                END IF;
+
+                IF member_email IS NULL THEN
+                    RAISE EXCEPTION 'LinkedIn member % has no email address', p_linkedin_id
+                        USING ERRCODE = 'not_null_violation';
+                END IF;
+
+                -- An email signup or imported attendee logging in with LinkedIn for the first time
+                UPDATE users
+                SET linkedin_id = p_linkedin_id,
+                    first_name = COALESCE(NULLIF(p_first_name, ''), users.first_name),
+                    surname = COALESCE(NULLIF(p_surname, ''), users.surname),
+                    profile_picture_url = COALESCE(NULLIF(p_profile_picture_url, ''), users.profile_picture_url),
+                    updated_at = NOW()
+                WHERE email = member_email AND linkedin_id IS NULL
+                RETURNING * INTO member;
+                IF FOUND THEN
+                    RETURN NEXT member;
+                    RETURN;
+                END IF;
+
+                -- A new member; a concurrent first login of the same member becomes a refresh
+                INSERT INTO users (linkedin_id, email, first_name, surname, profile_picture_url, points, rank, login_method)
+                VALUES (p_linkedin_id, member_email, p_first_name, p_surname, p_profile_picture_url, p_points, p_rank, 'linkedin')
+                ON CONFLICT (linkedin_id) DO UPDATE
+                SET first_name = COALESCE(NULLIF(EXCLUDED.first_name, ''), users.first_name),
+                    surname = COALESCE(NULLIF(EXCLUDED.surname, ''), users.surname),
+                    profile_picture_url = COALESCE(NULLIF(EXCLUDED.profile_picture_url, ''), users.profile_picture_url),
+                    updated_at = NOW()
+                RETURNING * INTO member;
+                RETURN NEXT member;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            -- Insert a batch of users, skipping any row whose email or linkedin_id is already taken,
+            -- and return the rows created (called over RPC by SupabaseBackend.insert_users)
+            CREATE OR REPLACE FUNCTION import_users(p_users JSONB) RETURNS SETOF users AS $$
+                INSERT INTO users (email, first_name, middle_name, surname, birthday, gender, password, points, rank,
+                                   login_method, linkedin_id)
+                SELECT r.email, r.first_name, r.middle_name, r.surname, r.birthday, r.gender, r.password,
+                       COALESCE(r.points, 0), COALESCE(r.rank, 1), COALESCE(r.login_method, 'email'), r.linkedin_id
+                FROM jsonb_to_recordset(p_users) AS r(
+                    email VARCHAR, first_name VARCHAR, middle_name VARCHAR, surname VARCHAR, birthday DATE, gender VARCHAR,
+                    password VARCHAR, points INTEGER, rank INTEGER, login_method VARCHAR, linkedin_id VARCHAR
+                )
+                ON CONFLICT DO NOTHING
+                RETURNING *;
+            $$ LANGUAGE sql;
+            """
+
+# Canonical conversation key of a private message, as an SQL expression (see conversation_key)
+SQLITE_CONVERSATION_KEY = "min(m.sender_id, m.recipient_id) || ':' || max(m.sender_id, m.recipient_id)"
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    first_name TEXT,
+    middle_name TEXT,
+    surname TEXT,
+    birthday TEXT,
+    gender TEXT,
+    password TEXT,
+    points INTEGER DEFAULT 0,
+    rank INTEGER DEFAULT 1,
+    login_method TEXT DEFAULT 'email',
+    linkedin_id TEXT UNIQUE,
+    profile_picture_url TEXT,
+    is_online INTEGER DEFAULT 0,
+    last_seen TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS groups (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    created_by TEXT REFERENCES users(id) ON DELETE CASCADE,
+    is_private INTEGER DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS group_members (
+    id TEXT PRIMARY KEY,
+    group_id TEXT REFERENCES groups(id) ON DELETE CASCADE,
+    user_id TEXT REFERENCES users(id) ON DELETE CASCADE,
+    role TEXT DEFAULT 'member',
+    joined_at TEXT,
+    UNIQUE(group_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    sender_id TEXT REFERENCES users(id) ON DELETE CASCADE,
+    group_id TEXT REFERENCES groups(id) ON DELETE CASCADE,
+    recipient_id TEXT REFERENCES users(id) ON DELETE CASCADE,
+    content TEXT NOT NULL,
+    message_type TEXT DEFAULT 'text',
+    is_read INTEGER DEFAULT 0,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS group_invitations (
+    id TEXT PRIMARY KEY,
+    group_id TEXT REFERENCES groups(id) ON DELETE CASCADE,
+    invited_by TEXT REFERENCES users(id) ON DELETE CASCADE,
+    invited_user_id TEXT REFERENCES users(id) ON DELETE CASCADE,
+    status TEXT DEFAULT 'pending',
+    created_at TEXT,
+    responded_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_first_name_nocase ON users(first_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_surname_nocase ON users(surname COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_directory_name ON users(COALESCE(first_name, ''), id);
+CREATE INDEX IF NOT EXISTS idx_users_online_directory_name ON users(is_online DESC, COALESCE(first_name, ''), id);
+CREATE INDEX IF NOT EXISTS idx_messages_group_id ON messages(group_id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender_id ON messages(sender_id);
+CREATE INDEX IF NOT EXISTS idx_messages_recipient_id ON messages(recipient_id);
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_group_created ON messages(group_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_recipient_created ON messages(recipient_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation
+    ON messages(min(sender_id, recipient_id) || ':' || max(sender_id, recipient_id), created_at, id);
+CREATE INDEX IF NOT EXISTS idx_group_members_group_id ON group_members(group_id);
+CREATE INDEX IF NOT EXISTS idx_group_members_user_id ON group_members(user_id);
+CREATE INDEX IF NOT EXISTS idx_group_invitations_group_id ON group_invitations(group_id);
+CREATE INDEX IF NOT EXISTS idx_group_invitations_invited_user_id ON group_invitations(invited_user_id);
+
+CREATE TABLE IF NOT EXISTS unread_counters (
+    user_id TEXT REFERENCES users(id) ON DELETE CASCADE,
+    chat_type TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    last_read_at TEXT,
+    last_read_message_id TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (user_id, chat_type, chat_id)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_unread AFTER INSERT ON messages
+BEGIN
+    INSERT INTO unread_counters (user_id, chat_type, chat_id, unread_count, updated_at)
+    SELECT NEW.recipient_id, 'user', NEW.sender_id, 1, NEW.created_at
+    WHERE NEW.recipient_id IS NOT NULL AND NEW.recipient_id != NEW.sender_id
+    ON CONFLICT (user_id, chat_type, chat_id)
+    DO UPDATE SET unread_count = unread_count + 1, updated_at = excluded.updated_at;
+
+    INSERT INTO unread_counters (user_id, chat_type, chat_id, unread_count, updated_at)
+    SELECT user_id, 'group', NEW.group_id, 1, NEW.created_at
+    FROM group_members
+    WHERE NEW.group_id IS NOT NULL AND group_id = NEW.group_id AND user_id != NEW.sender_id
+    ON CONFLICT (user_id, chat_type, chat_id)
+    DO UPDATE SET unread_count = unread_count + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TABLE IF NOT EXISTS quiz_results (
+    quiz_id TEXT NOT NULL,
+    user_id TEXT REFERENCES users(id) ON DELETE CASCADE,
+    answers TEXT NOT NULL,
+    outcome TEXT,
+    points INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    PRIMARY KEY (quiz_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS quiz_answer_counts (
+    quiz_id TEXT NOT NULL,
+    question_index INTEGER NOT NULL,
+    option_index INTEGER NOT NULL,
+    answer_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (quiz_id, question_index, option_index)
+);
+"""
@@ -0,0 +1,86 @@
+"""
+Shared fixtures: every test runs against a fresh SQLite database
+
+The app module reads its configuration from the environment at import time,
+so the test environment is set up here, before anything imports it.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_scratch = tempfile.mkdtemp(prefix='ramble-tests-')
+os.environ.update({
+    'APP_ENV': 'development',
+    'LOG_LEVEL': 'WARNING',
+    'DATABASE_BACKEND': 'sqlite',
+    'SQLITE_DATABASE_PATH': os.path.join(_scratch, 'app.db'),
+    'SESSION_BACKEND': 'filesystem',
+    'SESSION_FILE_DIR': os.path.join(_scratch, 'sessions'),
+    'PUBSUB_BACKEND': 'memory',
+    'CACHE_BACKEND': 'memory',
+    'PRESENCE_BACKEND': 'memory',
+    'LEADERBOARD_BACKEND': 'memory',
+    'MESSAGE_WRITE_BEHIND': '0',
+    'IMPORT_TOKEN': 'test-import-token',
+    'SECRET_KEY': 'test-secret',
+})
+
+import pytest
+
+import database
+from database import DatabaseManager
+from storage import SQLiteBackend
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'linkedin(latency_ms=0, faults=None): configure the fake LinkedIn server')
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / 'ramble.db'))
+
+
+@pytest.fixture
+def db_manager(backend, monkeypatch):
+    """A DatabaseManager over the test backend, installed as the app's manager"""
+    manager = DatabaseManager(backend=backend)
+    monkeypatch.setattr(database, 'db_manager', manager)
+    monkeypatch.setattr(database, 'async_db_manager', None)
+    return manager
+
+
+@pytest.fixture
+def app(db_manager):
+    from app import app as flask_app
+
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(backend):
+    """Insert a users row directly and return it"""
+    def make(email, first_name='Test', **fields):
+        return backend.insert_user({'email': email, 'first_name': first_name, 'points': 0, 'rank': 1,
+                                    'login_method': 'email', **fields})
+    return make
+
+
+@pytest.fixture
+def sign_in_as(client):
+    """Give the test client a signed-in session for a users row"""
+    def sign_in(user):
+        # Page routes skip the session store, so open the session on an API path
+        with client.session_transaction('/api/user') as session:
+            session['user_id'] = user['id']
+            session['login_method'] = user.get('login_method') or 'email'
+    return sign_in
@@ -0,0 +1,105 @@
+"""Bulk attendee import: the endpoint, per-row reporting and the SQLite batch insert"""
+import io
+import json
+
+import pytest
+
+from attendee_import import import_attendees, read_rows
+
+AUTH = {'Authorization': 'Bearer test-import-token'}
+
+CSV = (
+    'email,firstName,surname,birthday,points\n'
+    'ada@example.com,Ada,Lovelace,1990-12-10,10\n'
+    'not-an-email,Bad,Row,,\n'
+    'grace@example.com,,Hopper,,\n'
+    'ada@example.com,Ada,Again,,\n'
+    'taken@example.com,Taken,User,,\n'
+    'alan@example.com,Alan,Turing,1912-06-23x,\n'
+    'edsger@example.com,Edsger,Dijkstra,,5\n'
+)
+
+
+def post_import(client, body, content_type='text/csv', query='', headers=AUTH):
+    return client.post(f'/api/admin/attendees/import{query}', data=body, content_type=content_type, headers=headers)
+
+
+def test_import_requires_the_token(client, monkeypatch):
+    assert post_import(client, CSV, headers={}).status_code == 401
+    assert post_import(client, CSV, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    monkeypatch.delenv('IMPORT_TOKEN')
+    assert post_import(client, CSV).status_code == 403
+
+
+def test_csv_import_creates_valid_rows_and_reports_the_rest(client, db_manager, backend, make_user):
+    make_user('taken@example.com', 'Taken')
+
+    response = post_import(client, CSV)
+    assert response.status_code == 200
+    report = response.get_json()
+
+    assert (report['rows'], report['created'], report['already_registered'], report['failed']) == (7, 2, 1, 4)
+    errors = {error['line']: error['error'] for error in report['errors']}
+    assert set(errors) == {3, 4, 5, 7}
+    assert errors[3].startswith('Invalid email')
+    assert errors[4] == 'firstName is required'
+    assert errors[5] == 'Duplicate of line 2'
+    assert errors[7].startswith('Invalid birthday')
+
+    ada = backend.find_user(email='ada@example.com')
+    assert (ada['first_name'], ada['surname'], ada['points'], ada['login_method']) == ('Ada', 'Lovelace', 10, 'email')
+    assert db_manager.leaderboard.rank(ada['id']) == 1
+    assert backend.find_user(email='grace@example.com') is None
+
+
+def test_jsonl_import_reports_a_taken_linkedin_id_without_failing_the_chunk(client, backend, make_user):
+    make_user('member@example.com', 'Member', linkedin_id='li-1')
+    body = '\n'.join([
+        json.dumps({'email': 'new@example.com', 'firstName': 'New', 'linkedin_id': 'li-1'}),
+        json.dumps({'email': 'other@example.com', 'first_name': 'Other', 'linkedinId': 'li-2'}),
+        '{broken',
+        json.dumps(['not', 'an', 'object']),
+    ]) + '\n'
+
+    report = post_import(client, body, content_type='application/x-ndjson').get_json()
+
+    assert (report['created'], report['failed']) == (1, 3)
+    errors = {error['line']: error['error'] for error in report['errors']}
+    assert set(errors) == {1, 3, 4}
+    assert errors[1] == 'Conflicts with an existing user'
+    other = backend.find_user(email='other@example.com')
+    assert (other['linkedin_id'], other['login_method']) == ('li-2', 'linkedin')
+
+
+def test_multipart_upload_with_format_override(client, backend):
+    body = json.dumps({'email': 'ada@example.com', 'firstName': 'Ada'}) + '\n'
+    response = client.post('/api/admin/attendees/import?format=jsonl', headers=AUTH,
+                           data={'file': (io.BytesIO(body.encode()), 'attendees.txt')})
+    assert response.get_json()['created'] == 1
+    assert backend.find_user(email='ada@example.com') is not None
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 500])
+def test_import_in_chunks_creates_every_row_once(db_manager, backend, chunk_size):
+    rows = ''.join(f'email,firstName\n' if i == 0 else f'person{i}@example.com,Person{i}\n' for i in range(11))
+
+    report = import_attendees(db_manager, read_rows(io.StringIO(rows), 'csv'), chunk_size=chunk_size)
+    again = import_attendees(db_manager, read_rows(io.StringIO(rows), 'csv'), chunk_size=chunk_size)
+
+    assert (report['created'], report['failed']) == (10, 0)
+    assert (again['created'], again['already_registered']) == (0, 10)
+    assert len(backend.find_emails([f'person{i}@example.com' for i in range(1, 11)])) == 10
+
+
+def test_insert_users_skips_rows_that_clash_on_any_unique_column(backend, make_user):
+    make_user('taken@example.com', linkedin_id='li-1')
+    columns = {'first_name': 'X', 'points': 0, 'rank': 1, 'login_method': 'email'}
+
+    created = backend.insert_users([
+        {'email': 'taken@example.com', 'linkedin_id': None, **columns},
+        {'email': 'fresh@example.com', 'linkedin_id': 'li-1', **columns},
+        {'email': 'ok@example.com', 'linkedin_id': 'li-2', **columns},
+    ])
+
+    assert [user['email'] for user in created] == ['ok@example.com']
@@ -0,0 +1,76 @@
+"""/api/chat/stream relays groups the user joins after connecting"""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def open_stream(client, sign_in_as, monkeypatch):
+    """Connect a user's event stream; yields a function returning its next non-presence event"""
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'SSE_HEARTBEAT_SECONDS', 0.05)
+    responses = []
+
+    def open_for(user):
+        sign_in_as(user)
+        response = client.get('/api/chat/stream', buffered=False)
+        assert response.status_code == 200
+        responses.append(response)
+        chunks = iter(response.response)
+        assert next(chunks).startswith(b'retry:')  # subscribed from here on
+
+        def next_event(max_chunks=40):
+            for _ in range(max_chunks):
+                chunk = next(chunks).decode()
+                if chunk.startswith('event:') and not chunk.startswith('event: presence'):
+                    name, data = chunk.strip().split('\n')
+                    return name.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+            return None
+
+        return next_event
+
+    yield open_for
+    for response in responses:
+        response.close()
+
+
+def test_stream_relays_a_group_created_after_connecting(db_manager, make_user, open_stream):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    next_event = open_stream(bob)
+
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']}, member_ids=[bob['id']])
+    assert next_event() == ('group_joined', {'group_id': group['id'], 'user_id': bob['id']})
+
+    message = db_manager.send_message({'sender_id': alice['id'], 'group_id': group['id'], 'content': 'welcome'})
+    event, data = next_event()
+    assert event == 'message'
+    assert data['id'] == message['id']
+    assert data['users']['first_name'] == 'Alice'
+
+
+def test_stream_relays_a_group_joined_by_invitation(db_manager, make_user, open_stream):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']})
+    invitation = db_manager.create_group_invitation({
+        'group_id': group['id'],
+        'invited_by': alice['id'],
+        'invited_user_id': bob['id']
+    })
+    next_event = open_stream(bob)
+
+    db_manager.accept_invitation(invitation['id'], bob['id'])
+    assert next_event() == ('group_joined', {'group_id': group['id'], 'user_id': bob['id']})
+
+    db_manager.send_message({'sender_id': alice['id'], 'group_id': group['id'], 'content': 'hi bob'})
+    assert next_event()[1]['content'] == 'hi bob'
+
+
+def test_stream_does_not_relay_other_groups(db_manager, make_user, open_stream):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    next_event = open_stream(bob)
+
+    group = db_manager.create_group_with_owner({'name': 'Hall B', 'created_by': alice['id']})
+    db_manager.send_message({'sender_id': alice['id'], 'group_id': group['id'], 'content': 'not for bob'})
+
+    assert next_event(max_chunks=5) is None
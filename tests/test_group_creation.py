@@ -0,0 +1,58 @@
+"""create_group_with_owner: the group, its admin and initial members in one transaction"""
+
+
+def count(backend, table):
+    return backend._query(f'SELECT COUNT(*) AS n FROM {table}')[0]['n']
+
+
+def roles(backend, group_id):
+    return {member['user_id']: member['role'] for member in backend.list_group_members(group_id)}
+
+
+def test_owner_is_admin_and_members_are_added_once(db_manager, backend, make_user):
+    alice, bob, carol = (make_user(f'{name}@example.com', name.title()) for name in ('alice', 'bob', 'carol'))
+
+    group = db_manager.create_group_with_owner(
+        {'name': 'Hall A', 'description': 'Track A', 'created_by': alice['id']},
+        member_ids=[bob['id'], carol['id'], bob['id'], alice['id']]
+    )
+
+    assert group['name'] == 'Hall A'
+    assert group['created_by'] == alice['id']
+    assert roles(backend, group['id']) == {alice['id']: 'admin', bob['id']: 'member', carol['id']: 'member'}
+    assert count(backend, 'group_members') == 3
+
+
+def test_new_group_shows_up_in_cached_group_lists(db_manager, make_user):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    assert db_manager.get_user_groups(bob['id']) == []  # cached empty list
+
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']}, member_ids=[bob['id']])
+
+    assert [membership['group_id'] for membership in db_manager.get_user_groups(bob['id'])] == [group['id']]
+    assert [membership['group_id'] for membership in db_manager.get_user_groups(alice['id'])] == [group['id']]
+
+
+def test_failed_member_insert_leaves_nothing_behind(db_manager, backend, make_user):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']},
+                                               member_ids=[bob['id'], 'no-such-user'])
+
+    assert group is None
+    assert count(backend, 'groups') == 0
+    assert count(backend, 'group_members') == 0
+    assert db_manager.get_user_groups(alice['id']) == []
+
+
+def test_create_group_endpoint(client, backend, make_user, sign_in_as):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    sign_in_as(alice)
+
+    response = client.post('/api/chat/groups', json={'name': 'Hall A', 'member_ids': [bob['id']]})
+    assert response.status_code == 200
+    assert roles(backend, response.get_json()['id']) == {alice['id']: 'admin', bob['id']: 'member'}
+
+    assert client.post('/api/chat/groups', json={'name': 'Hall B', 'member_ids': 'bob'}).status_code == 400
+    assert client.post('/api/chat/groups', json={'name': 'Hall C', 'member_ids': ['no-such-user']}).status_code == 500
+    assert count(backend, 'groups') == 1
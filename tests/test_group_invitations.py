@@ -0,0 +1,58 @@
+"""Accepting a group invitation, including repeated and concurrent accepts"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def invitation(db_manager, make_user):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']})
+    return db_manager.create_group_invitation({
+        'group_id': group['id'],
+        'invited_by': alice['id'],
+        'invited_user_id': bob['id']
+    })
+
+
+def memberships(backend, invitation):
+    return [member for member in backend.list_group_members(invitation['group_id'])
+            if member['user_id'] == invitation['invited_user_id']]
+
+
+def test_accepting_twice_returns_the_same_group_and_one_membership(client, backend, invitation, sign_in_as):
+    sign_in_as({'id': invitation['invited_user_id']})
+    url = f"/api/chat/invitations/{invitation['id']}/respond"
+
+    responses = [client.post(url, json={'status': 'accepted'}) for _ in range(2)]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert [response.get_json() for response in responses] == [{'success': True, 'group_id': invitation['group_id']}] * 2
+    assert len(memberships(backend, invitation)) == 1
+    assert client.get('/api/chat/invitations').get_json() == []
+
+
+def test_concurrent_accepts_add_a_single_membership(db_manager, backend, invitation):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: db_manager.accept_invitation(invitation['id'], invitation['invited_user_id']),
+                                range(8)))
+
+    assert results == [invitation['group_id']] * 8
+    assert len(memberships(backend, invitation)) == 1
+
+
+def test_only_the_invited_user_can_accept(client, backend, invitation, make_user, sign_in_as):
+    sign_in_as(make_user('mallory@example.com', 'Mallory'))
+
+    response = client.post(f"/api/chat/invitations/{invitation['id']}/respond", json={'status': 'accepted'})
+
+    assert response.status_code == 404
+    assert backend.list_group_members(invitation['group_id'])[0]['role'] == 'admin'
+    assert len(backend.list_group_members(invitation['group_id'])) == 1
+
+
+def test_a_declined_invitation_cannot_be_accepted(db_manager, backend, invitation):
+    assert db_manager.respond_to_invitation(invitation['id'], 'declined')
+
+    assert db_manager.accept_invitation(invitation['id'], invitation['invited_user_id']) is None
+    assert memberships(backend, invitation) == []
@@ -0,0 +1,75 @@
+"""Leaderboard ranks, ties, and updates racing a reload"""
+import threading
+
+import pytest
+
+from leaderboard import InMemoryLeaderboardStore, LeaderboardService
+
+
+@pytest.fixture
+def scores():
+    return {'ada': 50, 'bob': 40, 'cy': 40, 'dee': 30, 'eve': 10}
+
+
+@pytest.fixture
+def leaderboard(scores):
+    return LeaderboardService(InMemoryLeaderboardStore(), load=lambda: dict(scores), refresh_seconds=0)
+
+
+def ranking(rows):
+    return [(row['user_id'], row['points'], row['rank']) for row in rows]
+
+
+def test_ties_share_a_competition_rank(leaderboard):
+    assert ranking(leaderboard.top(10)) == [
+        ('ada', 50, 1), ('bob', 40, 2), ('cy', 40, 2), ('dee', 30, 4), ('eve', 10, 5)
+    ]
+    assert [leaderboard.rank(user_id) for user_id in ('ada', 'bob', 'cy', 'dee')] == [1, 2, 2, 4]
+    assert leaderboard.rank('nobody') is None
+    assert leaderboard.count() == 5
+
+
+def test_around_returns_neighbours_with_positions(leaderboard):
+    rows = leaderboard.around('dee', 1)
+    assert ranking(rows) == [('cy', 40, 2), ('dee', 30, 4), ('eve', 10, 5)]
+    assert [row['position'] for row in rows] == [2, 3, 4]
+    assert leaderboard.around('nobody', 1) == []
+
+
+def test_updates_move_users_and_break_ties(leaderboard):
+    leaderboard.set_points('cy', 45)
+    leaderboard.set_points('eve', 50)
+    leaderboard.remove('bob')
+
+    assert ranking(leaderboard.top(10)) == [('ada', 50, 1), ('eve', 50, 1), ('cy', 45, 3), ('dee', 30, 4)]
+
+
+def test_updates_during_a_reload_are_not_rolled_back(scores):
+    loading, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load():
+        loads.append(dict(scores))
+        if len(loads) > 1:
+            # The refresh has read the database; points change before it swaps the result in
+            loading.set()
+            release.wait(5)
+        return loads[-1]
+
+    leaderboard = LeaderboardService(InMemoryLeaderboardStore(), load=load, refresh_seconds=0)
+    assert leaderboard.rank('eve') == 5
+
+    refresh = threading.Thread(target=leaderboard._refresh_safely)
+    refresh.start()
+    assert loading.wait(5)
+    leaderboard.set_points('eve', 99)
+    leaderboard.set_many_points({'dee': 45})
+    leaderboard.remove('ada')
+    release.set()
+    refresh.join(5)
+
+    assert ranking(leaderboard.top(10)) == [('eve', 99, 1), ('dee', 45, 2), ('bob', 40, 3), ('cy', 40, 3)]
+
+    # Writes are only replayed onto the reload they raced with; the next one takes the database as is
+    leaderboard._refresh_safely()
+    assert leaderboard.top(10) == LeaderboardService(InMemoryLeaderboardStore(), load=lambda: scores).top(10)
@@ -0,0 +1,159 @@
+"""LinkedIn OAuth against the local fake server (benchmarks/fake_linkedin.py)"""
+import os
+import sys
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from linkedin import LinkedInClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from fake_linkedin import hits, start_server
+
+REDIRECT_URI = 'http://localhost/auth/linkedin/callback'
+
+
+def make_client(server, **options):
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    return LinkedInClient('client-id', 'client-secret', REDIRECT_URI, oauth_url=f'{base}/oauth/v2', api_url=base,
+                          **options)
+
+
+@pytest.fixture
+def fake_linkedin(request):
+    """A fake server; ``@pytest.mark.linkedin(latency_ms=..., faults=...)`` configures it"""
+    marker = request.node.get_closest_marker('linkedin')
+    server = start_server(**(marker.kwargs if marker else {}))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def linkedin_app(app, fake_linkedin, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'linkedin_client', make_client(fake_linkedin))
+    return app
+
+
+def authorize(client):
+    """Run /auth/linkedin -> fake authorization; returns the callback path and query"""
+    response = client.get('/auth/linkedin')
+    assert response.status_code == 302
+    consent = requests.get(response.headers['Location'], allow_redirects=False, timeout=5)
+    callback = urlparse(consent.headers['Location'])
+    return f'{callback.path}?{callback.query}'
+
+
+def log_in(client):
+    """The whole login; returns the /auth/linkedin/callback response"""
+    return client.get(authorize(client))
+
+
+def test_callback_signs_in_a_new_member(linkedin_app, client, fake_linkedin, backend):
+    response = log_in(client)
+
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/dashboard'
+    profile = client.get('/api/user').get_json()
+    member = profile['linkedin_id'].removeprefix('fake-')
+    assert profile['email'] == f'member{member}@example.com'
+    assert profile['profile_picture_url'] == f'https://example.com/pictures/{member}.jpg'
+    assert hits(fake_linkedin) == {'token': 1, 'profile': 1, 'email': 1}
+
+
+def test_callback_refuses_an_email_linked_to_another_member(linkedin_app, client, make_user):
+    callback = authorize(client)
+    member = parse_qs(urlparse(callback).query)['code'][0].removeprefix('code-')
+    make_user(f'member{member}@example.com', 'Other', linkedin_id='someone-else', login_method='linkedin')
+
+    response = client.get(callback)
+
+    assert response.status_code == 409
+    assert 'already linked to another LinkedIn account' in response.get_json()['error']
+    assert client.get('/api/user').status_code == 401
+
+
+def test_callback_rejects_a_mismatched_state(linkedin_app, client):
+    client.get('/auth/linkedin')
+    response = client.get('/auth/linkedin/callback?code=code-1&state=forged')
+    assert response.status_code == 400
+    assert client.get('/api/user').status_code == 401
+
+
+@pytest.mark.linkedin(faults={'token': [400]})
+def test_token_failure_is_reported_and_not_retried(linkedin_app, client, fake_linkedin):
+    response = log_in(client)
+
+    assert response.status_code == 500
+    assert 'LinkedIn API error' in response.get_json()['error']
+    assert hits(fake_linkedin)['token'] == 1
+    assert hits(fake_linkedin)['profile'] == 0
+    assert client.get('/api/user').status_code == 401
+
+
+@pytest.mark.linkedin(faults={'email': [500, 500, 500]})
+def test_email_failure_after_retries_creates_no_user(linkedin_app, client, fake_linkedin, backend):
+    response = log_in(client)
+
+    assert response.status_code == 500
+    assert 'LinkedIn API error' in response.get_json()['error']
+    assert hits(fake_linkedin)['email'] == 3
+    assert backend.list_scores() == []
+    assert client.get('/api/user').status_code == 401
+
+
+@pytest.mark.linkedin(faults={'profile': [503], 'email': [502, 429]})
+def test_transient_api_errors_are_retried(fake_linkedin):
+    client = make_client(fake_linkedin)
+    token = client.exchange_code('code-7')
+
+    profile, email = client.fetch_member(token)
+
+    assert profile['id'] == 'fake-7'
+    assert email['elements'][0]['handle~']['emailAddress'] == 'member7@example.com'
+    assert hits(fake_linkedin) == {'token': 1, 'profile': 2, 'email': 3}
+
+
+@pytest.mark.linkedin(faults={'token': [503]})
+def test_token_exchange_is_not_retried_on_an_error_status(fake_linkedin):
+    with pytest.raises(requests.exceptions.HTTPError):
+        make_client(fake_linkedin).exchange_code('code-1')
+    assert hits(fake_linkedin)['token'] == 1
+
+
+@pytest.mark.linkedin(latency_ms=150)
+def test_profile_and_email_are_fetched_in_parallel(fake_linkedin):
+    client = make_client(fake_linkedin)
+    client.fetch_member('token-warmup')  # open the pooled connections
+
+    started = time.perf_counter()
+    profile, email = client.fetch_member('token-3')
+    elapsed = time.perf_counter() - started
+
+    assert profile['id'] == 'fake-3'
+    assert elapsed < 0.28  # one upstream latency, not two
+
+
+@pytest.mark.linkedin(latency_ms=300)
+def test_slow_responses_time_out(fake_linkedin):
+    client = make_client(fake_linkedin, read_timeout=0.05, retries=0)
+
+    started = time.perf_counter()
+    with pytest.raises(requests.exceptions.RequestException):
+        client.fetch_profile('token-1')
+    assert time.perf_counter() - started < 0.25
+
+
+@pytest.mark.linkedin(latency_ms=300)
+def test_timed_out_reads_are_retried(fake_linkedin):
+    with pytest.raises(requests.exceptions.RequestException):
+        make_client(fake_linkedin, read_timeout=0.05, retries=2).fetch_profile('token-1')
+    deadline = time.monotonic() + 2
+    while hits(fake_linkedin)['profile'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert hits(fake_linkedin)['profile'] == 3
@@ -0,0 +1,104 @@
+"""Single-statement LinkedIn login (upsert_linkedin_user) on the SQLite backend"""
+import threading
+
+import pytest
+
+from storage import EmailConflict
+
+
+def linkedin_login(linkedin_id, email, first_name='Ada', surname='Lovelace', picture='https://img/1', points=2690):
+    return {'linkedin_id': linkedin_id, 'email': email, 'firstName': first_name, 'surname': surname,
+            'profile_picture_url': picture, 'points': points, 'rank': 4}
+
+
+def test_first_login_creates_a_linkedin_user(db_manager):
+    user = db_manager.upsert_linkedin_user(linkedin_login('li-1', 'ada@example.com'))
+
+    assert (user['linkedin_id'], user['email'], user['points'], user['login_method']) == \
+        ('li-1', 'ada@example.com', 2690, 'linkedin')
+    assert db_manager.leaderboard.rank(user['id']) == 1
+
+
+def test_returning_login_refreshes_profile_and_keeps_points(db_manager, backend):
+    created = db_manager.upsert_linkedin_user(linkedin_login('li-1', 'ada@example.com'))
+    backend.update_user(created['id'], {'points': 3000})
+
+    again = db_manager.upsert_linkedin_user(
+        linkedin_login('li-1', 'changed@example.com', first_name='Augusta', surname='', picture='', points=0)
+    )
+
+    assert again['id'] == created['id']
+    assert (again['first_name'], again['surname'], again['profile_picture_url']) == \
+        ('Augusta', 'Lovelace', 'https://img/1')
+    assert (again['points'], again['email']) == (3000, 'ada@example.com')
+
+
+def test_login_attaches_linkedin_id_to_a_user_registered_by_email(db_manager, make_user):
+    registered = make_user('ada@example.com', 'Ada', points=15)
+
+    user = db_manager.upsert_linkedin_user(linkedin_login('li-1', 'ada@example.com', first_name='Ada L.'))
+
+    assert user['id'] == registered['id']
+    assert (user['linkedin_id'], user['first_name'], user['points']) == ('li-1', 'Ada L.', 15)
+    assert db_manager.get_user_by_linkedin_id('li-1')['id'] == registered['id']
+
+
+def test_linked_user_wins_over_an_email_match(db_manager, make_user):
+    linked = make_user('ada@example.com', 'Ada', linkedin_id='li-1')
+    other = make_user('work@example.com', 'Work')
+
+    user = db_manager.upsert_linkedin_user(linkedin_login('li-1', 'work@example.com'))
+
+    assert user['id'] == linked['id']
+    assert db_manager.get_user_by_id(other['id'])['linkedin_id'] is None
+
+
+def test_email_owned_by_another_linkedin_account_is_a_conflict(db_manager, make_user):
+    owner = make_user('ada@example.com', 'Ada', linkedin_id='li-1')
+
+    with pytest.raises(EmailConflict, match='already linked to another LinkedIn account') as conflict:
+        db_manager.upsert_linkedin_user(linkedin_login('li-2', 'ada@example.com'))
+
+    assert conflict.value.email == 'ada@example.com'
+    assert db_manager.get_user_by_id(owner['id'])['linkedin_id'] == 'li-1'
+    assert db_manager.get_user_by_linkedin_id('li-2') is None
+
+
+@pytest.mark.parametrize('email', ['', '  ', None])
+def test_new_member_without_an_email_is_a_conflict(db_manager, backend, make_user, email):
+    make_user('', 'Blank')  # an empty email must not be matched or clash
+
+    with pytest.raises(EmailConflict, match='did not share an email'):
+        db_manager.upsert_linkedin_user(linkedin_login('li-1', email))
+
+    assert db_manager.get_user_by_linkedin_id('li-1') is None
+
+
+def test_returning_member_without_an_email_still_signs_in(db_manager):
+    created = db_manager.upsert_linkedin_user(linkedin_login('li-1', 'ada@example.com'))
+
+    again = db_manager.upsert_linkedin_user(linkedin_login('li-1', '', first_name='Augusta'))
+
+    assert again['id'] == created['id']
+    assert (again['email'], again['first_name']) == ('ada@example.com', 'Augusta')
+
+
+@pytest.mark.parametrize('registered_first', [False, True])
+def test_concurrent_logins_of_one_member_leave_one_user(db_manager, backend, make_user, registered_first):
+    if registered_first:
+        make_user('ada@example.com', 'Ada')
+    results, start = [], threading.Barrier(8)
+
+    def login():
+        start.wait()
+        results.append(db_manager.upsert_linkedin_user(linkedin_login('li-1', 'ada@example.com')))
+
+    threads = [threading.Thread(target=login) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert None not in results
+    assert len({user['id'] for user in results}) == 1
+    assert len(backend.find_emails(['ada@example.com'])) == 1
@@ -0,0 +1,147 @@
+"""Matching: incremental neighbour-list maintenance agrees with a full rebuild"""
+from datetime import date
+
+import numpy as np
+import pytest
+
+from matching import AGE_SHARE, FeatureSpace, MatchingIndex, MatchingService
+from quiz import Quiz
+
+QUIZ = Quiz({
+    'id': 'pairs',
+    'outcomes': ['North', 'South', 'East'],
+    'questions': [
+        {'question': f'Q{q}', 'options': [{'text': str(o), 'outcome': ['North', 'South', 'East'][(q + o) % 3]}
+                                          for o in range(3)]}
+        for q in range(4)
+    ]
+})
+
+
+def assert_same_matches(incremental, rebuilt, vectors, k):
+    """Same scores in the same order, and every listed user really has that score
+
+    Users tied at the cut-off may be picked differently, so ids are checked
+    against the current vectors rather than compared as lists.
+    """
+    for user_id in vectors:
+        got, expected = incremental.similar(user_id, k), rebuilt.similar(user_id, k)
+        assert np.allclose([score for _, score in got], [score for _, score in expected], atol=1e-5), user_id
+        for other, score in got:
+            assert float(np.dot(vectors[user_id], vectors[other])) == pytest.approx(score, abs=1e-5), (user_id, other)
+
+
+def rebuild(vectors, dimensions, k):
+    index = MatchingIndex(dimensions, neighbours=k)
+    index.replace(dict(vectors))
+    return index
+
+
+def random_vector(rng, dimensions):
+    vector = np.where(rng.random(dimensions) < 0.3, rng.random(dimensions), 0).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def test_incremental_updates_match_a_full_rebuild():
+    rng = np.random.default_rng(11)
+    dimensions, k = 12, 5
+    vectors = {f'u{i}': random_vector(rng, dimensions) for i in range(40)}
+    index = rebuild(vectors, dimensions, k)
+    index.similar_many(list(vectors), k)  # cache every list so updates go through the incremental path
+    next_id = 40
+
+    for step in range(60):
+        action = step % 3
+        if action == 0:  # add users
+            added = {f'u{next_id + i}': random_vector(rng, dimensions) for i in range(2)}
+            next_id += 2
+            vectors.update(added)
+            index.set_many(added)
+        elif action == 1:  # update existing users
+            changed = {user_id: random_vector(rng, dimensions) for user_id in rng.choice(list(vectors), 3, replace=False)}
+            vectors.update(changed)
+            index.set_many(changed)
+        else:  # remove a user
+            user_id = str(rng.choice(list(vectors)))
+            del vectors[user_id]
+            index.remove(user_id)
+
+        assert_same_matches(index, rebuild(vectors, dimensions, k), vectors, k)
+
+    assert index.stats()['invalidations'] > 0
+    assert index.stats()['hits'] > 0
+
+
+def test_removed_users_leave_every_list():
+    rng = np.random.default_rng(3)
+    vectors = {f'u{i}': random_vector(rng, 8) for i in range(10)}
+    index = rebuild(vectors, 8, 3)
+    index.similar_many(list(vectors), 3)
+
+    index.remove('u0')
+
+    assert index.similar('u0', 3) == []
+    assert all('u0' not in dict(index.similar(user_id, 3)) for user_id in vectors if user_id != 'u0')
+    assert len(index) == 9
+
+
+def test_service_updates_match_a_service_reloaded_from_the_same_rows():
+    features = FeatureSpace({QUIZ.id: QUIZ})
+    rng = np.random.default_rng(5)
+    profiles = {f'u{i}': {'id': f'u{i}', 'birthday': f'{1960 + (i * 7) % 45}-06-01'} for i in range(30)}
+    results = {}
+
+    def answers():
+        return [int(answer) for answer in rng.integers(-1, 3, size=len(QUIZ.questions))]
+
+    def outcome(row):
+        return QUIZ.outcomes[int(QUIZ.score(np.array([row]))[0][0])]
+
+    for user_id in list(profiles)[:20]:
+        row = answers()
+        results[user_id] = {'user_id': user_id, 'quiz_id': QUIZ.id, 'answers': row, 'outcome': outcome(row)}
+
+    def load():
+        return list(profiles.values()), list(results.values())
+
+    service = MatchingService(features, load=load, refresh_seconds=0)
+    service.index.neighbours = 6
+    service.matches('u0', 6)  # first load
+    service.index.similar_many(list(profiles), 6)
+
+    # New results, including first results for users who only had a profile
+    batch = []
+    for user_id in ('u3', 'u21', 'u22', 'u7'):
+        row = answers()
+        results[user_id] = {'user_id': user_id, 'quiz_id': QUIZ.id, 'answers': row, 'outcome': outcome(row)}
+        batch.append({'user_id': user_id, 'answers': row, 'outcome': outcome(row)})
+    service.record_results(QUIZ.id, batch)
+
+    # Profile changes and a brand-new user
+    profiles['u4']['birthday'] = '2001-01-01'
+    profiles['u30'] = {'id': 'u30', 'birthday': '1990-03-03'}
+    service.update_profiles([profiles['u4'], profiles['u30']])
+
+    service.remove('u9')
+    del profiles['u9']
+    results.pop('u9', None)
+
+    reloaded = MatchingService(features, load=load, refresh_seconds=0)
+    reloaded.index.neighbours = 6
+    reloaded.matches('u0', 6)  # first load
+    vectors = {user_id: reloaded._vector(user_id) for user_id in profiles}
+    assert_same_matches(service.index, reloaded.index, vectors, 6)
+
+
+def test_vectors_weight_quiz_and_age_shares():
+    features = FeatureSpace({QUIZ.id: QUIZ})
+    result = {'quiz_id': QUIZ.id, 'answers': [0, 1, 2, 0], 'outcome': 'North'}
+    born = date(1990, 5, 5).isoformat()
+
+    same = features.vector({'birthday': born}, [result])
+    assert float(np.dot(same, same)) == pytest.approx(1.0, abs=1e-6)
+
+    age_only = features.vector({'birthday': born}, [])
+    assert float(np.dot(same, age_only)) == pytest.approx(AGE_SHARE, abs=1e-6)
+    assert not features.vector(None, []).any()
@@ -0,0 +1,66 @@
+"""Keyset pagination of /api/chat/messages on the SQLite backend"""
+from database import encode_message_cursor
+
+
+def send_messages(db_manager, sender, recipient, count):
+    return [
+        db_manager.send_message({'sender_id': sender['id'], 'recipient_id': recipient['id'], 'content': f'm{i}'})
+        for i in range(count)
+    ]
+
+
+def test_before_cursor_pages_back_through_the_conversation(client, db_manager, make_user, sign_in_as):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    sent = send_messages(db_manager, alice, bob, 7) + send_messages(db_manager, bob, alice, 2)
+    sign_in_as(alice)
+
+    seen, cursor = [], None
+    while True:
+        query = f'/api/chat/messages?recipient_id={bob["id"]}&limit=3' + (f'&before={cursor}' if cursor else '')
+        response = client.get(query)
+        assert response.status_code == 200
+        page = response.get_json()
+        if not page:
+            break
+        assert len(page) <= 3
+        seen.extend(message['id'] for message in page)
+        cursor = response.headers['X-Before-Cursor']
+
+    newest_first = sorted(sent, key=lambda message: (message['created_at'], message['id']), reverse=True)
+    assert seen == [message['id'] for message in newest_first]
+
+
+def test_after_cursor_returns_only_newer_messages(client, db_manager, make_user, sign_in_as):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    first = send_messages(db_manager, alice, bob, 3)
+    sign_in_as(alice)
+    cursor = client.get(f'/api/chat/messages?recipient_id={bob["id"]}').headers['X-After-Cursor']
+    assert cursor == encode_message_cursor(first[-1])
+
+    later = send_messages(db_manager, bob, alice, 2)
+    response = client.get(f'/api/chat/messages?recipient_id={bob["id"]}&after={cursor}')
+    assert [message['id'] for message in response.get_json()] == [message['id'] for message in reversed(later)]
+
+
+def test_group_messages_page_without_gaps(client, db_manager, make_user, sign_in_as):
+    alice = make_user('alice@example.com', 'Alice')
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']})
+    sent = [db_manager.send_message({'sender_id': alice['id'], 'group_id': group['id'], 'content': f'g{i}'})
+            for i in range(5)]
+    sign_in_as(alice)
+
+    first = client.get(f'/api/chat/messages?group_id={group["id"]}&limit=2')
+    second = client.get(f'/api/chat/messages?group_id={group["id"]}&limit=10'
+                        f'&before={first.headers["X-Before-Cursor"]}')
+    ids = [message['id'] for message in first.get_json() + second.get_json()]
+    assert sorted(ids) == sorted(message['id'] for message in sent)
+    assert len(set(ids)) == len(sent)
+
+
+def test_malformed_or_conflicting_cursors_are_rejected(client, make_user, sign_in_as):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    sign_in_as(alice)
+
+    assert client.get(f'/api/chat/messages?recipient_id={bob["id"]}&before=not-a-cursor').status_code == 400
+    cursor = encode_message_cursor({'created_at': '2024-01-01T00:00:00+00:00', 'id': 'x'})
+    assert client.get(f'/api/chat/messages?recipient_id={bob["id"]}&before={cursor}&after={cursor}').status_code == 400
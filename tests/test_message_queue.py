@@ -0,0 +1,107 @@
+"""Message write-behind: the 202 path, batched flushes and dropped rows"""
+import pytest
+
+import metrics
+from database import DatabaseManager
+from pubsub import InMemoryPubSub, user_channel
+from storage import conversation_key
+from write_queue import WriteBehindQueue
+
+
+@pytest.fixture
+def queued_db(backend, monkeypatch):
+    """A DatabaseManager with MESSAGE_WRITE_BEHIND on, installed as the app's manager"""
+    import database
+
+    monkeypatch.setenv('MESSAGE_WRITE_BEHIND', '1')
+    monkeypatch.setenv('MESSAGE_BATCH_INTERVAL_MS', '60000')  # batches are written by flush_messages()
+    manager = DatabaseManager(backend=backend, pubsub=InMemoryPubSub())
+    manager.message_queue.retry_backoff = 0
+    monkeypatch.setattr(database, 'db_manager', manager)
+    monkeypatch.setattr(database, 'async_db_manager', None)
+    yield manager
+    manager.message_queue.close()
+
+
+def test_queue_flushes_in_batches_and_drains_everything():
+    written = []
+    queue = WriteBehindQueue(written.append, batch_size=3, flush_interval=60)
+    for i in range(7):
+        queue.enqueue({'id': str(i)})
+
+    queue.drain()
+
+    assert [row['id'] for batch in written for row in batch] == [str(i) for i in range(7)]
+    assert max(len(batch) for batch in written) <= 3
+    assert queue.stats()['written'] == 7
+    assert queue.depth() == 0
+    queue.close()
+
+
+def test_failing_row_is_dropped_and_the_rest_are_written():
+    written, dropped = [], []
+
+    def flush(rows):
+        if any(row['id'] == 'bad' for row in rows):
+            raise ValueError('constraint violated')
+        written.extend(rows)
+
+    queue = WriteBehindQueue(flush, flush_interval=60, max_retries=2, retry_backoff=0,
+                             on_drop=lambda row, error: dropped.append((row['id'], str(error))))
+    for message_id in ('a', 'bad', 'b'):
+        queue.enqueue({'id': message_id})
+
+    queue.drain()
+
+    assert [row['id'] for row in written] == ['a', 'b']
+    assert dropped == [('bad', 'constraint violated')]
+    assert queue.stats()['failed'] == 1
+    assert queue.stats()['retries'] == 2
+    queue.close()
+
+
+def test_queued_message_has_the_read_shape(client, queued_db, backend, make_user, sign_in_as):
+    alice = make_user('alice@example.com', 'Alice', surname='Smith', profile_picture_url='https://img/alice')
+    bob = make_user('bob@example.com', 'Bob')
+    sign_in_as(alice)
+    subscription = queued_db.pubsub.subscribe([user_channel(bob['id'])])
+
+    response = client.post('/api/chat/messages', json={'recipient_id': bob['id'], 'content': 'hello'})
+    assert response.status_code == 202
+    queued = response.get_json()
+    assert backend.list_messages(conversation=conversation_key(alice['id'], bob['id'])) == []
+
+    queued_db.flush_messages()
+
+    stored = backend.list_messages(conversation=conversation_key(alice['id'], bob['id']))
+    assert [message['id'] for message in stored] == [queued['id']]
+    assert queued['users'] == stored[0]['users'] == {
+        'id': alice['id'], 'first_name': 'Alice', 'surname': 'Smith', 'profile_picture_url': 'https://img/alice'
+    }
+    published = subscription.get(timeout=1)
+    assert published['event'] == 'message'
+    assert published['data']['users'] == stored[0]['users']
+    subscription.close()
+
+
+def test_dropped_message_is_logged_and_counted(queued_db, backend, make_user, monkeypatch, caplog):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    insert_messages = backend.insert_messages
+
+    def reject_poison(rows):
+        if any(row['content'] == 'poison' for row in rows):
+            raise ValueError('value too long')
+        insert_messages(rows)
+
+    monkeypatch.setattr(backend, 'insert_messages', reject_poison)
+    dropped_before = sum(metrics.MESSAGES_DROPPED._values.values())
+    messages = [queued_db.enqueue_message({'sender_id': alice['id'], 'recipient_id': bob['id'], 'content': content})
+                for content in ('one', 'poison', 'two')]
+
+    queued_db.flush_messages()
+
+    stored = backend.list_messages(conversation=conversation_key(alice['id'], bob['id']))
+    assert sorted(message['content'] for message in stored) == ['one', 'two']
+    assert sum(metrics.MESSAGES_DROPPED._values.values()) == dropped_before + 1
+    record = next(record for record in caplog.records if getattr(record, 'event', None) == 'message_dropped')
+    assert messages[1]['id'] in record.getMessage()
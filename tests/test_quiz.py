@@ -0,0 +1,139 @@
+"""Vectorized quiz scoring and batched result selection"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from quiz import UNANSWERED, Quiz, QuizEngine, load_quizzes
+
+FIXTURE = {
+    'id': 'fixture',
+    'outcomes': ['Builder', 'Connector', 'Dreamer'],
+    'questions': [
+        {'question': 'Q1', 'options': [
+            {'text': 'a', 'outcome': 'Builder', 'points': 10},
+            {'text': 'b', 'outcome': 'Connector', 'points': 5},
+            {'text': 'c', 'outcome': 'Dreamer', 'weight': 2}
+        ]},
+        {'question': 'Q2', 'options': [
+            {'text': 'a', 'outcome': 'Connector', 'points': 3},
+            {'text': 'b', 'points': 1}
+        ]},
+        {'question': 'Q3', 'options': [
+            {'text': 'a', 'outcome': 'Dreamer', 'points': 7},
+            {'text': 'b', 'outcome': 'Builder', 'weight': 3, 'points': 2},
+            {'text': 'c', 'outcome': 'Connector'},
+            {'text': 'd', 'outcome': 'Builder', 'points': 4}
+        ]}
+    ]
+}
+
+# answers -> (outcome, per-outcome totals, points), worked out by hand
+EXPECTED = [
+    ([0, 0, 0], 'Builder', [1, 1, 1], 20),      # three-way tie goes to the first outcome
+    ([2, 1, 0], 'Dreamer', [0, 0, 3], 8),       # weight 2 option; Q2 'b' scores points only
+    ([1, 0, 2], 'Connector', [0, 3, 0], 8),
+    ([-1, -1, 1], 'Builder', [3, 0, 0], 2),     # unanswered questions score nothing
+    ([-1, -1, -1], 'Builder', [0, 0, 0], 0),
+    ([1, 1, 3], 'Builder', [1, 1, 0], 10),
+]
+
+
+def reference_score(definition, answers):
+    """Plain-Python scoring of one submission"""
+    totals = dict.fromkeys(definition['outcomes'], 0)
+    points = 0
+    for question, answer in zip(definition['questions'], answers):
+        if answer < 0:
+            continue
+        option = question['options'][answer]
+        if option.get('outcome'):
+            totals[option['outcome']] += option.get('weight', 1)
+        points += option.get('points', 0)
+    return max(totals, key=lambda outcome: totals[outcome]), list(totals.values()), points
+
+
+@pytest.fixture
+def quiz():
+    return Quiz(FIXTURE)
+
+
+def test_batch_score_matches_the_worked_examples(quiz):
+    outcomes, totals, points = quiz.score(np.array([answers for answers, *_ in EXPECTED]))
+
+    assert [quiz.outcomes[outcome] for outcome in outcomes] == [outcome for _, outcome, _, _ in EXPECTED]
+    assert totals.tolist() == [expected for _, _, expected, _ in EXPECTED]
+    assert points.tolist() == [expected for *_, expected in EXPECTED]
+
+
+def test_batch_score_matches_row_by_row_scoring_of_the_shipped_quizzes():
+    quizzes = load_quizzes(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'quizzes'))
+    assert quizzes
+    rng = np.random.default_rng(7)
+    for quiz in quizzes.values():
+        definition = {'outcomes': quiz.outcomes, 'questions': quiz.questions}
+        answers = np.stack([rng.integers(UNANSWERED, count, size=500) for count in quiz.option_counts], axis=1)
+
+        outcomes, totals, points = quiz.score(answers)
+
+        for row, outcome, total, earned in zip(answers.tolist(), outcomes, totals.tolist(), points.tolist()):
+            assert (quiz.outcomes[outcome], total, earned) == reference_score(definition, row)
+
+
+def test_parse_answers_validates_each_question(quiz):
+    assert quiz.parse_answers([2, None, 3]) == [2, UNANSWERED, 3]
+    for answers in ([0, 0], [0, 2, 0], [0, 0, -1], [True, 0, 0], ['1', 0, 0], 'abc'):
+        with pytest.raises(ValueError):
+            quiz.parse_answers(answers)
+
+
+def test_public_questions_hide_the_scoring_key(quiz):
+    options = [option for question in quiz.public()['questions'] for option in question['options']]
+    assert options and all(set(option) == {'icon', 'text'} for option in options)
+
+
+def test_engine_scores_a_batch_together_and_awards_points_once():
+    completed = {'dan'}
+    batches = []
+    lock = threading.Lock()
+
+    def record(quiz_id, results):
+        with lock:
+            batches.append(results)
+        return [{'id': result['user_id'], 'points': 100 + result['points']}
+                for result in results if result['user_id'] not in completed]
+
+    engine = QuizEngine({'fixture': Quiz(FIXTURE)}, record, batch_size=4, flush_interval=5)
+    submissions = {'amy': [0, 0, 0], 'ben': [2, 1, 0], 'cat': [1, 0, 2], 'dan': [-1, -1, 1]}
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = dict(zip(submissions, pool.map(
+            lambda user: engine.submit(user, 'fixture', [None if a < 0 else a for a in submissions[user]]),
+            submissions
+        )))
+    engine.queue.close()
+
+    assert len(batches) == 1
+    assert {result['user_id']: (result['outcome'], result['points']) for result in batches[0]} == {
+        'amy': ('Builder', 20), 'ben': ('Dreamer', 8), 'cat': ('Connector', 8), 'dan': ('Builder', 2)
+    }
+    assert responses['ben'] == {
+        'quiz_id': 'fixture',
+        'outcome': 'Dreamer',
+        'scores': {'Builder': 0, 'Connector': 0, 'Dreamer': 3},
+        'points_awarded': 8,
+        'total_points': 108,
+        'already_completed': False
+    }
+    assert responses['dan']['points_awarded'] == 0
+    assert responses['dan']['already_completed'] is True
+    assert responses['dan']['total_points'] is None
+
+
+def test_engine_rejects_unknown_quizzes_and_bad_answers():
+    engine = QuizEngine({'fixture': Quiz(FIXTURE)}, lambda quiz_id, results: [])
+    with pytest.raises(ValueError):
+        engine.submit('amy', 'missing', [0, 0, 0])
+    with pytest.raises(ValueError):
+        engine.submit('amy', 'fixture', [0, 5, 0])
@@ -0,0 +1,89 @@
+"""Unread counters kept by the messages trigger, and mark_read cursors"""
+from database import encode_message_cursor
+from storage import conversation_key
+
+
+def unread(db_manager, user):
+    return {(counter['chat_type'], counter['chat_id']): counter['unread_count']
+            for counter in db_manager.get_unread(user['id'])}
+
+
+def send(db_manager, sender, content='hi', **target):
+    return db_manager.send_message({'sender_id': sender['id'], 'content': content, **target})
+
+
+def test_private_messages_count_for_the_recipient_only(db_manager, make_user):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    for _ in range(3):
+        send(db_manager, alice, recipient_id=bob['id'])
+
+    assert unread(db_manager, bob) == {('user', alice['id']): 3}
+    assert unread(db_manager, alice) == {}
+
+
+def test_group_messages_count_for_every_member_but_the_sender(db_manager, make_user):
+    alice, bob, carol = (make_user(f'{name}@example.com', name.title()) for name in ('alice', 'bob', 'carol'))
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']},
+                                               member_ids=[bob['id'], carol['id']])
+    send(db_manager, alice, group_id=group['id'])
+    send(db_manager, bob, group_id=group['id'])
+
+    assert unread(db_manager, alice) == {('group', group['id']): 1}
+    assert unread(db_manager, bob) == {('group', group['id']): 1}
+    assert unread(db_manager, carol) == {('group', group['id']): 2}
+
+
+def test_mark_read_with_a_cursor_leaves_later_messages_unread(db_manager, make_user):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    sent = [send(db_manager, alice, f'm{i}', recipient_id=bob['id']) for i in range(5)]
+
+    cursor = (sent[2]['created_at'], sent[2]['id'])
+    assert db_manager.mark_read(bob['id'], 'user', alice['id'], cursor=cursor) == 2
+    assert unread(db_manager, bob) == {('user', alice['id']): 2}
+
+    assert db_manager.mark_read(bob['id'], 'user', alice['id']) == 0
+    assert unread(db_manager, bob) == {}
+
+
+def test_mark_read_never_moves_the_cursor_backwards(db_manager, make_user, backend):
+    alice, bob = make_user('alice@example.com', 'Alice'), make_user('bob@example.com', 'Bob')
+    sent = [send(db_manager, alice, f'm{i}', recipient_id=bob['id']) for i in range(4)]
+
+    assert db_manager.mark_read(bob['id'], 'user', alice['id'], cursor=(sent[2]['created_at'], sent[2]['id'])) == 1
+    assert db_manager.mark_read(bob['id'], 'user', alice['id'], cursor=(sent[0]['created_at'], sent[0]['id'])) == 1
+
+    counter = backend.list_unread(bob['id'])[0]
+    assert (counter['last_read_at'], counter['last_read_message_id']) == (sent[2]['created_at'], sent[2]['id'])
+    read = {message['id']: message['is_read']
+            for message in backend.list_messages(conversation=conversation_key(alice['id'], bob['id']), limit=10)}
+    assert [bool(read[message['id']]) for message in sent] == [True, True, True, False]
+
+
+def test_unread_endpoint_totals_private_and_group_chats(client, db_manager, make_user, sign_in_as):
+    alice, bob, carol = (make_user(f'{name}@example.com', name.title()) for name in ('alice', 'bob', 'carol'))
+    group = db_manager.create_group_with_owner({'name': 'Hall A', 'created_by': alice['id']}, member_ids=[bob['id']])
+    for _ in range(2):
+        send(db_manager, alice, recipient_id=bob['id'])
+    send(db_manager, carol, recipient_id=bob['id'])
+    latest = [send(db_manager, alice, group_id=group['id']) for _ in range(3)]
+    sign_in_as(bob)
+
+    assert client.get('/api/chat/unread').get_json() == {
+        'users': {alice['id']: 2, carol['id']: 1},
+        'groups': {group['id']: 3},
+        'total': 6
+    }
+
+    response = client.post('/api/chat/read', json={'group_id': group['id'], 'cursor': encode_message_cursor(latest[0])})
+    assert response.get_json() == {'success': True, 'unread_count': 2}
+    assert client.post('/api/chat/read', json={'recipient_id': carol['id']}).get_json()['unread_count'] == 0
+
+    assert client.get('/api/chat/unread').get_json() == {
+        'users': {alice['id']: 2},
+        'groups': {group['id']: 2},
+        'total': 4
+    }
+
+
+def test_unread_endpoint_requires_a_session(client):
+    assert client.get('/api/chat/unread').status_code == 401
@@ -0,0 +1,37 @@
+"""Cached user lookups are invalidated under both the old and the new keys"""
+
+
+def test_changing_email_drops_the_old_email_lookup(db_manager, make_user):
+    user = make_user('old@example.com', 'Ada')
+    assert db_manager.get_user_by_email('old@example.com')['id'] == user['id']
+    assert db_manager.get_user_by_id(user['id'])['email'] == 'old@example.com'
+
+    db_manager.update_user(user['id'], {'email': 'new@example.com'})
+
+    assert db_manager.get_user_by_email('old@example.com') is None
+    assert db_manager.get_user_by_email('new@example.com')['id'] == user['id']
+    assert db_manager.get_user_by_id(user['id'])['email'] == 'new@example.com'
+
+
+def test_changing_linkedin_id_drops_the_old_linkedin_lookup(db_manager, make_user):
+    user = make_user('ada@example.com', 'Ada', linkedin_id='li-old', login_method='linkedin')
+    assert db_manager.get_user_by_linkedin_id('li-old')['id'] == user['id']
+
+    db_manager.update_user(user['id'], {'linkedin_id': 'li-new'})
+
+    assert db_manager.get_user_by_linkedin_id('li-old') is None
+    assert db_manager.get_user_by_linkedin_id('li-new')['id'] == user['id']
+    assert db_manager.get_user_by_email('ada@example.com')['linkedin_id'] == 'li-new'
+
+
+def test_other_updates_refresh_every_cached_lookup(db_manager, make_user):
+    user = make_user('ada@example.com', 'Ada', linkedin_id='li-1', login_method='linkedin')
+    for lookup in (db_manager.get_user_by_id(user['id']), db_manager.get_user_by_email('ada@example.com'),
+                   db_manager.get_user_by_linkedin_id('li-1')):
+        assert lookup['first_name'] == 'Ada'
+
+    db_manager.update_user(user['id'], {'first_name': 'Augusta'})
+
+    for lookup in (db_manager.get_user_by_id(user['id']), db_manager.get_user_by_email('ada@example.com'),
+                   db_manager.get_user_by_linkedin_id('li-1')):
+        assert lookup['first_name'] == 'Augusta'
@@ -0,0 +1,134 @@
+"""Keyset pagination of the /api/chat/users directory on the SQLite backend"""
+import time
+
+import pytest
+
+from database import decode_user_cursor, encode_user_cursor
+
+FIRST_NAMES = [None, 'Cy', '', None, 'Amy', 'Bob', 'amy', None, 'Dee']
+
+
+@pytest.fixture
+def people(make_user):
+    return [make_user(f'user{i}@example.com', name, is_online=i % 3 == 0) for i, name in enumerate(FIRST_NAMES)]
+
+
+def page_through(client, limit, online_first=False):
+    seen, cursor = [], None
+    for _ in range(50):
+        query = f'/api/chat/users?limit={limit}' + ('&online_first=1' if online_first else '')
+        response = client.get(query + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        seen.extend(user['id'] for user in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return seen
+    raise AssertionError("Directory paging did not terminate")
+
+
+@pytest.mark.parametrize('limit', [1, 2, 4])
+def test_directory_pages_every_user_once_including_missing_first_names(client, make_user, sign_in_as, people, limit):
+    sign_in_as(make_user('me@example.com', 'Me'))
+
+    seen = page_through(client, limit)
+    assert sorted(seen) == sorted(user['id'] for user in people)
+    assert len(seen) == len(set(seen))
+
+
+def test_directory_sorts_missing_first_names_as_empty(backend, people):
+    rows = backend.list_users(limit=len(people))
+    names = [row['first_name'] or '' for row in rows]
+    assert names == sorted(names)
+    assert names[:4] == ['', '', '', '']
+
+
+def test_online_first_cursor_pages_every_user_once(backend, people):
+    seen, after = [], None
+    while True:
+        page = backend.list_users(limit=2, after=after, online_first=True)
+        if not page:
+            break
+        seen.extend(page)
+        after = decode_user_cursor(encode_user_cursor(page[-1], online_first=True), online_first=True)
+
+    assert sorted(user['id'] for user in seen) == sorted(user['id'] for user in people)
+    online = [bool(user['is_online']) for user in seen]
+    assert online == sorted(online, reverse=True)
+
+
+def test_null_first_name_encodes_as_empty_string(people):
+    nameless = next(user for user in people if user['first_name'] is None)
+    assert decode_user_cursor(encode_user_cursor(nameless)) == ('', nameless['id'])
+
+
+def test_online_first_pages_across_a_heartbeat_that_is_not_flushed(client, db_manager, make_user, sign_in_as):
+    people = [make_user(f'p{i}@example.com', name) for i, name in enumerate('ABCDEF')]
+    sign_in_as(make_user('me@example.com', 'Me'))
+    db_manager.presence.store.touch(people[1]['id'], time.time())  # B heartbeats; users.is_online is still 0
+
+    seen = page_through(client, 2, online_first=True)
+
+    assert seen == [user['id'] for user in people]
+    response = client.get('/api/chat/users?limit=6&online_first=1')
+    assert {user['first_name']: user['is_online'] for user in response.get_json()}['B'] is True
+
+
+def test_online_first_pages_across_an_expired_heartbeat(client, db_manager, backend, make_user, sign_in_as):
+    people = [make_user(f'p{i}@example.com', name, is_online=name in 'BE') for i, name in enumerate('ABCDEF')]
+    sign_in_as(make_user('me@example.com', 'Me', is_online=True))
+    # Every stored online flag is stale: nobody has a live heartbeat
+
+    seen = page_through(client, 2, online_first=True)
+
+    by_id = {user['id']: user['first_name'] for user in people}
+    assert [by_id[user_id] for user_id in seen] == ['B', 'E', 'A', 'C', 'D', 'F']
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_online_first_directory_pages_every_user_once(client, make_user, sign_in_as, people, limit):
+    sign_in_as(make_user('me@example.com', 'Me'))
+
+    seen = page_through(client, limit, online_first=True)
+
+    stored_online = {user['id'] for user in people if user['is_online']}
+    assert sorted(seen) == sorted(user['id'] for user in people)
+    assert set(seen[:len(stored_online)]) == stored_online
+
+
+@pytest.mark.parametrize('limit', [1, 2])
+def test_online_first_paging_with_live_presence_that_differs_from_the_database(client, db_manager, make_user,
+                                                                              sign_in_as, people, limit):
+    sign_in_as(make_user('me@example.com', 'Me'))
+    stale = next(user for user in people if user['is_online'])
+    fresh = [user for user in people if not user['is_online']][:2]
+    now = time.time()
+    for user in fresh:
+        db_manager.presence.store.touch(user['id'], now)
+
+    seen, shown_online, cursor = [], {}, None
+    while True:
+        response = client.get(f'/api/chat/users?limit={limit}&online_first=1' + (f'&cursor={cursor}' if cursor else ''))
+        for user in response.get_json():
+            seen.append(user['id'])
+            shown_online[user['id']] = user['is_online']
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+
+    assert sorted(seen) == sorted(user['id'] for user in people)
+    assert shown_online[stale['id']] is False
+    assert all(shown_online[user['id']] is True for user in fresh)
+
+
+def test_online_first_search_pages_only_matches(client, make_user, sign_in_as, people):
+    sign_in_as(make_user('me@example.com', 'Me'))
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/chat/users?q=am&limit=1&online_first=1' + (f'&cursor={cursor}' if cursor else ''))
+        seen.extend(user['first_name'] for user in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+
+    assert sorted(seen) == ['Amy', 'amy']
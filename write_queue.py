@@ -0,0 +1,197 @@
+"""
+Write-behind queue that coalesces single-row writes into batches
+
+Used by DatabaseManager.send_message when MESSAGE_WRITE_BEHIND is enabled:
+the request is acknowledged as soon as the row is queued, and a background
+thread inserts queued rows as one multi-row write every few milliseconds (or
+as soon as a full batch is waiting). Failed batches are retried with
+backoff, and the queue is drained at interpreter exit.
+
+Configure with environment variables:
+    MESSAGE_WRITE_BEHIND=1       enable the queue (default off: synchronous inserts)
+    MESSAGE_BATCH_SIZE           rows per insert (default 100)
+    MESSAGE_BATCH_INTERVAL_MS    how long a batch may wait to fill up (default 10)
+    MESSAGE_QUEUE_MAX            queued rows before callers fall back to a
+                                 synchronous insert (default 10000)
+"""
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised by enqueue when the queue is at capacity"""
+
+
+class WriteBehindQueue:
+    """Batches rows for ``flush(rows)``, which must write them all or raise
+
+    ``on_drop(row, error)`` is called for a row that still fails on its own
+    after the batch retries are exhausted.
+    """
+
+    def __init__(self, flush: Callable[[List[Dict[str, Any]]], None], batch_size: int = 100,
+                 flush_interval: float = 0.01, max_queue: int = 10000, max_retries: int = 5,
+                 retry_backoff: float = 0.05, name: str = 'message-writer',
+                 on_drop: Optional[Callable[[Dict[str, Any], Exception], None]] = None):
+        self.flush = flush
+        self.name = name
+        self.on_drop = on_drop
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._rows: deque = deque()
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.retries = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+
+    def enqueue(self, row: Dict[str, Any], prepare: Callable[[Dict[str, Any]], Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Queue a row and return it
+
+        ``prepare`` runs under the queue lock, so values it assigns (such as
+        timestamps) follow the same order the rows will be written in.
+        """
+        with self._condition:
+            if self._closed or len(self._rows) >= self.max_queue:
+                raise QueueFull()
+            if prepare:
+                row = prepare(row)
+            self._rows.append(row)
+            self.enqueued += 1
+            # Wake the writer for the first row (to start the batch window) and for a full batch
+            if len(self._rows) == 1 or len(self._rows) >= self.batch_size:
+                self._condition.notify()
+        self._ensure_worker()
+        return row
+
+    def depth(self) -> int:
+        """Rows queued or being written"""
+        with self._condition:
+            return len(self._rows) + self._in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self.depth(),
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'failed': self.failed,
+            'batches': self.batches,
+            'retries': self.retries,
+            'last_batch_size': self.last_batch_size,
+            'max_batch_size': self.max_batch_size,
+            'avg_batch_size': round(self.written / self.batches, 2) if self.batches else 0.0
+        }
+
+    def drain(self):
+        """Write everything queued so far (used at shutdown)"""
+        while True:
+            batch = self._take_batch(wait=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        """Stop accepting rows and flush the rest"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.drain()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._condition:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+                atexit.register(self.close)
+
+    def _take_batch(self, wait: bool = True) -> List[Dict[str, Any]]:
+        with self._condition:
+            if wait:
+                # Wait for the first row, then give the batch flush_interval to fill up
+                while not self._rows and not self._closed:
+                    self._condition.wait()
+                if len(self._rows) < self.batch_size and not self._closed:
+                    self._condition.wait(self.flush_interval)
+            batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+            self._in_flight += len(batch)
+            return batch
+
+    def _run(self):
+        while not self._closed:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.flush(batch)
+                    self.batches += 1
+                    self.written += len(batch)
+                    self.last_batch_size = len(batch)
+                    self.max_batch_size = max(self.max_batch_size, len(batch))
+                    return
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        logger.error(f"Batch write of {len(batch)} rows failed after {attempt + 1} attempts: {e}")
+                        self._write_rows(batch)
+                        return
+                    self.retries += 1
+                    logger.warning(f"Batch write of {len(batch)} rows failed, retrying: {e}")
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+        finally:
+            with self._condition:
+                self._in_flight -= len(batch)
+
+    def _write_rows(self, batch: List[Dict[str, Any]]):
+        """Last resort: write rows one at a time so one bad row can't sink the rest"""
+        for row in batch:
+            try:
+                self.flush([row])
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                if self.on_drop is None:
+                    logger.error(f"Dropping row {row.get('id')}: {e}")
+                    continue
+                try:
+                    self.on_drop(row, e)
+                except Exception as drop_error:
+                    logger.error(f"on_drop failed for row {row.get('id')}: {drop_error}")
+
+
+def create_message_queue(flush: Callable[[List[Dict[str, Any]]], None],
+                         on_drop: Optional[Callable[[Dict[str, Any], Exception], None]] = None
+                         ) -> Optional[WriteBehindQueue]:
+    """Build the message queue if MESSAGE_WRITE_BEHIND is enabled, else None"""
+    if os.environ.get('MESSAGE_WRITE_BEHIND', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    return WriteBehindQueue(
+        flush,
+        batch_size=int(os.environ.get('MESSAGE_BATCH_SIZE', 100)),
+        flush_interval=float(os.environ.get('MESSAGE_BATCH_INTERVAL_MS', 10)) / 1000,
+        max_queue=int(os.environ.get('MESSAGE_QUEUE_MAX', 10000)),
+        on_drop=on_drop
+    )